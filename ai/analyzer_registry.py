@@ -0,0 +1,138 @@
+# ai/analyzer_registry.py
+"""
+Config-driven analyzer registry
+
+Analyzers are declared as specs rather than hardcoded in EmailAnalyzer:
+
+    {
+        "name": "aamosh-distilbert",
+        "class": "email_guard.AamoshDistilbertAnalyzer",
+        "model_path": "aamoshdahal-email-phishing-distilbert-finetuned",
+        "enabled": true,
+        "cost_ms": 40
+    }
+    
+- class: "module.Class" (or "module:Class"), imported only if the spec is
+  enabled, so disabled analyzers never pull in torch, transformers or
+  phishing_detection_py
+- model_path: optional, passed to the constructor; relative paths are
+  resolved against email_guard.models_dir
+- enabled: optional, default true
+- cost_ms: optional expected latency per email, used as the deadline
+  estimate until real latencies have been measured
+- options: optional extra constructor keyword arguments
+
+ANALYZERS_CONFIG points at a JSON file with {"analyzers": [...]}; without it
+DEFAULT_ANALYZERS is used. EMAIL_GUARD_ANALYZERS (comma separated names)
+overrides which specs are enabled, e.g. EMAIL_GUARD_ANALYZERS=rule-based for
+a rules-only deployment.
+"""
+
+import importlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+# JSON file with analyzer specs (empty = DEFAULT_ANALYZERS)
+ANALYZERS_CONFIG = os.getenv("ANALYZERS_CONFIG", "")
+
+# Comma separated analyzer names to enable, overriding the specs' enabled flags
+EMAIL_GUARD_ANALYZERS = os.getenv("EMAIL_GUARD_ANALYZERS", "")
+
+# The analyzers EmailAnalyzer has always loaded, in result order
+DEFAULT_ANALYZERS = [
+    {'name': 'cybersectony-distilbert', 'class': 'email_guard.CybersectonyDistilbertAnalyzer', 'cost_ms': 60},
+    {'name': 'aamosh-distilbert', 'class': 'email_guard.AamoshDistilbertAnalyzer', 'cost_ms': 60},
+    {'name': 'phishing-detection-py', 'class': 'email_guard.PhishingDetectorAnalyzer', 'cost_ms': 20},
+    {'name': 'rule-based', 'class': 'email_guard.RuleBasedAnalyzer', 'cost_ms': 1},
+]
+
+_SPEC_KEYS = {'name', 'class', 'model_path', 'enabled', 'cost_ms', 'options'}
+
+def load_analyzer_specs(path: Optional[str] = None, enabled_names: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Read and validate analyzer specs
+    
+    Args:
+        path: JSON config file (defaults to ANALYZERS_CONFIG, then DEFAULT_ANALYZERS)
+        enabled_names: Comma separated names to enable instead of the specs'
+            enabled flags (defaults to EMAIL_GUARD_ANALYZERS)
+            
+    Returns:
+        Enabled specs, in config order
+        
+    Raises:
+        ValueError: If the config is malformed or names an unknown analyzer
+    """
+    path = ANALYZERS_CONFIG if path is None else path
+    if path:
+        with open(path, 'r') as f:
+            config = json.load(f)
+        specs = config.get('analyzers') if isinstance(config, dict) else None
+        if not isinstance(specs, list):
+            raise ValueError(f"{path} must contain an 'analyzers' list")
+    else:
+        specs = DEFAULT_ANALYZERS
+    
+    names = set()
+    for spec in specs:
+        if not isinstance(spec, dict) or not spec.get('name') or not spec.get('class'):
+            raise ValueError(f"analyzer spec needs a name and a class: {spec!r}")
+        unknown = set(spec) - _SPEC_KEYS
+        if unknown:
+            raise ValueError(f"analyzer {spec['name']}: unknown keys {', '.join(sorted(unknown))}")
+        if spec['name'] in names:
+            raise ValueError(f"analyzer {spec['name']} is declared twice")
+        names.add(spec['name'])
+    
+    enabled_names = EMAIL_GUARD_ANALYZERS if enabled_names is None else enabled_names
+    if enabled_names:
+        enabled = {name.strip() for name in enabled_names.split(",") if name.strip()}
+        missing = enabled - names
+        if missing:
+            raise ValueError(f"unknown analyzers: {', '.join(sorted(missing))}")
+        return [spec for spec in specs if spec['name'] in enabled]
+    return [spec for spec in specs if spec.get('enabled', True)]
+
+def resolve_class(class_path: str):
+    """Import "module.Class" or "module:Class" and return the class"""
+    module_name, separator, class_name = class_path.rpartition(":")
+    if not separator:
+        module_name, _, class_name = class_path.rpartition(".")
+    if not module_name:
+        raise ValueError(f"class path must include a module: {class_path}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def build_analyzer(spec: Dict[str, Any]):
+    """Import and construct the analyzer for one spec"""
+    cls = resolve_class(spec['class'])
+    kwargs = dict(spec.get('options') or {})
+    if spec.get('model_path'):
+        kwargs['model_path'] = spec['model_path']
+    return cls(**kwargs)
+
+def build_analyzers(specs: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Tuple[Dict[str, Any], Any]]:
+    """
+    Construct analyzers in parallel, most expensive first
+    
+    Model loading is dominated by file reads and native code that releases
+    the GIL, so loading the models on separate threads overlaps their cold
+    starts.
+    
+    Returns:
+        (spec, analyzer or exception) pairs in spec order
+    """
+    if not specs:
+        return []
+    
+    def build(spec):
+        try:
+            return build_analyzer(spec)
+        except Exception as e:
+            return e
+    
+    by_cost = sorted(specs, key=lambda spec: -spec.get('cost_ms', 0))
+    with ThreadPoolExecutor(max_workers or len(specs)) as pool:
+        futures = {spec['name']: pool.submit(build, spec) for spec in by_cost}
+    return [(spec, futures[spec['name']].result()) for spec in specs]
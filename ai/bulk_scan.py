@@ -0,0 +1,339 @@
+# ai/bulk_scan.py
+"""
+Offline bulk scanner for archived mail
+
+Walks mbox files and maildir trees, analyzes every message with the same
+analyzers the API uses (email_guard.py) and writes one result per message
+as JSONL or Parquet. Messages are spread over a process pool; each worker
+loads the analyzers once, and the next batch is analyzed while the previous
+one is written. Progress is checkpointed after every batch, so an
+interrupted run picks up where it stopped. An existing output without a
+checkpoint is only overwritten with --restart.
+
+Usage:
+    python bulk_scan.py archive.mbox ~/Maildir -o results.jsonl
+    python bulk_scan.py archives/ -o results/ --format parquet --workers 16
+"""
+
+import argparse
+import email
+import email.policy
+import json
+import mailbox
+import multiprocessing
+import os
+import re
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+# Messages handed to the pool at once; also the checkpoint interval
+DEFAULT_BATCH_SIZE = 500
+
+# Per-worker state, set up once by _init_worker
+_worker_analyzer = None
+
+def find_mailboxes(paths: List[str]) -> List[Tuple[str, str]]:
+    """
+    Expand input paths into (kind, path) mailboxes, kind being 'mbox' or 'maildir'
+    
+    Directories that are not maildirs themselves are searched recursively.
+    The result is sorted so repeated runs visit mailboxes in the same order.
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(('mbox', path))
+            continue
+        for root, dirs, files in os.walk(path):
+            if {'cur', 'new'}.issubset(dirs):
+                found.append(('maildir', root))
+                # Do not descend into cur/new/tmp; maildir++ subfolders are still visited
+                dirs[:] = [d for d in dirs if d not in ('cur', 'new', 'tmp')]
+            for name in files:
+                if name.endswith('.mbox') or name == 'mbox':
+                    found.append(('mbox', os.path.join(root, name)))
+    return sorted(set(found), key=lambda item: item[1])
+
+def iter_messages(kind: str, path: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield (key, raw bytes) for every message in a mailbox, in a stable order
+    
+    Args:
+        kind: 'mbox' or 'maildir'
+        path: Mailbox path
+        skip: Number of leading messages to skip (already processed)
+    """
+    box = mailbox.mbox(path, create=False) if kind == 'mbox' else mailbox.Maildir(path, factory=None, create=False)
+    try:
+        keys = box.keys() if kind == 'mbox' else sorted(box.keys())
+        for key in keys[skip:]:
+            yield str(key), box.get_bytes(key)
+    finally:
+        box.close()
+
+def message_text(raw: bytes) -> Tuple[Dict[str, str], str]:
+    """
+    Parse a raw message into its headers of interest and the text to analyze
+    
+    The text is the subject followed by the plain-text body, falling back to
+    the HTML body with tags removed.
+    """
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+    headers = {
+        'message_id': str(message.get('Message-ID', '') or ''),
+        'from': str(message.get('From', '') or ''),
+        'subject': str(message.get('Subject', '') or ''),
+        'date': str(message.get('Date', '') or '')
+    }
+    
+    body = ''
+    part = message.get_body(preferencelist=('plain', 'html'))
+    if part is not None:
+        try:
+            body = part.get_content()
+        except (LookupError, ValueError):
+            body = part.get_payload(decode=True).decode('utf-8', errors='replace')
+        if part.get_content_type() == 'text/html':
+            body = re.sub(r'<[^>]+>', ' ', body)
+    return headers, f"Subject: {headers['subject']}\n\n{body}"
+
+def _init_worker(models_dir: Optional[str], threads: int):
+    """Load the analyzers once per worker process"""
+    global _worker_analyzer
+    # Keep BLAS/OpenMP pools at the requested size so workers do not oversubscribe cores
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    
+    import email_guard
+    if models_dir:
+        email_guard.models_dir = models_dir
+    if email_guard.load_ml_libraries():
+        email_guard.torch.set_num_threads(threads)
+    _worker_analyzer = email_guard.get_analyzer()
+
+def _scan_message(task: Tuple[str, str, bytes]) -> Dict[str, Any]:
+    """Analyze one message (runs in a worker)"""
+    source, key, raw = task
+    record = {'source': source, 'key': key}
+    try:
+        headers, text = message_text(raw)
+        record.update(headers)
+        record['results'] = _worker_analyzer.analyze_email(text)
+    except Exception as e:
+        record['results'] = []
+        record['error'] = str(e)
+    return record
+
+def _batches(paths: List[str], checkpoint: "Checkpoint", batch_size: int,
+             limit: Optional[int]) -> Iterator[Tuple[str, List[Tuple[str, str, bytes]]]]:
+    """Yield (mailbox path, tasks) batches of unprocessed messages, at most `limit` messages in all"""
+    taken = 0
+    for kind, path in find_mailboxes(paths):
+        messages = iter_messages(kind, path, checkpoint.done.get(path, 0))
+        while limit is None or taken < limit:
+            count = batch_size if limit is None else min(batch_size, limit - taken)
+            batch = [(path, key, raw) for _, (key, raw) in zip(range(count), messages)]
+            if not batch:
+                break
+            taken += len(batch)
+            yield path, batch
+
+def _has_output(output: str, output_format: str) -> bool:
+    """Whether a previous run left output that a fresh run would overwrite"""
+    if output_format == 'parquet':
+        return os.path.isdir(output) and any(re.match(r'part-\d+\.parquet$', name) for name in os.listdir(output))
+    return os.path.exists(output) and os.path.getsize(output) > 0
+
+class Checkpoint:
+    """
+    Progress of a bulk scan, stored as JSON next to the output
+    
+    Records how many messages of each mailbox have been written and how far
+    the output extends, so a resumed run can drop partially written output.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}
+        self.output_bytes = 0
+        self.parts = 0
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            self.done = state.get('done', {})
+            self.output_bytes = state.get('output_bytes', 0)
+            self.parts = state.get('parts', 0)
+    
+    def save(self):
+        """Write the checkpoint atomically"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': self.done, 'output_bytes': self.output_bytes, 'parts': self.parts}, f)
+        os.replace(tmp_path, self.path)
+
+class JsonlWriter:
+    """Append records to a JSONL file, truncating anything past the checkpoint"""
+    
+    def __init__(self, path: str, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self.file = open(path, 'ab')
+        # Drop records written after the last checkpoint by an interrupted run
+        self.file.truncate(checkpoint.output_bytes)
+        self.file.seek(checkpoint.output_bytes)
+    
+    def write(self, records: List[Dict[str, Any]]):
+        self.file.write(b"".join(json.dumps(record).encode('utf-8') + b"\n" for record in records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.checkpoint.output_bytes = self.file.tell()
+    
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Write each batch as a part file (one row per model result) in an output directory"""
+    
+    def __init__(self, path: str, checkpoint: Checkpoint):
+        import pandas  # noqa: F401 - fail early if Parquet output is unavailable
+        self.path = path
+        self.checkpoint = checkpoint
+        os.makedirs(path, exist_ok=True)
+        # Drop parts written after the last checkpoint by an interrupted run
+        for name in os.listdir(path):
+            match = re.match(r'part-(\d+)\.parquet$', name)
+            if match and int(match.group(1)) >= checkpoint.parts:
+                os.remove(os.path.join(path, name))
+    
+    def write(self, records: List[Dict[str, Any]]):
+        import pandas as pd
+        rows = []
+        for record in records:
+            base = {column: record.get(column, '') for column in
+                    ('source', 'key', 'message_id', 'from', 'subject', 'date', 'error')}
+            for result in record['results'] or [{}]:
+                rows.append(dict(
+                    base,
+                    model_name=result.get('model_name', ''),
+                    decision=result.get('decision', ''),
+                    confidence=float(result.get('confidence') or 0.0)
+                ))
+        part_path = os.path.join(self.path, f"part-{self.checkpoint.parts:06d}.parquet")
+        pd.DataFrame(rows).to_parquet(part_path + ".tmp", index=False, engine="pyarrow")
+        os.replace(part_path + ".tmp", part_path)
+        self.checkpoint.parts += 1
+    
+    def close(self):
+        pass
+
+def run_bulk_scan(paths: List[str], output: str, output_format: str = 'jsonl',
+                  workers: int = 0, threads_per_worker: int = 1, batch_size: int = DEFAULT_BATCH_SIZE,
+                  checkpoint_path: Optional[str] = None, models_dir: Optional[str] = None,
+                  restart: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Scan every message in the given mailboxes
+    
+    Args:
+        paths: mbox files, maildirs or directories containing them
+        output: JSONL file, or directory of Parquet part files
+        output_format: 'jsonl' or 'parquet'
+        workers: Worker processes (0 analyzes in this process)
+        threads_per_worker: Torch/OpenMP threads per worker
+        batch_size: Messages per batch; progress is saved after each batch
+        checkpoint_path: Checkpoint file (defaults to <output>.checkpoint)
+        models_dir: Override email_guard.models_dir
+        restart: Ignore an existing checkpoint and overwrite the output
+        limit: Stop after this many messages (the run can be resumed later)
+        
+    Returns:
+        Dictionary with messages scanned, errors and elapsed seconds
+        
+    Raises:
+        FileExistsError: If the output exists without a checkpoint and restart is not set
+    """
+    checkpoint_path = checkpoint_path or output.rstrip(os.sep) + ".checkpoint"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if not restart and not os.path.exists(checkpoint_path) and _has_output(output, output_format):
+        raise FileExistsError(f"{output} exists but has no checkpoint at {checkpoint_path}; "
+                              f"use --restart to overwrite it")
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = ParquetWriter(output, checkpoint) if output_format == 'parquet' else JsonlWriter(output, checkpoint)
+    
+    pool = None
+    if workers > 0:
+        # spawn keeps workers free of state inherited from this process
+        pool = multiprocessing.get_context("spawn").Pool(
+            workers, initializer=_init_worker, initargs=(models_dir, threads_per_worker)
+        )
+    else:
+        _init_worker(models_dir, threads_per_worker)
+    
+    summary = {'messages': 0, 'errors': 0, 'seconds': 0.0}
+    
+    def commit(path, records):
+        writer.write(records)
+        checkpoint.done[path] = checkpoint.done.get(path, 0) + len(records)
+        checkpoint.save()
+        summary['messages'] += len(records)
+        summary['errors'] += sum(1 for record in records if 'error' in record)
+        print(f"{path}: {checkpoint.done[path]} messages scanned")
+    
+    start = time.perf_counter()
+    try:
+        if pool is None:
+            for path, batch in _batches(paths, checkpoint, batch_size, limit):
+                commit(path, [_scan_message(task) for task in batch])
+        else:
+            # Keep the workers busy on the next batch while this one is written and fsynced
+            in_flight = None
+            for path, batch in _batches(paths, checkpoint, batch_size, limit):
+                result = pool.map_async(_scan_message, batch, chunksize=max(1, len(batch) // (workers * 4)))
+                if in_flight is not None:
+                    commit(in_flight[0], in_flight[1].get())
+                in_flight = (path, result)
+            if in_flight is not None:
+                commit(in_flight[0], in_flight[1].get())
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Scan mbox/maildir archives with the Email Guard analyzers")
+    parser.add_argument("paths", nargs="+", help="mbox files, maildirs or directories containing them")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file or Parquet output directory")
+    parser.add_argument("--format", choices=["jsonl", "parquet"],
+                        help="Output format (default: parquet if output ends in / or .parquet, else jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (0 runs in this process; default: all cores)")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Torch threads per worker")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Messages per checkpoint")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--models-dir", help="Directory containing the model folders")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore any checkpoint and overwrite existing output")
+    parser.add_argument("--limit", type=int, help="Stop after this many messages")
+    args = parser.parse_args(argv)
+    
+    output_format = args.format or (
+        'parquet' if args.output.endswith(('/', '.parquet')) else 'jsonl'
+    )
+    try:
+        summary = run_bulk_scan(
+            args.paths, args.output, output_format,
+            workers=args.workers, threads_per_worker=args.threads_per_worker,
+            batch_size=args.batch_size, checkpoint_path=args.checkpoint,
+            models_dir=args.models_dir, restart=args.restart, limit=args.limit
+        )
+    except FileExistsError as e:
+        parser.error(str(e))
+    rate = summary['messages'] / summary['seconds'] if summary['seconds'] else 0.0
+    print(f"Scanned {summary['messages']} messages ({summary['errors']} errors) "
+          f"in {summary['seconds']:.1f}s ({rate:.1f} messages/s)")
+
+if __name__ == "__main__":
+    main()
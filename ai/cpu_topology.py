@@ -0,0 +1,249 @@
+# ai/cpu_topology.py
+"""
+CPU topology detection and per-worker core assignment
+
+Torch sizes its intra-op pool to every core of the machine in every
+process, so N workers on one node run N x cores threads and contend for the
+same cores. This module works out which CPUs the process may really use
+(its affinity mask, capped by a cgroup CPU quota), groups them by physical
+core (SMT siblings together) and splits them into disjoint sets, one per
+worker. Each worker is then pinned to its set with sched_setaffinity and
+gets one torch thread per physical core in it.
+
+calibrate() picks the workers x threads split by measuring each candidate
+for a few seconds in forked processes, since the best split depends on the
+models, the email sizes and the CPU.
+"""
+
+import math
+import os
+import sys
+import time
+from typing import List, Dict, Callable, Optional, Tuple
+
+SYSFS_ROOT = "/sys"
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on (its affinity mask)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_limit(root: str = SYSFS_ROOT) -> Optional[float]:
+    """
+    CPU quota of the container in cores, or None if unlimited
+    
+    Reads cgroup v2 cpu.max, then cgroup v1 cpu.cfs_quota_us / cpu.cfs_period_us.
+    """
+    cpu_max = _read(os.path.join(root, "fs/cgroup/cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    
+    for directory in ("fs/cgroup/cpu", "fs/cgroup/cpu,cpuacct"):
+        quota = _read(os.path.join(root, directory, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, directory, "cpu.cfs_period_us"))
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+def core_groups(cpus: List[int], root: str = SYSFS_ROOT) -> List[List[int]]:
+    """
+    Group CPUs by physical core, ordered by package and core
+    
+    CPUs whose topology cannot be read count as a core of their own.
+    """
+    groups = {}
+    for cpu in cpus:
+        topology = os.path.join(root, f"devices/system/cpu/cpu{cpu}/topology")
+        package = _read(os.path.join(topology, "physical_package_id"))
+        core = _read(os.path.join(topology, "core_id"))
+        if package is None or core is None:
+            key = (sys.maxsize, cpu)
+        else:
+            key = (int(package), int(core))
+        groups.setdefault(key, []).append(cpu)
+    return [sorted(groups[key]) for key in sorted(groups)]
+
+def usable_core_groups(root: str = SYSFS_ROOT) -> List[List[int]]:
+    """
+    Core groups of the CPUs available to this process, within its cgroup quota
+    
+    Under a quota of Q cores, only floor(Q) CPUs are kept: pinning to more
+    would just get the workers throttled. One CPU is taken per physical core
+    first, and SMT siblings only once every core has one, so the quota is
+    spread over as many cores (and threads) as it allows.
+    """
+    groups = core_groups(available_cpus(), root)
+    limit = cgroup_cpu_limit(root)
+    if limit is None:
+        return groups
+    
+    budget = max(1, math.floor(limit))
+    kept = [[group[0]] for group in groups[:budget]]
+    budget -= len(kept)
+    sibling = 1
+    while budget > 0 and any(len(group) > sibling for group in groups):
+        for group, chosen in zip(groups, kept):
+            if budget > 0 and len(group) > sibling:
+                chosen.append(group[sibling])
+                budget -= 1
+        sibling += 1
+    return kept
+
+def usable_cores(root: str = SYSFS_ROOT) -> int:
+    """Physical cores this process can use"""
+    return len(usable_core_groups(root))
+
+def _split(items: list, parts: int) -> List[list]:
+    """Split items into parts contiguous chunks whose sizes differ by at most one"""
+    size, extra = divmod(len(items), parts)
+    chunks, start = [], 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+def plan_workers(workers: int, groups: Optional[List[List[int]]] = None) -> List[List[int]]:
+    """
+    Assign each worker a disjoint set of CPUs
+    
+    Workers get whole physical cores (with their SMT siblings) while there
+    are at least as many cores as workers, then single logical CPUs. With
+    more workers than CPUs the sets cannot be disjoint, and CPUs are shared
+    round-robin.
+    
+    Returns:
+        One sorted CPU list per worker
+    """
+    groups = usable_core_groups() if groups is None else groups
+    if workers <= len(groups):
+        return [sorted(cpu for group in chunk for cpu in group) for chunk in _split(groups, workers)]
+    
+    cpus = [cpu for group in groups for cpu in group]
+    if workers <= len(cpus):
+        return [sorted(chunk) for chunk in _split(cpus, workers)]
+    print(f"Warning: {workers} workers share {len(cpus)} CPUs")
+    return [[cpus[index % len(cpus)]] for index in range(workers)]
+
+def threads_for(cpus: List[int], groups: Optional[List[List[int]]] = None) -> int:
+    """Intra-op threads for a CPU set: one per physical core in it"""
+    groups = usable_core_groups() if groups is None else groups
+    cores = sum(1 for group in groups if set(group) & set(cpus))
+    return max(1, cores or len(cpus))
+
+def pin_current_process(cpus: Optional[List[int]], threads: int):
+    """
+    Pin this process to cpus and size its thread pools to match
+    
+    Sets torch's intra-op threads if torch is imported, and OMP/MKL thread
+    counts and tokenizer parallelism for anything initialized later.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    # Each worker encodes one email at a time; tokenizer threads would only compete with torch
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+def candidate_splits(cores: int) -> List[Tuple[int, int]]:
+    """(workers, threads per worker) pairs that use every core exactly once"""
+    return [(cores // threads, threads) for threads in range(1, cores + 1) if cores % threads == 0]
+
+def measure_split(workers: int, threads: int, work: Callable[[], None], duration: float = 2.0,
+                  groups: Optional[List[List[int]]] = None) -> Dict[str, float]:
+    """
+    Run work() in a loop in `workers` forked, pinned processes for `duration` seconds
+    
+    The calling process must not have used torch's thread pool (see
+    prefork.py); forked children of such a process hang.
+    
+    Returns:
+        Dictionary with throughput (calls per second over all workers), p50_ms and p95_ms
+    """
+    plan = plan_workers(workers, groups)
+    children = []
+    for cpus in plan:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 1
+            try:
+                pin_current_process(cpus, threads)
+                work()
+                latencies = []
+                end = time.perf_counter() + duration
+                while time.perf_counter() < end:
+                    start = time.perf_counter()
+                    work()
+                    latencies.append(time.perf_counter() - start)
+                with os.fdopen(write_fd, 'wb') as f:
+                    f.write(" ".join(f"{latency:.6f}" for latency in latencies).encode())
+                status = 0
+            except BaseException as e:
+                print(f"Calibration worker failed: {e}")
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+    
+    latencies = []
+    for pid, read_fd in children:
+        chunks = []
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        latencies.extend(float(value) for value in b"".join(chunks).split())
+    
+    latencies.sort()
+    if not latencies:
+        return {'throughput': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0}
+    return {
+        'throughput': len(latencies) / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+    }
+
+def calibrate(work: Callable[[], None], duration: float = 2.0,
+              groups: Optional[List[List[int]]] = None,
+              measure: Callable[..., Dict[str, float]] = measure_split) -> Tuple[Tuple[int, int], Dict[Tuple[int, int], Dict[str, float]]]:
+    """
+    Pick the workers x threads split with the best throughput
+    
+    Splits within 5% of the best throughput count as equal, and the one with
+    the lowest p95 latency among them wins.
+    
+    Returns:
+        ((workers, threads), measurements per split)
+    """
+    groups = usable_core_groups() if groups is None else groups
+    results = {}
+    for workers, threads in candidate_splits(len(groups)):
+        results[(workers, threads)] = measure(workers, threads, work, duration, groups)
+        stats = results[(workers, threads)]
+        print(f"Calibration {workers} workers x {threads} threads: {stats['throughput']:.1f} scans/s, "
+              f"p95 {stats['p95_ms']:.1f}ms")
+    
+    best_throughput = max(stats['throughput'] for stats in results.values())
+    contenders = [split for split, stats in results.items() if stats['throughput'] >= 0.95 * best_throughput]
+    best = min(contenders, key=lambda split: results[split]['p95_ms'])
+    return best, results
@@ -1,30 +1,129 @@
 # ai/email_guard.py
 import os
 import sys
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
+import importlib.util
 import re
+import time
+import contextvars
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-# Add models directory to path
-models_dir = '/app/ai/models/'
+from analyzer_registry import load_analyzer_specs, build_analyzers
+from residency import ModelResidencyManager
 
-# Try to import ML libraries
-try:
-    from transformers import AutoTokenizer, AutoModelForSequenceClassification
-    import torch
-    ML_AVAILABLE = True
-except ImportError:
-    ML_AVAILABLE = False
+# Directory containing the model folders (EMAIL_GUARD_MODELS_DIR overrides the ai/models default)
+models_dir = os.getenv("EMAIL_GUARD_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+
+# Model folder names inside models_dir
+CYBERSECTONY_MODEL_DIR = "cybersectony-phishing-email-detection-distilbert_v2.1"
+AAMOSH_MODEL_DIR = "aamoshdahal-email-phishing-distilbert-finetuned"
+
+# Precision the HuggingFace models are kept in (empty keeps the checkpoint's, usually float32)
+MODEL_DTYPE = os.getenv("MODEL_DTYPE", "")
+if MODEL_DTYPE not in ("", "float32", "bfloat16", "float16"):
+    print(f"Warning: unsupported MODEL_DTYPE {MODEL_DTYPE!r}, keeping the checkpoint dtype")
+    MODEL_DTYPE = ""
+
+# Map safetensors checkpoints copy-on-write instead of copying them into each process
+MODEL_MMAP = os.getenv("MODEL_MMAP", "1") == "1"
+
+# ML libraries are only looked up here; they are imported by the first analyzer
+# that needs them (load_ml_libraries), so rules-only deployments never pay for them
+ML_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("torch", "transformers"))
+if not ML_AVAILABLE:
     print("Warning: ML libraries not available.")
+torch = None
+AutoTokenizer = AutoModelForSequenceClassification = None
+# Analyzers are built on parallel threads; transformers' lazy imports are not thread-safe
+_ml_import_lock = threading.Lock()
 
-# Try to import phishing_detection_py
-try:
-    from phishing_detection_py import PhishingDetector
-    PHISHING_DETECTOR_AVAILABLE = True
-except ImportError:
-    PHISHING_DETECTOR_AVAILABLE = False
+PHISHING_DETECTOR_AVAILABLE = importlib.util.find_spec("phishing_detection_py") is not None
+if not PHISHING_DETECTOR_AVAILABLE:
     print("Warning: phishing_detection_py not available.")
 
+def load_ml_libraries() -> bool:
+    """Import torch and transformers on first use; returns False if they cannot be imported"""
+    global torch, AutoTokenizer, AutoModelForSequenceClassification, ML_AVAILABLE
+    if torch is not None:
+        return True
+    with _ml_import_lock:
+        if torch is not None:
+            return True
+        if not ML_AVAILABLE:
+            return False
+        try:
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            import torch
+        except ImportError as e:
+            print(f"Warning: ML libraries not available: {e}")
+            ML_AVAILABLE = False
+            return False
+        return True
+
+# No-op stand-ins when prometheus_client is missing
+from prometheus_compat import Counter, Gauge, Histogram
+
+ANALYZER_SECONDS = Histogram(
+    "email_guard_analyzer_seconds",
+    "Time spent in each analyzer's analyze call",
+    ["analyzer"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+ANALYZER_FAILURES = Counter(
+    "email_guard_analyzer_failures_total",
+    "Analyzer calls that raised an exception",
+    ["analyzer"]
+)
+ANALYZER_SKIPPED = Counter(
+    "email_guard_analyzer_skipped_total",
+    "Analyzers skipped because the request deadline could not be met",
+    ["analyzer"]
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "email_guard_model_load_seconds",
+    "Time taken to load each model",
+    ["model"]
+)
+MODEL_RESIDENT_BYTES = Gauge(
+    "email_guard_model_resident_bytes",
+    "Bytes of model weights currently in memory",
+    ["model"]
+)
+MODEL_EVICTIONS = Counter(
+    "email_guard_model_evictions_total",
+    "Models dropped from memory by the residency manager",
+    ["model"]
+)
+
+# Per-request stage timings, only collected inside collect_stage_timings()
+_stage_timings = contextvars.ContextVar("email_guard_stage_timings", default=None)
+
+@contextmanager
+def collect_stage_timings():
+    """Collect (stage, seconds) pairs recorded by stage() within the block"""
+    timings = []
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+@contextmanager
+def stage(name: str):
+    """Record the duration of the block as a named stage when collecting"""
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, time.perf_counter() - start))
+
 class ModelAnalyzer:
     """Base class for all model analyzers"""
     
@@ -35,40 +134,151 @@ class ModelAnalyzer:
     def analyze(self, email_text: str) -> Dict[str, Any]:
         """Analyze email text and return results"""
         raise NotImplementedError("Subclasses must implement analyze method")
+    
+    def analyze_batch(self, email_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Analyze several emails; one result (or None) per email"""
+        return [self.analyze(email_text) for email_text in email_texts]
+    
+    def is_ready(self) -> bool:
+        """Whether the analyzer loaded and can be used"""
+        return True
 
-class CybersectonyDistilbertAnalyzer(ModelAnalyzer):
-    """Analyzer for cybersectony-phishing-email-detection-distilbert_v2.1 model"""
+class HuggingFaceAnalyzer(ModelAnalyzer):
+    """
+    Base class for analyzers backed by a local HuggingFace sequence classifier
     
-    def __init__(self):
-        super().__init__("cybersectony-distilbert", "HuggingFace")
+    The weights can be dropped with unload() and loaded again with
+    load_model(); EmailAnalyzer's residency manager uses this to keep the
+    models within the memory budget. The tokenizer stays loaded.
+    """
+    
+    def __init__(self, model_name: str, model_folder: str):
+        super().__init__(model_name, "HuggingFace")
+        # Folder inside models_dir, or an absolute path
+        self.model_folder = model_folder
         self.tokenizer = None
         self.model = None
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.device = None
+        self.dtype = None
+        if load_ml_libraries():
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            # Reduced precision (MODEL_DTYPE) applies on load; None keeps the checkpoint dtype
+            self.dtype = getattr(torch, MODEL_DTYPE) if MODEL_DTYPE else None
         self.load_model()
     
+    @property
+    def model_path(self) -> str:
+        return os.path.join(models_dir, self.model_folder)
+    
     def load_model(self):
         """Load the model and tokenizer"""
-        if not ML_AVAILABLE:
+        if not load_ml_libraries():
             return
         
-        model_path = os.path.join(models_dir, "cybersectony-phishing-email-detection-distilbert_v2.1")
+        model_path = self.model_path
         print(f"Checking model path: {model_path}")
         print(f"Model path exists: {os.path.exists(model_path)}")
         
         if os.path.exists(model_path):
             try:
-                print(f"Loading tokenizer from: {model_path}")
-                self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+                load_start = time.perf_counter()
+                if self.tokenizer is None:
+                    print(f"Loading tokenizer from: {model_path}")
+                    self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
                 print(f"Loading model from: {model_path}")
-                self.model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
-                self.model.to(self.device)
-                self.model.eval()
+                model = self._load_mmap(model_path) if MODEL_MMAP else None
+                if model is None:
+                    model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
+                model.to(device=self.device, dtype=self.dtype)
+                model.eval()
+                self.model = model
+                MODEL_LOAD_SECONDS.labels(self.model_name).set(time.perf_counter() - load_start)
                 print(f"✓ Loaded model: {self.model_name}")
             except Exception as e:
                 print(f"✗ Failed to load model {self.model_name}: {e}")
         else:
             print(f"✗ Model path does not exist: {model_path}")
     
+    def _load_mmap(self, model_path: str):
+        """Load with weights mapped from model.safetensors; None to fall back to from_pretrained"""
+        try:
+            from safetensors_mmap import load_mmap_model
+            return load_mmap_model(model_path, self.dtype)
+        except Exception as e:
+            print(f"Memory-mapped loading unavailable for {self.model_name}, copying weights: {e}")
+            return None
+    
+    def unload(self):
+        """Drop the model weights (reload with load_model)"""
+        self.model = None
+    
+    def is_loaded(self) -> bool:
+        return self.model is not None
+    
+    def is_ready(self) -> bool:
+        return self.is_loaded()
+    
+    def resident_bytes(self) -> int:
+        """Bytes held by the loaded model's parameters and buffers"""
+        if self.model is None:
+            return 0
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    
+    def estimated_bytes(self) -> int:
+        """Expected resident size before the first load, from the checkpoint files"""
+        try:
+            # Skip reduced-precision copies (model.<dtype>.safetensors) made by safetensors_mmap
+            files = [name for name in os.listdir(self.model_path)
+                     if name.endswith(('.safetensors', '.bin')) and name.count('.') == 1]
+            size = sum(os.path.getsize(os.path.join(self.model_path, name)) for name in files)
+        except OSError:
+            return 0
+        if self.dtype is not None and self.dtype.is_floating_point:
+            # Checkpoints are stored in fp32
+            size = size * torch.finfo(self.dtype).bits // 32
+        return size
+    
+    def dtype_name(self) -> Optional[str]:
+        if self.model is not None:
+            return str(self.model.dtype).replace("torch.", "")
+        return str(self.dtype).replace("torch.", "") if self.dtype is not None else None
+    
+    def interpret(self, probs: List[float]) -> Dict[str, Any]:
+        """Turn one row of class probabilities into a result"""
+        raise NotImplementedError("Subclasses must implement interpret method")
+    
+    def analyze_batch(self, email_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Analyze several emails in one padded forward pass"""
+        if not self.model or not self.tokenizer:
+            return [None] * len(email_texts)
+        
+        try:
+            with stage(f"{self.model_name}.tokenize"):
+                inputs = self.tokenizer(
+                    email_texts,
+                    return_tensors="pt",
+                    truncation=True,
+                    max_length=512,
+                    padding=True
+                ).to(self.device)
+            
+            with stage(f"{self.model_name}.infer"), torch.no_grad():
+                outputs = self.model(**inputs)
+                probs = torch.nn.functional.softmax(outputs.logits.float(), dim=-1)
+            
+            return [self.interpret(row) for row in probs.tolist()]
+        
+        except Exception as e:
+            print(f"{self.model_name} batch error: {e}")
+            return [None] * len(email_texts)
+
+class CybersectonyDistilbertAnalyzer(HuggingFaceAnalyzer):
+    """Analyzer for cybersectony-phishing-email-detection-distilbert_v2.1 model"""
+    
+    def __init__(self, model_path: str = CYBERSECTONY_MODEL_DIR):
+        super().__init__("cybersectony-distilbert", model_path)
+    
     def analyze(self, email_text: str) -> Dict[str, Any]:
         """Analyze email using cybersectony model"""
         if not self.model or not self.tokenizer:
@@ -76,84 +286,59 @@ class CybersectonyDistilbertAnalyzer(ModelAnalyzer):
         
         try:
             # Preprocess and tokenize
-            inputs = self.tokenizer(
-                email_text,
-                return_tensors="pt",
-                truncation=True,
-                max_length=512
-            ).to(self.device)
+            with stage(f"{self.model_name}.tokenize"):
+                inputs = self.tokenizer(
+                    email_text,
+                    return_tensors="pt",
+                    truncation=True,
+                    max_length=512
+                ).to(self.device)
             
             # Get prediction
-            with torch.no_grad():
+            with stage(f"{self.model_name}.infer"), torch.no_grad():
                 outputs = self.model(**inputs)
-                predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            
-            # Get probabilities for each class
-            probs = predictions[0].tolist()
-            
-            # Create labels dictionary
-            labels = {
-                "legitimate_email": probs[0],
-                "phishing_url": probs[1],
-                "legitimate_url": probs[2],
-                "phishing_url_alt": probs[3]
-            }
-            
-            # Determine the most likely classification
-            max_label = max(labels.items(), key=lambda x: x[1])
+                predictions = torch.nn.functional.softmax(outputs.logits.float(), dim=-1)
             
-            # Map to standard decision format
-            if "phishing" in max_label[0]:
-                decision = "phishing"
-            elif "legitimate" in max_label[0]:
-                decision = "safe"
-            else:
-                decision = "unknown"
-            
-            return {
-                "model_source": self.model_source,
-                "model_name": self.model_name,
-                "decision": decision,
-                "confidence": max_label[1],
-                "description": f"Prediction: {max_label[0]} with {max_label[1]:.2%} confidence"
-            }
+            return self.interpret(predictions[0].tolist())
             
         except Exception as e:
             print(f"Cybersectony model error: {e}")
             return None
-
-class AamoshDistilbertAnalyzer(ModelAnalyzer):
-    """Analyzer for aamoshdahal-email-phishing-distilbert-finetuned model"""
     
-    def __init__(self):
-        super().__init__("aamosh-distilbert", "HuggingFace")
-        self.tokenizer = None
-        self.model = None
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.load_model()
-    
-    def load_model(self):
-        """Load the model and tokenizer"""
-        if not ML_AVAILABLE:
-            return
+    def interpret(self, probs: List[float]) -> Dict[str, Any]:
+        """Map the four class probabilities to a decision"""
+        # Create labels dictionary
+        labels = {
+            "legitimate_email": probs[0],
+            "phishing_url": probs[1],
+            "legitimate_url": probs[2],
+            "phishing_url_alt": probs[3]
+        }
         
-        model_path = os.path.join(models_dir, "aamoshdahal-email-phishing-distilbert-finetuned")
-        print(f"Checking model path: {model_path}")
-        print(f"Model path exists: {os.path.exists(model_path)}")
+        # Determine the most likely classification
+        max_label = max(labels.items(), key=lambda x: x[1])
         
-        if os.path.exists(model_path):
-            try:
-                print(f"Loading tokenizer from: {model_path}")
-                self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-                print(f"Loading model from: {model_path}")
-                self.model = AutoModelForSequenceClassification.from_pretrained(model_path, local_files_only=True)
-                self.model.to(self.device)
-                self.model.eval()
-                print(f"✓ Loaded model: {self.model_name}")
-            except Exception as e:
-                print(f"✗ Failed to load model {self.model_name}: {e}")
+        # Map to standard decision format
+        if "phishing" in max_label[0]:
+            decision = "phishing"
+        elif "legitimate" in max_label[0]:
+            decision = "safe"
         else:
-            print(f"✗ Model path does not exist: {model_path}")
+            decision = "unknown"
+        
+        return {
+            "model_source": self.model_source,
+            "model_name": self.model_name,
+            "decision": decision,
+            "confidence": max_label[1],
+            "description": f"Prediction: {max_label[0]} with {max_label[1]:.2%} confidence"
+        }
+
+class AamoshDistilbertAnalyzer(HuggingFaceAnalyzer):
+    """Analyzer for aamoshdahal-email-phishing-distilbert-finetuned model"""
+    
+    def __init__(self, model_path: str = AAMOSH_MODEL_DIR):
+        super().__init__("aamosh-distilbert", model_path)
     
     def analyze(self, email_text: str) -> Dict[str, Any]:
         """Analyze email using aamosh model"""
@@ -162,42 +347,48 @@ class AamoshDistilbertAnalyzer(ModelAnalyzer):
         
         try:
             # Tokenize and prepare the input
-            encoded_input = self.tokenizer(
-                email_text, 
-                return_tensors='pt', 
-                truncation=True, 
-                padding=True
-            ).to(self.device)
+            with stage(f"{self.model_name}.tokenize"):
+                encoded_input = self.tokenizer(
+                    email_text, 
+                    return_tensors='pt', 
+                    truncation=True, 
+                    padding=True
+                ).to(self.device)
             
             # Make prediction
-            with torch.no_grad():
+            with stage(f"{self.model_name}.infer"), torch.no_grad():
                 outputs = self.model(**encoded_input)
-                probs = torch.nn.functional.softmax(outputs.logits, dim=1)
+                probs = torch.nn.functional.softmax(outputs.logits.float(), dim=1)
             
-            # Output prediction
-            labels = ["legitimate", "phishing"]
-            pred_label = labels[probs.argmax()]
-            confidence = probs.max().item()
-            
-            # Map to standard decision format
-            if pred_label == "phishing":
-                decision = "phishing"
-            elif pred_label == "legitimate":
-                decision = "safe"
-            else:
-                decision = "unknown"
-            
-            return {
-                "model_source": self.model_source,
-                "model_name": self.model_name,
-                "decision": decision,
-                "confidence": confidence,
-                "description": f"Prediction: {pred_label} with {confidence:.2%} confidence"
-            }
+            return self.interpret(probs[0].tolist())
             
         except Exception as e:
             print(f"Aamosh model error: {e}")
             return None
+    
+    def interpret(self, probs: List[float]) -> Dict[str, Any]:
+        """Map the legitimate/phishing probabilities to a decision"""
+        # Output prediction
+        labels = ["legitimate", "phishing"]
+        best = max(range(len(labels)), key=lambda index: probs[index])
+        pred_label = labels[best]
+        confidence = probs[best]
+        
+        # Map to standard decision format
+        if pred_label == "phishing":
+            decision = "phishing"
+        elif pred_label == "legitimate":
+            decision = "safe"
+        else:
+            decision = "unknown"
+        
+        return {
+            "model_source": self.model_source,
+            "model_name": self.model_name,
+            "decision": decision,
+            "confidence": confidence,
+            "description": f"Prediction: {pred_label} with {confidence:.2%} confidence"
+        }
 
 class PhishingDetectorAnalyzer(ModelAnalyzer):
     """Primary analyzer using phishing-detection-py package"""
@@ -214,12 +405,19 @@ class PhishingDetectorAnalyzer(ModelAnalyzer):
             return
         
         try:
+            from phishing_detection_py import PhishingDetector
+            
             # Initialize the phishing detector for URL analysis
+            load_start = time.perf_counter()
             self.detector = PhishingDetector(model_type="url")
+            MODEL_LOAD_SECONDS.labels(self.model_name).set(time.perf_counter() - load_start)
             print(f"Loaded primary model: {self.model_name}")
         except Exception as e:
             print(f"Failed to load primary model {self.model_name}: {e}")
     
+    def is_ready(self) -> bool:
+        return self.detector is not None
+    
     def analyze(self, email_text: str) -> Dict[str, Any]:
         """Analyze email using phishing-detection-py"""
         # Only analyze if detector is available
@@ -440,78 +638,203 @@ class RuleBasedAnalyzer(ModelAnalyzer):
         
         return patterns
 
+# Weight of the newest sample in each analyzer's latency estimate
+LATENCY_EWMA_ALPHA = 0.2
+
+# Half-life of a latency estimate while its analyzer is being skipped, so an analyzer
+# skipped after one slow call is retried once the estimate fits the budget again
+LATENCY_DECAY_HALF_LIFE_S = float(os.getenv("LATENCY_DECAY_HALF_LIFE_S", "30"))
+
 class EmailAnalyzer:
     """Main email analyzer that coordinates multiple models"""
     
     def __init__(self):
         self.analyzers = []
+        self._latency_metrics = {}
+        self._failure_metrics = {}
+        self._skipped_metrics = {}
+        # Moving average of each analyzer's latency in seconds, used for deadlines
+        self.expected_latency = {}
+        # time.monotonic() of the first deadline skip since each analyzer last ran
+        self._skipped_since = {}
+        # Bumped whenever the set or state of loaded analyzers changes
+        self.registry_version = 0
+        # Keeps model weights within the memory budget and evicts idle models
+        self.residency = ModelResidencyManager(on_change=self._residency_changed)
         self.load_analyzers()
+        self.residency.start()
     
     def load_analyzers(self):
-        """Load available analyzers"""
+        """Build the analyzers declared in the registry config (see analyzer_registry.py)"""
         print(f"ML_AVAILABLE: {ML_AVAILABLE}")
         print(f"PHISHING_DETECTOR_AVAILABLE: {PHISHING_DETECTOR_AVAILABLE}")
         
-        # Load HuggingFace models
-        if ML_AVAILABLE:
-            try:
-                cybersectony_analyzer = CybersectonyDistilbertAnalyzer()
-                if cybersectony_analyzer.model:  # Only add if successfully loaded
-                    self.add_analyzer(cybersectony_analyzer)
-                    print("✓ Cybersectony model loaded")
-                else:
-                    print("✗ Cybersectony model failed to load")
-            except Exception as e:
-                print(f"Failed to load Cybersectony model: {e}")
-            
-            try:
-                aamosh_analyzer = AamoshDistilbertAnalyzer()
-                if aamosh_analyzer.model:  # Only add if successfully loaded
-                    self.add_analyzer(aamosh_analyzer)
-                    print("✓ Aamosh model loaded")
-                else:
-                    print("✗ Aamosh model failed to load")
-            except Exception as e:
-                print(f"Failed to load Aamosh model: {e}")
-        
-        # Try to load phishing-detection-py as primary analyzer
-        if PHISHING_DETECTOR_AVAILABLE:
-            try:
-                phishing_analyzer = PhishingDetectorAnalyzer()
-                if phishing_analyzer.detector:  # Only add if successfully loaded
-                    self.add_analyzer(phishing_analyzer)
-                    print("✓ Primary ML analyzer loaded")
-                else:
-                    print("✗ Primary ML analyzer failed to load detector")
-            except Exception as e:
-                print(f"Failed to load primary ML analyzer: {e}")
-        else:
-            print("✗ phishing-detection-py package not available")
-        
-        # Always add rule-based analyzer
-        self.add_analyzer(RuleBasedAnalyzer())
-        print("✓ Rule-based analyzer loaded")
+        # Analyzers are imported and constructed in parallel, then added in config order
+        for spec, analyzer in build_analyzers(load_analyzer_specs()):
+            if isinstance(analyzer, Exception):
+                print(f"Failed to load {spec['name']}: {analyzer}")
+            elif not analyzer.is_ready():
+                print(f"✗ {spec['name']} failed to load")
+            else:
+                self.add_analyzer(analyzer)
+                if 'cost_ms' in spec:
+                    # Deadline estimate until real latencies are measured
+                    self.expected_latency.setdefault(analyzer.model_name, spec['cost_ms'] / 1000.0)
+                print(f"✓ {spec['name']} loaded")
         
         print(f"Total analyzers loaded: {len(self.analyzers)}")
 
     def add_analyzer(self, analyzer: ModelAnalyzer):
         """Add an analyzer to the list"""
+        # Bind metric labels once so the per-call overhead stays negligible
+        self._latency_metrics[analyzer.model_name] = ANALYZER_SECONDS.labels(analyzer.model_name)
+        self._failure_metrics[analyzer.model_name] = ANALYZER_FAILURES.labels(analyzer.model_name)
+        self._skipped_metrics[analyzer.model_name] = ANALYZER_SKIPPED.labels(analyzer.model_name)
         self.analyzers.append(analyzer)
+        self.registry_version += 1
+        if isinstance(analyzer, HuggingFaceAnalyzer):
+            MODEL_RESIDENT_BYTES.labels(analyzer.model_name).set(analyzer.resident_bytes())
+            self.residency.register(analyzer)
+    
+    def _residency_changed(self, model_name: str, event: str, resident_bytes: int):
+        """Called by the residency manager after a model is evicted or reloaded"""
+        MODEL_RESIDENT_BYTES.labels(model_name).set(resident_bytes)
+        if event == 'evict':
+            MODEL_EVICTIONS.labels(model_name).inc()
+        self.registry_version += 1
+    
+    def expected_seconds(self, model_name: str) -> float:
+        """
+        Latency estimate used for deadline checks
+        
+        The moving average only gets new samples when the analyzer runs, so
+        without decay one slow call could keep it skipped on every
+        deadline-bounded scan. It decays only while the analyzer is being
+        skipped: an analyzer that runs, however rarely, keeps its measured
+        latency.
+        """
+        estimate = self.expected_latency.get(model_name, 0.0)
+        skipped_since = self._skipped_since.get(model_name)
+        if skipped_since is None or LATENCY_DECAY_HALF_LIFE_S <= 0:
+            return estimate
+        return estimate * 0.5 ** ((time.monotonic() - skipped_since) / LATENCY_DECAY_HALF_LIFE_S)
+    
+    def _record_latency(self, model_name: str, seconds: float, emails: int = 1):
+        """Update the per-email latency estimate and histogram for an analyzer run over `emails` emails"""
+        per_email = seconds / emails
+        for _ in range(emails):
+            self._latency_metrics[model_name].observe(per_email)
+        if model_name not in self.expected_latency:
+            self.expected_latency[model_name] = per_email
+        else:
+            previous = self.expected_seconds(model_name)
+            self.expected_latency[model_name] = previous + LATENCY_EWMA_ALPHA * (per_email - previous)
+        self._skipped_since.pop(model_name, None)
+    
+    def _fits_deadline(self, analyzer, deadline: Optional[float], omitted: Optional[List[str]],
+                       emails: int = 1) -> bool:
+        """
+        Whether an analyzer run over `emails` emails is expected to finish by deadline
+        
+        Records the skip (metric and omitted list) when it is not.
+        """
+        if deadline is None:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining > 0 and remaining >= self.expected_seconds(analyzer.model_name) * emails:
+            return True
+        self._skipped_metrics[analyzer.model_name].inc()
+        self._skipped_since.setdefault(analyzer.model_name, time.monotonic())
+        if omitted is not None:
+            omitted.append(analyzer.model_name)
+        return False
     
-    def analyze_email(self, email_text: str) -> List[Dict[str, Any]]:
-        """Analyze email using all available models"""
+    def _run_analyzer(self, analyzer, run: Callable[[], Any], emails: int = 1) -> Any:
+        """
+        Run one analyzer call with its stage timing, residency and latency bookkeeping
+        
+        Returns:
+            The call's result, or None if it raised (failed analyzers are skipped)
+        """
+        try:
+            with stage(analyzer.model_name), self.residency.acquire(analyzer):
+                # Only the analysis is timed: reloading an evicted model is not its latency
+                start = time.perf_counter()
+                try:
+                    return run()
+                finally:
+                    self._record_latency(analyzer.model_name, time.perf_counter() - start, emails)
+        except Exception as e:
+            self._failure_metrics[analyzer.model_name].inc()
+            print(f"Analyzer {analyzer.model_name} failed: {e}")
+            return None
+    
+    def analyze_email(self, email_text: str, deadline: Optional[float] = None,
+                      omitted: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Analyze email using all available models
+        
+        Args:
+            email_text: Email text to analyze
+            deadline: Optional time.monotonic() value by which analysis must finish.
+                Analyzers whose expected latency does not fit in the remaining
+                budget are skipped.
+            omitted: Optional list that receives the names of skipped analyzers
+            
+        Returns:
+            List of model results (only successful analyses)
+        """
         results = []
         
         for analyzer in self.analyzers:
-            try:
-                result = analyzer.analyze(email_text)
-                # Only add result if analysis was successful (not None)
-                if result is not None:
-                    results.append(result)
-            except Exception as e:
-                # Skip failed analyzers instead of adding error results
-                print(f"Analyzer {analyzer.model_name} failed: {e}")
+            if not self._fits_deadline(analyzer, deadline, omitted):
+                continue
+            
+            result = self._run_analyzer(analyzer, lambda: analyzer.analyze(email_text))
+            # Only add result if analysis was successful (not None)
+            if result is not None:
+                results.append(result)
+        
+        return results
+    
+    def analyze_batch(self, email_texts: List[str], deadlines: Optional[List[Optional[float]]] = None,
+                      omitted: Optional[List[List[str]]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Analyze several emails, running each analyzer once over all of them
+        
+        HuggingFace models see the whole batch in a single forward pass. The
+        deadline check works as in analyze_email, per email, except that each
+        email waits for the whole batch: an analyzer is only run for the
+        emails whose remaining budget fits its per-email latency estimate
+        times the batch size. The batch time is recorded per email (divided
+        by the number of emails analyzed), so the estimate stays comparable
+        with single-email calls.
+        
+        Args:
+            email_texts: Emails to analyze
+            deadlines: Optional time.monotonic() deadline per email (None entries have none)
+            omitted: Optional lists, one per email, that receive the names of skipped analyzers
+            
+        Returns:
+            One list of successful results per email, in input order
+        """
+        results = [[] for _ in email_texts]
+        deadlines = deadlines or [None] * len(email_texts)
+        
+        for analyzer in self.analyzers:
+            indexes = [
+                index for index, deadline in enumerate(deadlines)
+                if self._fits_deadline(analyzer, deadline, omitted[index] if omitted is not None else None,
+                                       len(email_texts))
+            ]
+            if not indexes:
                 continue
+            
+            batch_texts = [email_texts[index] for index in indexes]
+            batch_results = self._run_analyzer(analyzer, lambda: analyzer.analyze_batch(batch_texts), len(indexes))
+            for index, result in zip(indexes, batch_results or []):
+                if result is not None:
+                    results[index].append(result)
         
         return results
 
@@ -525,27 +848,43 @@ def get_analyzer() -> EmailAnalyzer:
         _analyzer = EmailAnalyzer()
     return _analyzer
 
-def analyze_email_with_models(email_text: str) -> List[Dict[str, Any]]:
+def reload_analyzer() -> EmailAnalyzer:
+    """Build a new global analyzer, re-reading the analyzer config and model files"""
+    global _analyzer
+    analyzer = EmailAnalyzer()
+    previous, _analyzer = _analyzer, analyzer
+    if previous is not None:
+        previous.residency.stop()
+    return analyzer
+
+def analyze_email_with_models(email_text: str, deadline: Optional[float] = None,
+                              omitted: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     """
     Main function to analyze email with all available models
     
     Args:
         email_text: Email text to analyze
+        deadline: Optional time.monotonic() deadline (see EmailAnalyzer.analyze_email)
+        omitted: Optional list that receives the names of skipped analyzers
         
     Returns:
         List of model results with required fields (only successful analyses)
     """
     analyzer = get_analyzer()
-    return analyzer.analyze_email(email_text)
+    return analyzer.analyze_email(email_text, deadline=deadline, omitted=omitted)
 
 def get_model_info() -> Dict[str, Any]:
     """Get information about available models"""
     analyzer = get_analyzer()
+    residency = analyzer.residency.report()
     models = []
     
     for analyzer_instance in analyzer.analyzers:
         # Check if the model is actually loaded
-        if hasattr(analyzer_instance, 'model') and analyzer_instance.model is not None:
+        if analyzer_instance.model_name in residency:
+            # Evicted models are reloaded on the next scan that needs them
+            status = 'loaded' if residency[analyzer_instance.model_name]['resident'] else 'evicted'
+        elif hasattr(analyzer_instance, 'model') and analyzer_instance.model is not None:
             status = 'loaded'
         elif hasattr(analyzer_instance, 'detector') and analyzer_instance.detector is not None:
             status = 'loaded'
@@ -554,15 +893,19 @@ def get_model_info() -> Dict[str, Any]:
         else:
             status = 'available'  # Rule-based or other non-ML analyzers
         
-        models.append({
+        model = {
             'name': analyzer_instance.model_name,
             'source': analyzer_instance.model_source,
             'status': status
-        })
+        }
+        if analyzer_instance.model_name in residency:
+            model['resident_bytes'] = residency[analyzer_instance.model_name]['resident_bytes']
+            model['dtype'] = residency[analyzer_instance.model_name]['dtype']
+        models.append(model)
     
     # Check if we have any ML models loaded
     ml_models_loaded = any(
-        m['status'] == 'loaded' and m['source'] != 'Rule-based' 
+        m['status'] in ('loaded', 'evicted') and m['source'] != 'Rule-based' 
         for m in models
     )
     
@@ -574,6 +917,14 @@ def get_model_info() -> Dict[str, Any]:
         'primary_model': 'phishing-detection-py' if PHISHING_DETECTOR_AVAILABLE else 'rule-based'
     }
 
+def get_model_residency() -> Dict[str, Dict[str, Any]]:
+    """Get residency, resident memory and usage of each evictable model"""
+    return get_analyzer().residency.report()
+
+def get_model_registry_version() -> int:
+    """Get a counter that changes whenever get_model_info() would change"""
+    return get_analyzer().registry_version
+
 def add_custom_analyzer(analyzer: ModelAnalyzer):
     """Add a custom analyzer to the global analyzer"""
     global_analyzer = get_analyzer()
@@ -0,0 +1,413 @@
+# ai/inference_server.py
+"""
+Standalone inference server shared by API workers
+
+Runs EmailAnalyzer in its own process behind a Unix socket, so API workers
+do not hold the models and can be scaled separately. Scans arriving from all
+workers are queued and analyzed in batches (EmailAnalyzer.analyze_batch):
+while one batch runs, the next one fills up, and each batch waits at most
+INFERENCE_BATCH_WAIT_MS for more requests once it is started.
+
+Protocol: every message is a 4-byte big-endian length followed by a msgpack
+map, or a JSON object when msgpack is not installed (the server answers in
+the encoding of the request). Requests:
+
+    {"id": 7, "op": "scan", "text": "...", "deadline_ms": 450.0}
+    {"id": 8, "op": "info"}
+    
+Responses carry the same id:
+
+    {"id": 7, "results": [...], "omitted": [...], "timings": [[stage, seconds], ...]}
+    {"id": 8, "models": {...}, "registry_version": 3, "residency": {...}}
+    {"id": 9, "error": "..."}
+    
+deadline_ms is the remaining budget when the request was sent. Requests on
+one connection may be pipelined; responses can come back in any order.
+
+The backend uses the server when INFERENCE_SOCKET is set (backend/scan.py).
+
+Usage:
+    python inference_server.py --socket /tmp/email_guard_inference.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Unix socket the server listens on and clients connect to
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "/tmp/email_guard_inference.sock")
+
+# Most emails analyzed in one batch
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+
+# How long a started batch waits for more requests
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "2"))
+
+# Connections each client keeps open to the server
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "8"))
+
+# Client timeout in seconds for one request without a deadline
+INFERENCE_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", "30"))
+
+# Largest accepted message
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+def encode(message: Dict[str, Any], use_msgpack: bool = MSGPACK_AVAILABLE) -> bytes:
+    """Serialize one message with its length prefix"""
+    payload = msgpack.packb(message, use_bin_type=True) if use_msgpack else json.dumps(message).encode()
+    return _LENGTH.pack(len(payload)) + payload
+
+def decode(payload: bytes) -> Tuple[Dict[str, Any], bool]:
+    """
+    Parse one message body
+    
+    Returns:
+        (message, whether it was msgpack)
+        
+    Raises:
+        ValueError: If the body is neither a msgpack map nor a JSON object
+    """
+    if payload[:1] == b"{":
+        return json.loads(payload), False
+    if not MSGPACK_AVAILABLE:
+        raise ValueError("msgpack message received but msgpack is not installed")
+    message = msgpack.unpackb(payload, raw=False)
+    if not isinstance(message, dict):
+        raise ValueError("message must be a map")
+    return message, True
+
+class _Pending:
+    """A scan waiting in the batch queue"""
+    
+    def __init__(self, text: str, deadline: Optional[float], future: "asyncio.Future"):
+        self.text = text
+        self.deadline = deadline
+        self.future = future
+
+class InferenceServer:
+    """
+    Serves EmailAnalyzer over a Unix socket with server-side batching
+    
+    Args:
+        analyzer: EmailAnalyzer (or anything with analyze_batch)
+        socket_path: Where to listen
+        max_batch: Most emails per batch
+        batch_wait_ms: How long a started batch waits for more requests
+    """
+    
+    def __init__(self, analyzer, socket_path: str = INFERENCE_SOCKET,
+                 max_batch: int = INFERENCE_MAX_BATCH, batch_wait_ms: float = INFERENCE_BATCH_WAIT_MS):
+        self.analyzer = analyzer
+        self.socket_path = socket_path
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.batches = 0
+        self.scans = 0
+        self._queue = None
+        self._server = None
+        self._batcher = None
+        # Batches run one at a time; torch parallelizes within each one
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="inference")
+    
+    async def start(self):
+        """Listen on the socket and start the batcher"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._queue = asyncio.Queue()
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        self._batcher = asyncio.ensure_future(self._run_batches())
+        print(f"Inference server listening on {self.socket_path}")
+    
+    async def stop(self):
+        """Stop accepting connections and remove the socket"""
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        self._executor.shutdown(wait=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_LENGTH.size)
+                except asyncio.IncompleteReadError:
+                    break
+                (length,) = _LENGTH.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    print(f"Closing connection: {length} byte message exceeds {MAX_FRAME_BYTES}")
+                    break
+                payload = await reader.readexactly(length)
+                task = asyncio.ensure_future(self._respond(payload, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+    
+    async def _respond(self, payload: bytes, writer: asyncio.StreamWriter):
+        use_msgpack = MSGPACK_AVAILABLE
+        request_id = None
+        try:
+            request, use_msgpack = decode(payload)
+            request_id = request.get('id')
+            response = await self._dispatch(request)
+        except Exception as e:
+            response = {'error': f"{type(e).__name__}: {e}"}
+        response['id'] = request_id
+        if not writer.is_closing():
+            writer.write(encode(response, use_msgpack))
+            await writer.drain()
+    
+    async def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op', 'scan')
+        if op == 'info':
+            import email_guard
+            return {
+                'models': email_guard.get_model_info(),
+                'registry_version': email_guard.get_model_registry_version(),
+                'residency': email_guard.get_model_residency(),
+                'batches': self.batches,
+                'scans': self.scans
+            }
+        if op != 'scan':
+            raise ValueError(f"unknown op {op!r}")
+        
+        text = request.get('text')
+        if not isinstance(text, str):
+            raise ValueError("scan needs a text")
+        deadline_ms = request.get('deadline_ms')
+        deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms is not None else None
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(text, deadline, future))
+        results, omitted, timings = await future
+        return {'results': results, 'omitted': omitted, 'timings': timings}
+    
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            wait_until = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    remaining = wait_until - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+            
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._analyze, batch)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.scans += len(batch)
+            for pending, outcome in zip(batch, outcomes):
+                if not pending.future.done():
+                    pending.future.set_result(outcome)
+    
+    def _analyze(self, batch: List[_Pending]) -> List[Tuple[List[Dict[str, Any]], List[str], List[Tuple[str, float]]]]:
+        """Run one batch on the inference thread"""
+        from email_guard import collect_stage_timings
+        omitted = [[] for _ in batch]
+        with collect_stage_timings() as timings:
+            results = self.analyzer.analyze_batch(
+                [pending.text for pending in batch],
+                deadlines=[pending.deadline for pending in batch],
+                omitted=omitted
+            )
+        # Every email in the batch waited for all of its stages
+        timings = [[name, seconds] for name, seconds in timings]
+        return [(result, skipped, timings) for result, skipped in zip(results, omitted)]
+
+class InferenceClient:
+    """
+    Blocking client with a pool of connections to an InferenceServer
+    
+    Safe to use from many threads; each request takes a connection from the
+    pool for its duration. Connections opened before a fork are not reused
+    in the child.
+    
+    Args:
+        socket_path: Server socket
+        pool_size: Connections kept open at most
+        timeout: Seconds to wait for a response when the request has no deadline
+    """
+    
+    def __init__(self, socket_path: str = INFERENCE_SOCKET, pool_size: int = INFERENCE_POOL_SIZE,
+                 timeout: float = INFERENCE_TIMEOUT_S):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self._pid = os.getpid()
+    
+    def _connect(self) -> socket.socket:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+    
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            # The parent's sockets would interleave with the child's traffic
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+    
+    def request(self, message: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Send one request and wait for its response
+        
+        Raises:
+            OSError: If the server cannot be reached or does not answer in time
+            RuntimeError: If the server reports an error
+        """
+        self._reset_after_fork()
+        with self._id_lock:
+            self._next_id += 1
+            message = dict(message, id=self._next_id)
+        
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.settimeout(timeout if timeout is not None else self.timeout)
+                conn.sendall(encode(message))
+                response = self._receive(conn)
+            except BaseException:
+                # The stream may hold a partial or late response; never reuse it
+                conn.close()
+                raise
+            self._idle.put(conn)
+        
+        if response.get('id') != message['id']:
+            raise RuntimeError("inference server response out of order")
+        if 'error' in response:
+            raise RuntimeError(f"inference server error: {response['error']}")
+        return response
+    
+    def _receive(self, conn: socket.socket) -> Dict[str, Any]:
+        (length,) = _LENGTH.unpack(self._read_exactly(conn, _LENGTH.size))
+        if length > MAX_FRAME_BYTES:
+            raise OSError(f"{length} byte response exceeds {MAX_FRAME_BYTES}")
+        return decode(self._read_exactly(conn, length))[0]
+    
+    def _read_exactly(self, conn: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("inference server closed the connection")
+            data.extend(chunk)
+        return bytes(data)
+    
+    def analyze(self, email_text: str, deadline: Optional[float] = None,
+                omitted: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[Tuple[str, float]]]:
+        """
+        Analyze one email on the server
+        
+        Args:
+            email_text: Email text to analyze
+            deadline: Optional time.monotonic() deadline, sent as the remaining budget
+            omitted: Optional list that receives the names of skipped analyzers
+            
+        Returns:
+            (results, stage timings)
+        """
+        message = {'op': 'scan', 'text': email_text}
+        timeout = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            message['deadline_ms'] = max(0.0, remaining * 1000.0)
+            # Allow for the analyzer that is already running when the deadline passes
+            timeout = max(remaining, 0.0) + self.timeout
+        response = self.request(message, timeout)
+        if omitted is not None:
+            omitted.extend(response.get('omitted', []))
+        return response.get('results', []), [tuple(timing) for timing in response.get('timings', [])]
+    
+    def info(self) -> Dict[str, Any]:
+        """Model info, registry version and residency from the server"""
+        return self.request({'op': 'info'})
+    
+    def close(self):
+        """Close idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+async def serve(socket_path: str, max_batch: int, batch_wait_ms: float, threads: int = 0):
+    """
+    Load the analyzers and serve until SIGTERM or SIGINT
+    
+    The process is pinned to the CPUs it may use (within its cgroup quota)
+    with `threads` torch threads, by default one per physical core.
+    """
+    import email_guard
+    import cpu_topology
+    analyzer = email_guard.get_analyzer()
+    groups = cpu_topology.usable_core_groups()
+    cpu_topology.pin_current_process([cpu for group in groups for cpu in group], threads or len(groups))
+    server = InferenceServer(analyzer, socket_path, max_batch, batch_wait_ms)
+    await server.start()
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+    await server.stop()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve EmailAnalyzer to API workers over a Unix socket")
+    parser.add_argument("--socket", default=INFERENCE_SOCKET, help="Socket path (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=INFERENCE_MAX_BATCH)
+    parser.add_argument("--batch-wait-ms", type=float, default=INFERENCE_BATCH_WAIT_MS)
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Torch intra-op threads (default: one per usable physical core)")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.socket, args.max_batch, args.batch_wait_ms, args.threads))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
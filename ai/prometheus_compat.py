@@ -0,0 +1,49 @@
+# ai/prometheus_compat.py
+"""
+Prometheus metric classes, or no-op stand-ins when prometheus_client is missing
+
+Shared by the analyzers (email_guard.py) and the backend's metrics module
+(backend/modules/metrics.py), so metrics can be declared unconditionally.
+"""
+
+from contextlib import contextmanager
+
+# Try to import prometheus_client
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    print("Warning: prometheus_client not available. Metrics are disabled.")
+
+class _NoopMetric:
+    """Stand-in for prometheus metrics when prometheus_client is missing"""
+    
+    def __init__(self, *args, **kwargs):
+        pass
+    
+    def labels(self, *args, **kwargs):
+        return self
+    
+    def inc(self, amount: float = 1):
+        pass
+    
+    def dec(self, amount: float = 1):
+        pass
+    
+    def set(self, value: float):
+        pass
+    
+    def observe(self, value: float):
+        pass
+    
+    @contextmanager
+    def time(self):
+        yield
+    
+    @contextmanager
+    def track_inprogress(self):
+        yield
+
+if not PROMETHEUS_AVAILABLE:
+    Counter = Gauge = Histogram = _NoopMetric
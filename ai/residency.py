@@ -0,0 +1,229 @@
+# ai/residency.py
+"""
+Model residency: memory budget, idle eviction and on-demand reloading
+
+EmailAnalyzer registers every analyzer that can drop its weights (one with
+load_model(), unload(), is_loaded() and resident_bytes()). The manager keeps
+the total resident size under MODEL_MEMORY_BUDGET_MB by evicting the least
+recently used idle models, evicts models idle for MODEL_IDLE_EVICT_S, and
+reloads an evicted model the next time it is needed. Concurrent requests for
+the same evicted model share a single reload.
+
+The budget is a soft cap: a model that is being used is never evicted, so
+the total can exceed the budget while every other model is busy.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Optional
+
+# Total bytes of resident model weights (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+
+# Seconds a model may stay unused before it is evicted (0 = never)
+MODEL_IDLE_EVICT_S = float(os.getenv("MODEL_IDLE_EVICT_S", "0"))
+
+class _Residency:
+    """Bookkeeping for one managed analyzer"""
+    
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        # Size of the weights when last resident, used to plan reloads
+        self.size_bytes = analyzer.resident_bytes() if analyzer.is_loaded() else 0
+        self.loads = 1 if analyzer.is_loaded() else 0
+        self.evictions = 0
+        self.load_lock = threading.Lock()
+
+class ModelResidencyManager:
+    """
+    Decides which models stay in memory
+    
+    Args:
+        budget_bytes: Soft cap on resident model bytes (0 = unlimited)
+        idle_evict_s: Evict models unused for this long (0 = never)
+        on_change: Called with (model_name, 'load' | 'evict', resident_bytes)
+            whenever a model is loaded or evicted
+    """
+    
+    def __init__(self, budget_bytes: int = MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+                 idle_evict_s: float = MODEL_IDLE_EVICT_S,
+                 on_change: Optional[Callable[[str, str, int], None]] = None):
+        self.budget_bytes = budget_bytes
+        self.idle_evict_s = idle_evict_s
+        self.on_change = on_change
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def register(self, analyzer):
+        """Manage an analyzer, evicting others if it pushes the total over budget"""
+        with self._lock:
+            self._states[analyzer.model_name] = state = _Residency(analyzer)
+            evicted = self._make_room(state, 0)
+        self._notify(evicted)
+    
+    @contextmanager
+    def acquire(self, analyzer):
+        """
+        Keep an analyzer resident for the duration of the block
+        
+        Reloads the model first if it was evicted. Only one thread performs
+        the reload; others needing the same model wait for it.
+        """
+        state = self._states.get(analyzer.model_name)
+        if state is None:
+            yield
+            return
+        
+        with self._lock:
+            state.in_use += 1
+            state.last_used = time.monotonic()
+        try:
+            if not analyzer.is_loaded():
+                self._reload(state)
+            yield
+        finally:
+            with self._lock:
+                state.in_use -= 1
+                state.last_used = time.monotonic()
+    
+    def _reload(self, state: _Residency):
+        with state.load_lock:
+            if state.analyzer.is_loaded():
+                # Another thread reloaded it while we waited
+                return
+            with self._lock:
+                evicted = self._make_room(state, state.size_bytes or state.analyzer.estimated_bytes())
+            self._notify(evicted)
+            
+            state.analyzer.load_model()
+            if not state.analyzer.is_loaded():
+                return
+            with self._lock:
+                state.size_bytes = state.analyzer.resident_bytes()
+                state.loads += 1
+            self._notify([], loaded=state)
+    
+    def _make_room(self, state: _Residency, incoming_bytes: int) -> List[_Residency]:
+        """Evict least recently used idle models until incoming_bytes fits (lock held)"""
+        if self.budget_bytes <= 0:
+            return []
+        total = incoming_bytes + sum(
+            other.size_bytes for other in self._states.values() if other.analyzer.is_loaded()
+        )
+        evicted = []
+        candidates = sorted(
+            (other for other in self._states.values()
+             if other is not state and other.in_use == 0 and other.analyzer.is_loaded()),
+            key=lambda other: other.last_used
+        )
+        for other in candidates:
+            if total <= self.budget_bytes:
+                break
+            self._evict_locked(other)
+            total -= other.size_bytes
+            evicted.append(other)
+        if total > self.budget_bytes:
+            print(f"Model memory {total / 2**20:.0f} MB exceeds budget "
+                  f"{self.budget_bytes / 2**20:.0f} MB while other models are in use")
+        return evicted
+    
+    def _evict_locked(self, state: _Residency):
+        state.analyzer.unload()
+        state.evictions += 1
+    
+    def evict(self, model_name: str) -> bool:
+        """Evict one model now if it is not in use"""
+        with self._lock:
+            state = self._states.get(model_name)
+            if state is None or state.in_use or not state.analyzer.is_loaded():
+                return False
+            self._evict_locked(state)
+        self._notify([state])
+        return True
+    
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """Evict every model unused for longer than idle_evict_s"""
+        if self.idle_evict_s <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        evicted = []
+        with self._lock:
+            for state in self._states.values():
+                if state.in_use == 0 and state.analyzer.is_loaded() and now - state.last_used >= self.idle_evict_s:
+                    self._evict_locked(state)
+                    evicted.append(state)
+        self._notify(evicted)
+        return [state.analyzer.model_name for state in evicted]
+    
+    def _notify(self, evicted: List[_Residency], loaded: Optional[_Residency] = None):
+        for state in evicted:
+            print(f"Evicted model {state.analyzer.model_name} ({state.size_bytes / 2**20:.1f} MB)")
+            if self.on_change is not None:
+                self.on_change(state.analyzer.model_name, 'evict', 0)
+        if loaded is not None:
+            print(f"Reloaded model {loaded.analyzer.model_name} ({loaded.size_bytes / 2**20:.1f} MB)")
+            if self.on_change is not None:
+                self.on_change(loaded.analyzer.model_name, 'load', loaded.size_bytes)
+    
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Residency and resident memory per managed model"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'resident': state.analyzer.is_loaded(),
+                    'resident_bytes': state.size_bytes if state.analyzer.is_loaded() else 0,
+                    'dtype': state.analyzer.dtype_name(),
+                    'in_use': state.in_use,
+                    'idle_seconds': now - state.last_used,
+                    'loads': state.loads,
+                    'evictions': state.evictions
+                }
+                for name, state in self._states.items()
+            }
+    
+    def start(self):
+        """Start evicting idle models in the background (no-op if idle eviction is off)"""
+        if self.idle_evict_s <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-residency", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def after_fork(self):
+        """
+        Reset locks and restart the background thread in a forked child
+        
+        Threads do not survive fork, and a lock held by one of the parent's
+        threads at fork time would never be released in the child.
+        """
+        self._lock = threading.Lock()
+        for state in self._states.values():
+            state.load_lock = threading.Lock()
+            state.in_use = 0
+        running = self._thread is not None
+        self._thread = None
+        self._stop = threading.Event()
+        if running:
+            self.start()
+    
+    def _run(self):
+        interval = min(60.0, max(1.0, self.idle_evict_s / 4))
+        while not self._stop.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"Idle model eviction failed: {e}")
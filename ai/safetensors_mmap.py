@@ -0,0 +1,169 @@
+# ai/safetensors_mmap.py
+"""
+Memory-mapped model loading from safetensors checkpoints
+
+from_pretrained reads the checkpoint and copies every weight into private
+process memory. Here the checkpoint file is mapped copy-on-write
+(torch.UntypedStorage.from_file with shared=False) and the model's
+parameters are views into that mapping: pages are read lazily on first use
+and shared through the page cache by every process that maps the same file,
+including uvicorn workers and restarted processes.
+
+Checkpoints are converted once when needed and the result is kept next to
+the original:
+- pytorch_model.bin -> model.safetensors
+- model.safetensors -> model.<dtype>.safetensors for reduced precision
+"""
+
+import json
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import torch
+
+CHECKPOINT_FILE = "model.safetensors"
+LEGACY_CHECKPOINT_FILE = "pytorch_model.bin"
+
+# safetensors dtype names
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+def read_header(path: str) -> Tuple[Dict[str, dict], int]:
+    """
+    Read a safetensors header
+    
+    Returns:
+        (tensor name -> {dtype, shape, data_offsets}, byte offset of the data section)
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+    return header, 8 + header_size
+
+def mmap_state_dict(path: str) -> Dict[str, "torch.Tensor"]:
+    """
+    Map a safetensors file copy-on-write and return tensors that view into it
+    
+    Tensors whose offset is not aligned to their element size (not produced
+    by the safetensors writer in practice) are copied instead.
+    """
+    header, data_offset = read_header(path)
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    state_dict = {}
+    for name, info in header.items():
+        dtype = _DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        start = data_offset + begin
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if start % itemsize:
+            raw = bytes(storage[start:data_offset + end])
+            tensor = torch.frombuffer(bytearray(raw), dtype=dtype) if raw else torch.empty(0, dtype=dtype)
+            state_dict[name] = tensor.reshape(info['shape'])
+            continue
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(storage, start // itemsize, tuple(info['shape']))
+        state_dict[name] = tensor
+    return state_dict
+
+def _save_atomic(tensors: Dict[str, "torch.Tensor"], path: str):
+    from safetensors.torch import save_file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    save_file({name: tensor.contiguous() for name, tensor in tensors.items()}, tmp_path, metadata={'format': 'pt'})
+    os.replace(tmp_path, path)
+
+def checkpoint_path(model_dir: str, dtype: Optional["torch.dtype"] = None) -> str:
+    """
+    Path of the safetensors file to map for model_dir, converting once if needed
+    
+    Args:
+        model_dir: HuggingFace model directory
+        dtype: Floating point dtype to keep the weights in (None keeps the checkpoint's)
+        
+    Raises:
+        FileNotFoundError: If the directory has no single-file checkpoint
+        OSError: If a needed conversion cannot be written
+    """
+    path = os.path.join(model_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        legacy_path = os.path.join(model_dir, LEGACY_CHECKPOINT_FILE)
+        if not os.path.exists(legacy_path):
+            raise FileNotFoundError(f"No {CHECKPOINT_FILE} or {LEGACY_CHECKPOINT_FILE} in {model_dir}")
+        print(f"Converting {legacy_path} to safetensors")
+        _save_atomic(torch.load(legacy_path, map_location="cpu", weights_only=True, mmap=True), path)
+    
+    if dtype is None:
+        return path
+    header, _ = read_header(path)
+    if all(_DTYPES[info['dtype']] == dtype or not _DTYPES[info['dtype']].is_floating_point
+           for info in header.values()):
+        return path
+    
+    converted_path = os.path.join(model_dir, f"model.{str(dtype).replace('torch.', '')}.safetensors")
+    if not os.path.exists(converted_path) or os.path.getmtime(converted_path) < os.path.getmtime(path):
+        print(f"Converting {path} to {dtype}")
+        _save_atomic({
+            name: tensor.to(dtype) if tensor.is_floating_point() else tensor
+            for name, tensor in mmap_state_dict(path).items()
+        }, converted_path)
+    return converted_path
+
+def _non_persistent_value(name: str, buffer: "torch.Tensor") -> Optional["torch.Tensor"]:
+    """Recompute a buffer that checkpoints do not store, from its meta shape and dtype"""
+    if name == "position_ids":
+        return torch.arange(buffer.shape[-1], dtype=buffer.dtype).expand(buffer.shape)
+    if name == "token_type_ids":
+        return torch.zeros(buffer.shape, dtype=buffer.dtype)
+    return None
+
+def _materialize_non_persistent_buffers(model: "torch.nn.Module"):
+    """
+    Replace the meta tensors of non-persistent buffers with real values
+    
+    Raises:
+        ValueError: For a non-persistent buffer whose value is not known here
+    """
+    for module_name, module in model.named_modules():
+        for name in module._non_persistent_buffers_set:
+            buffer = module._buffers.get(name)
+            if buffer is None or not buffer.is_meta:
+                continue
+            value = _non_persistent_value(name, buffer)
+            if value is None:
+                raise ValueError(f"Cannot recreate non-persistent buffer {module_name}.{name}")
+            module.register_buffer(name, value, persistent=False)
+
+def load_mmap_model(model_dir: str, dtype: Optional["torch.dtype"] = None):
+    """
+    Build a sequence classifier whose weights are mapped from its safetensors file
+    
+    The model is constructed on the meta device and the mapped tensors are
+    assigned in place of its parameters and buffers, so no weights are
+    initialized or copied. Buffers that checkpoints do not store (e.g.
+    position_ids) are recomputed.
+    
+    Raises:
+        FileNotFoundError, OSError: If the checkpoint is missing or cannot be converted
+        ValueError: If some weights are not in the checkpoint
+    """
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    
+    path = checkpoint_path(model_dir, dtype)
+    config = AutoConfig.from_pretrained(model_dir, local_files_only=True)
+    with torch.device("meta"):
+        model = AutoModelForSequenceClassification.from_config(config)
+    
+    _materialize_non_persistent_buffers(model)
+    model.load_state_dict(mmap_state_dict(path), strict=False, assign=True)
+    if hasattr(model, 'tie_weights'):
+        model.tie_weights()
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+               if tensor.is_meta]
+    if missing:
+        raise ValueError(f"{path} has no weights for: {', '.join(missing[:5])}")
+    model.eval()
+    return model
@@ -0,0 +1,105 @@
+# ai/tiny_models.py
+"""
+Tiny offline stand-ins for the HuggingFace models
+
+Creates small, randomly initialized DistilBERT classifiers and WordPiece
+tokenizers in the same directory layout and label layout as the real
+models, so everything that loads or runs them (batching, quantization,
+concurrency, benchmarks) can be exercised on CPU without downloading
+weights. Predictions are meaningless.
+
+Usage:
+    python tiny_models.py /tmp/tiny-models
+    EMAIL_GUARD_MODELS_DIR=/tmp/tiny-models python email_guard.py
+"""
+
+import json
+import os
+import string
+import sys
+from typing import Dict, List
+
+from email_guard import CYBERSECTONY_MODEL_DIR, AAMOSH_MODEL_DIR
+
+# Label layouts of the real checkpoints
+TINY_MODELS = {
+    CYBERSECTONY_MODEL_DIR: ["legitimate_email", "phishing_url", "legitimate_url", "phishing_url_alt"],
+    AAMOSH_MODEL_DIR: ["legitimate", "phishing"],
+}
+
+# Common words so typical emails tokenize into more than [UNK] and single letters
+_WORDS = """
+the a an and or to of in on for from with at by is are was be this that your you we our
+it not have has will can please click here link account password verify bank payment
+urgent immediately suspended login security update information email message team
+meeting thanks hello hi dear regards report attached free offer win winner prize money
+http https www com net org tk invoice order delivery customer service support
+""".split()
+
+def build_vocab() -> List[str]:
+    """WordPiece vocabulary: special tokens, characters, continuation pieces and common words"""
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    characters = list(string.ascii_lowercase + string.digits + string.punctuation)
+    pieces = ["##" + character for character in string.ascii_lowercase + string.digits]
+    words = [word for word in dict.fromkeys(_WORDS) if word not in characters]
+    return specials + characters + pieces + words
+
+def create_tiny_model(path: str, labels: List[str], seed: int = 0, dim: int = 32, layers: int = 2):
+    """
+    Write one randomly initialized DistilBERT classifier and its tokenizer to path
+    
+    Args:
+        path: Output directory (created if needed)
+        labels: Class labels, in output order
+        seed: Weight initialization seed
+        dim: Hidden size
+        layers: Transformer layers
+    """
+    import torch
+    from transformers import DistilBertConfig, DistilBertForSequenceClassification
+    
+    os.makedirs(path, exist_ok=True)
+    vocab = build_vocab()
+    with open(os.path.join(path, "vocab.txt"), "w") as f:
+        f.write("\n".join(vocab) + "\n")
+    with open(os.path.join(path, "tokenizer_config.json"), "w") as f:
+        json.dump({
+            "tokenizer_class": "DistilBertTokenizer",
+            "do_lower_case": True,
+            "model_max_length": 512
+        }, f, indent=2)
+    
+    config = DistilBertConfig(
+        vocab_size=len(vocab),
+        dim=dim,
+        n_layers=layers,
+        n_heads=2,
+        hidden_dim=dim * 2,
+        max_position_embeddings=512,
+        num_labels=len(labels),
+        id2label={index: label for index, label in enumerate(labels)},
+        label2id={label: index for index, label in enumerate(labels)}
+    )
+    with torch.random.fork_rng():
+        torch.manual_seed(seed)
+        model = DistilBertForSequenceClassification(config)
+    model.save_pretrained(path)
+
+def create_tiny_models(models_dir: str, seed: int = 0, **kwargs) -> Dict[str, str]:
+    """
+    Create every tiny model under models_dir, in the layout email_guard expects
+    
+    Returns:
+        Mapping of model directory name to its path
+    """
+    paths = {}
+    for offset, (name, labels) in enumerate(TINY_MODELS.items()):
+        paths[name] = os.path.join(models_dir, name)
+        create_tiny_model(paths[name], labels, seed=seed + offset, **kwargs)
+    return paths
+
+if __name__ == "__main__":
+    # Usage: python tiny_models.py <models_dir>
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else "tiny-models"
+    for name, model_path in create_tiny_models(target_dir).items():
+        print(f"Created {name} at {model_path}")
@@ -1,18 +1,66 @@
 ﻿from fastapi import FastAPI, HTTPException, Depends, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 import os
+import time
 from datetime import datetime, timedelta
+import hashlib
 import json
 from typing import List, Optional
 
-from modules.authenticate import authenticate_token, create_jwt_token, verify_jwt_token
+from modules.authenticate import (
+    authenticate_token, create_jwt_token,
+    get_token_index, install_token_reload_signal
+)
+from modules.dependencies import get_current_user, require_admin
+from modules.history_store import get_history_store, migrate_json_history_once
+from modules.history_writer import get_history_writer
+from modules.history_compactor import get_history_compactor
+from modules.analytics import export_history, model_disagreements
+from modules.history_export import EXPORT_MEDIA_TYPES, export_chunks
+from modules.metrics import (
+    SCAN_REQUESTS_IN_FLIGHT, SCAN_REQUEST_SECONDS, SCAN_ERRORS, SANITIZER_REJECTIONS,
+    CONTENT_TYPE_LATEST, render_metrics
+)
+from modules.profiling import get_profiler
+from modules.capture import get_scan_capture
+from modules.timing import ServerTiming
 from modules.verify import verify_and_sanitize_input
-from scan import scan_email, save_scan_history, get_scan_history
+from modules.history_store import MAX_PAGE_SIZE, MAX_STATS_DAYS
+from scan import (
+    scan_email, save_scan_history, get_scan_history_page, get_scan_history_etag,
+    get_scan_stats, iter_scan_history, models_available, get_model_status,
+    get_model_residency
+)
 
 app = FastAPI(title="Email Guard API", version="1.0.0")
 
+# Default scan time budget in milliseconds (0 means no deadline)
+SCAN_DEADLINE_MS = int(os.getenv("SCAN_DEADLINE_MS", "0"))
+SCAN_DEADLINE_HEADER = "X-Scan-Deadline-Ms"
+
+@app.on_event("startup")
+async def load_token_index():
+    """Load the token index once and reload it on SIGHUP"""
+    get_token_index().refresh()
+    install_token_reload_signal()
+
+@app.on_event("startup")
+async def open_history_store():
+    """Open the history database, importing legacy JSON history on first run"""
+    try:
+        migrate_json_history_once(get_history_store())
+    except Exception as e:
+        print(f"History migration failed: {e}")
+    get_history_compactor().start()
+
+@app.on_event("shutdown")
+async def drain_history_writer():
+    """Commit queued history entries before the process exits"""
+    get_history_compactor().stop(timeout=30)
+    get_history_writer().stop(timeout=30)
+    get_scan_capture().close()
 
 
 # Pydantic models
@@ -33,6 +81,19 @@ class ScanResponse(BaseModel):
     results: List[ModelResult]
     timestamp: str
     email_snippet: str
+    omitted_analyzers: List[str] = []
+
+class ProfilingConfig(BaseModel):
+    sample_rate: float
+    max_profiles: Optional[int] = None
+
+class CaptureConfig(BaseModel):
+    sample_rate: float
+    max_bytes: Optional[int] = None
+
+class RetentionConfig(BaseModel):
+    ttl_days: Optional[int] = None
+    max_entries: Optional[int] = None
 
 
 
@@ -66,74 +127,206 @@ async def authenticate_user(request: TokenRequest, response: Response, req: Requ
         raise HTTPException(status_code=500, detail=f"Authentication failed: {str(e)}")
 
 @app.post("/scan/email")
-async def scan_email_endpoint(request: EmailScanRequest, req: Request):
-    """Scan email text for phishing/spam detection"""
-    try:
-        # Get JWT from cookie
-        auth_cookie = req.cookies.get("auth_token")
-        if not auth_cookie:
-            raise HTTPException(status_code=401, detail="Authentication required")
-        
-        # Verify JWT
-        user_info = verify_jwt_token(auth_cookie)
-        if not user_info:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-        
-        # Verify and sanitize input
-        sanitized_text = verify_and_sanitize_input(request.email_text)
-        
-        # Scan email using AI models
-        scan_results = scan_email(sanitized_text)
-        
-        # Check if we got any results
-        if not scan_results:
-            raise HTTPException(
-                status_code=503, 
-                detail="AI models are not ready or failed to analyze. Please try again in a moment."
-            )
-        
-        # Save to history
-        save_scan_history(user_info['sub'], sanitized_text, scan_results)
-        
-        # Create response
-        response_data = ScanResponse(
-            results=scan_results,
-            timestamp=datetime.now().isoformat(),
-            email_snippet=sanitized_text[:200] + "..." if len(sanitized_text) > 200 else sanitized_text
-        )
-        
-        return response_data
+def scan_email_endpoint(request: EmailScanRequest, req: Request, response: Response, user_info: dict = Depends(get_current_user)):
+    """
+    Scan email text for phishing/spam detection
     
+    A plain def handler: scans block (on the models or the inference server
+    socket), so they run in the threadpool and several can be in flight.
+    """
+    SCAN_REQUESTS_IN_FLIGHT.inc()
+    arrival = time.time()
+    request_start = time.perf_counter()
+    timing = ServerTiming()
+    timing.add("auth", getattr(req.state, "auth_seconds", 0.0))
+    try:
+        deadline = _scan_deadline(req)
+        with get_profiler().maybe_profile("scan_email"):
+            return _run_scan(request, response, user_info, timing, deadline,
+                             arrival=arrival, deadline_ms=_requested_deadline_ms(req))
     except HTTPException:
         raise
     except Exception as e:
+        SCAN_ERRORS.labels("exception").inc()
         print(f"Scan error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Scan failed: {str(e)}")
+    finally:
+        SCAN_REQUESTS_IN_FLIGHT.dec()
+        SCAN_REQUEST_SECONDS.observe(time.perf_counter() - request_start)
+
+def _scan_deadline(req: Request) -> Optional[float]:
+    """
+    Work out the time.monotonic() deadline for a scan request
+    
+    The budget comes from the X-Scan-Deadline-Ms header, capped by the
+    SCAN_DEADLINE_MS server default when both are set.
+    """
+    budget_ms = SCAN_DEADLINE_MS if SCAN_DEADLINE_MS > 0 else None
+    
+    header_value = req.headers.get(SCAN_DEADLINE_HEADER)
+    if header_value is not None:
+        try:
+            header_ms = int(header_value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{SCAN_DEADLINE_HEADER} must be an integer")
+        if header_ms <= 0:
+            raise HTTPException(status_code=400, detail=f"{SCAN_DEADLINE_HEADER} must be positive")
+        budget_ms = header_ms if budget_ms is None else min(budget_ms, header_ms)
+    
+    if budget_ms is None:
+        return None
+    return time.monotonic() + budget_ms / 1000.0
+
+def _requested_deadline_ms(req: Request) -> Optional[int]:
+    """The client's X-Scan-Deadline-Ms, already validated by _scan_deadline"""
+    header_value = req.headers.get(SCAN_DEADLINE_HEADER)
+    return int(header_value) if header_value is not None else None
+
+def _run_scan(request: EmailScanRequest, response: Response, user_info: dict,
+              timing: ServerTiming, deadline: Optional[float],
+              arrival: Optional[float] = None, deadline_ms: Optional[int] = None) -> ScanResponse:
+    """Sanitize, scan and record one email, filling in stage timings"""
+    # Verify and sanitize input
+    try:
+        with timing.stage("verify"):
+            sanitized_text = verify_and_sanitize_input(request.email_text)
+    except ValueError:
+        SANITIZER_REJECTIONS.inc()
+        raise
+    
+    # Record the input for replay if traffic capture is enabled
+    if arrival is not None:
+        get_scan_capture().record(arrival, sanitized_text, deadline_ms)
+    
+    # Scan email using AI models, skipping analyzers that would miss the deadline
+    omitted = []
+    with timing.stage("scan"):
+        scan_results = scan_email(sanitized_text, timing, deadline=deadline, omitted=omitted)
+    
+    # Check if we got any results
+    if not scan_results and omitted:
+        SCAN_ERRORS.labels("deadline").inc()
+        raise HTTPException(
+            status_code=504,
+            detail=f"No analyzer could finish within the scan deadline (skipped: {', '.join(omitted)})"
+        )
+    if not scan_results:
+        SCAN_ERRORS.labels("models_unavailable").inc()
+        raise HTTPException(
+            status_code=503, 
+            detail="AI models are not ready or failed to analyze. Please try again in a moment."
+        )
+    
+    # Save to history
+    with timing.stage("history"):
+        save_scan_history(user_info['sub'], sanitized_text, scan_results)
+    
+    response.headers["Server-Timing"] = timing.header_value()
+    
+    # Create response
+    return ScanResponse(
+        results=scan_results,
+        timestamp=datetime.now().isoformat(),
+        email_snippet=sanitized_text[:200] + "..." if len(sanitized_text) > 200 else sanitized_text,
+        omitted_analyzers=omitted
+    )
 
 @app.get("/history")
-async def get_history(req: Request, limit: int = 10):
-    """Get scan history for authenticated user"""
+async def get_history(req: Request, response: Response, limit: int = 10, cursor: Optional[str] = None,
+                      decision: Optional[str] = None, model: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      user_info: dict = Depends(get_current_user)):
+    """Get a page of scan history for authenticated user, optionally filtered"""
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
     try:
-        # Get JWT from cookie
-        auth_cookie = req.cookies.get("auth_token")
-        if not auth_cookie:
-            raise HTTPException(status_code=401, detail="Authentication required")
+        since = _normalize_timestamp(since, "since")
+        until = _normalize_timestamp(until, "until")
         
-        # Verify JWT
-        user_info = verify_jwt_token(auth_cookie)
-        if not user_info:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        # Skip reading history entirely if the client's copy is current
+        query = json.dumps([limit, cursor, decision, model, since, until])
+        etag = get_scan_history_etag(user_info['sub'], query)
+        if _etag_matches(req, etag):
+            return _not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
         
         # Get history
-        history = get_scan_history(user_info['sub'], limit)
-        
-        return {"history": history}
+        return get_scan_history_page(
+            user_info['sub'], limit, cursor=cursor,
+            decision=decision, model_name=model, since=since, until=until
+        )
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
 
+@app.get("/history/export")
+def export_history_file(format: str = "jsonl", since: Optional[str] = None, until: Optional[str] = None,
+                        user: Optional[str] = None, user_info: dict = Depends(get_current_user)):
+    """Stream the full scan history as JSONL or CSV; admins may export another user's history"""
+    user_id = user_info['sub']
+    if user is not None and user != user_id:
+        if user_info.get('role') != 'admin':
+            raise HTTPException(status_code=403, detail="Admin access required")
+        user_id = user
+    try:
+        since = _normalize_timestamp(since, "since")
+        until = _normalize_timestamp(until, "until")
+        chunks = export_chunks(iter_scan_history(user_id, since, until), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"scan_history_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/history/stats")
+async def get_history_stats(days: int = 30, user_info: dict = Depends(get_current_user)):
+    """Get scan totals, per-analyzer results, a confidence histogram and a daily series"""
+    if days < 1 or days > MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_STATS_DAYS}")
+    return get_scan_stats(user_info['sub'], days)
+
+@app.get("/history/rollups")
+async def get_history_rollups(since: Optional[str] = None, until: Optional[str] = None,
+                              user_info: dict = Depends(get_current_user)):
+    """Get per-day scan counts, decisions and mean model confidence for authenticated user"""
+    try:
+        since = _normalize_timestamp(since, "since")
+        until = _normalize_timestamp(until, "until")
+        return {"days": get_history_store().get_daily_rollups(user_info['sub'], since, until)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _etag_matches(req: Request, etag: str) -> bool:
+    """Check an ETag against the request's If-None-Match header"""
+    header = req.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+def _not_modified(etag: str, cache_control: str = "private, no-cache") -> Response:
+    """Build a 304 response for an unchanged resource"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+def _normalize_timestamp(value: Optional[str], name: str) -> Optional[str]:
+    """Validate an ISO date/datetime query parameter and return it in history timestamp format"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date or datetime")
+
 @app.post("/auth/logout")
 async def logout_user(response: Response):
     """Logout user by clearing the authentication cookie"""
@@ -150,28 +343,39 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+# (registry version, body, ETag) of the last /models/status response
+_models_status_cache = None
+
 @app.get("/models/status")
-async def models_status():
+def models_status(req: Request):
     """Check if AI models are loaded and ready"""
+    global _models_status_cache
     try:
-        from scan import EMAIL_GUARD_AVAILABLE
-        if EMAIL_GUARD_AVAILABLE:
-            from ai.email_guard import get_model_info
-            model_info = get_model_info()
-            
-            # Check if we have ML models loaded
-            if model_info.get('ml_models_loaded', False):
-                status = "ready"
-            elif model_info.get('total_models', 0) > 0:
-                status = "partial"  # Only rule-based models available
-            else:
-                status = "not_ready"
+        if models_available():
+            # Only walk the analyzers when the model registry has changed
+            cached = _models_status_cache
+            version, model_info = get_model_status(cached[0] if cached else None)
+            if cached is None or cached[0] != version:
+                # Check if we have ML models loaded
+                if model_info.get('ml_models_loaded', False):
+                    status = "ready"
+                elif model_info.get('total_models', 0) > 0:
+                    status = "partial"  # Only rule-based models available
+                else:
+                    status = "not_ready"
+                
+                body = {
+                    "status": status,
+                    "models": model_info,
+                    "timestamp": datetime.now().isoformat()
+                }
+                digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:32]
+                cached = _models_status_cache = (version, body, f'"m-{digest}"')
             
-            return {
-                "status": status,
-                "models": model_info,
-                "timestamp": datetime.now().isoformat()
-            }
+            _, body, etag = cached
+            if _etag_matches(req, etag):
+                return _not_modified(etag, "no-cache")
+            return JSONResponse(content=body, headers={"ETag": etag, "Cache-Control": "no-cache"})
         else:
             return {
                 "status": "not_available",
@@ -185,5 +389,93 @@ async def models_status():
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/admin/models/residency")
+def get_models_residency(user_info: dict = Depends(require_admin)):
+    """Get per-model residency, precision and resident memory"""
+    if not models_available():
+        raise HTTPException(status_code=503, detail="Email guard module not available")
+    return get_model_residency()
+
+@app.get("/admin/profiling")
+async def get_profiling(user_info: dict = Depends(require_admin)):
+    """Get the sampling profiler settings"""
+    return get_profiler().status()
+
+@app.put("/admin/profiling")
+async def configure_profiling(config: ProfilingConfig, user_info: dict = Depends(require_admin)):
+    """Enable, change or disable sampled profiling of scan requests"""
+    try:
+        get_profiler().configure(config.sample_rate, config.max_profiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_profiler().status()
+
+@app.get("/admin/capture")
+async def get_capture(user_info: dict = Depends(require_admin)):
+    """Get the scan traffic capture settings"""
+    return get_scan_capture().status()
+
+@app.put("/admin/capture")
+async def configure_capture(config: CaptureConfig, user_info: dict = Depends(require_admin)):
+    """Change or pause sampling of captured scan inputs (the file is set by SCAN_CAPTURE_PATH)"""
+    try:
+        get_scan_capture().configure(config.sample_rate, config.max_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_scan_capture().status()
+
+@app.get("/admin/history/retention/{user_id}")
+async def get_history_retention(user_id: str, user_info: dict = Depends(require_admin)):
+    """Get a user's effective history retention"""
+    return get_history_store().get_retention(user_id)
+
+@app.put("/admin/history/retention/{user_id}")
+async def configure_history_retention(user_id: str, config: RetentionConfig,
+                                      user_info: dict = Depends(require_admin)):
+    """Override a user's history retention; omitted limits fall back to the defaults"""
+    try:
+        get_history_store().set_retention(user_id, config.ttl_days, config.max_entries)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_history_store().get_retention(user_id)
+
+@app.post("/admin/analytics/export")
+def run_analytics_export(user_info: dict = Depends(require_admin)):
+    """Append newly committed history to the day-partitioned Parquet dataset"""
+    try:
+        return export_history(get_history_store())
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/analytics/disagreements")
+def get_model_disagreements(model_a: str = "cybersectony-distilbert", model_b: str = "aamosh-distilbert",
+                            since: Optional[str] = None, until: Optional[str] = None,
+                            user_info: dict = Depends(require_admin)):
+    """Stream per-day counts of scans where two models disagreed, as JSON lines"""
+    try:
+        since = _normalize_timestamp(since, "since")
+        until = _normalize_timestamp(until, "until")
+        days = model_disagreements(model_a, model_b, since=since, until=until)
+        # Fail before streaming starts if the query cannot run
+        first = next(days, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    def lines():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        for day in days:
+            yield json.dumps(day) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """Expose pipeline metrics in the Prometheus text format"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import sys
+import threading
+from typing import List, Dict, Any, Iterator, Optional
+
+try:
+    import pandas as pd
+    import pyarrow  # noqa: F401 - Parquet engine used by pandas
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+from modules.history_store import HistoryStore, get_history_store
+from modules.ids import new_history_id
+
+# Parquet export location (one day=YYYY-MM-DD directory per partition)
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "backend/analytics")
+
+# history_meta key holding the commit sequence number of the last exported entry
+EXPORT_SEQ_KEY = "parquet_export_seq"
+
+# One row per model result
+EXPORT_COLUMNS = ['scan_id', 'user_id', 'timestamp', 'model_name', 'model_source', 'decision', 'confidence']
+
+# Only one export may append to the dataset at a time
+_export_lock = threading.Lock()
+
+def export_history(store: HistoryStore, output_dir: str = ANALYTICS_DIR, chunk_rows: int = 50000) -> Dict[str, Any]:
+    """
+    Append history committed since the last export to a day-partitioned Parquet dataset
+    
+    Each run writes new part files, so earlier partitions are never rewritten
+    and the job can run as often as needed. Entries are read in commit order
+    (HistoryStore.iter_commits), so entries committed late by the write-behind
+    writer are picked up by the next run. Progress is recorded after each
+    chunk, so an interrupted run resumes where it stopped.
+    
+    Args:
+        store: Source history store
+        output_dir: Dataset root directory
+        chunk_rows: Result rows buffered in memory before they are written
+        
+    Returns:
+        Dictionary with the number of entries and rows exported and the partitions touched
+        
+    Raises:
+        RuntimeError: If pandas/pyarrow are missing or another export is running
+    """
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export requires pandas and pyarrow")
+    if not _export_lock.acquire(blocking=False):
+        raise RuntimeError("An analytics export is already running")
+    
+    try:
+        after_seq = int(store.get_meta(EXPORT_SEQ_KEY) or 0)
+        
+        run_id = new_history_id()
+        summary = {'entries': 0, 'rows': 0, 'partitions': set()}
+        rows = []
+        last = None
+        chunk = 0
+        for seq, entry in store.iter_commits(after_seq):
+            for result in entry['results']:
+                rows.append({
+                    'scan_id': entry['id'],
+                    'user_id': entry['user_id'],
+                    'timestamp': entry['timestamp'],
+                    'model_name': result.get('model_name', 'unknown'),
+                    'model_source': result.get('model_source', 'unknown'),
+                    'decision': result.get('decision', 'unknown'),
+                    'confidence': float(result.get('confidence') or 0.0)
+                })
+            last = seq
+            summary['entries'] += 1
+            
+            if len(rows) >= chunk_rows:
+                summary['partitions'].update(_write_chunk(rows, output_dir, f"{run_id}-{chunk}"))
+                store.set_meta(EXPORT_SEQ_KEY, str(last))
+                summary['rows'] += len(rows)
+                rows = []
+                chunk += 1
+        
+        if rows:
+            summary['partitions'].update(_write_chunk(rows, output_dir, f"{run_id}-{chunk}"))
+            summary['rows'] += len(rows)
+        if last is not None:
+            store.set_meta(EXPORT_SEQ_KEY, str(last))
+        
+        summary['partitions'] = sorted(summary['partitions'])
+        return summary
+    finally:
+        _export_lock.release()
+
+def _write_chunk(rows: List[Dict[str, Any]], output_dir: str, part_name: str) -> List[str]:
+    """Write result rows into their day partitions and return the days written"""
+    frame = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+    days = frame['timestamp'].str.slice(0, 10)
+    written = []
+    for day, group in frame.groupby(days):
+        partition = os.path.join(output_dir, f"day={day}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{part_name}.parquet")
+        # Write under a temporary name so readers never see a partial file
+        group.to_parquet(path + ".tmp", index=False, engine="pyarrow")
+        os.replace(path + ".tmp", path)
+        written.append(day)
+    return written
+
+def list_partitions(output_dir: str = ANALYTICS_DIR, since: Optional[str] = None,
+                    until: Optional[str] = None) -> List[str]:
+    """List the exported days in [since, until), oldest first"""
+    if not os.path.isdir(output_dir):
+        return []
+    days = sorted(
+        name[len("day="):] for name in os.listdir(output_dir)
+        if name.startswith("day=") and os.path.isdir(os.path.join(output_dir, name))
+    )
+    if since is not None:
+        days = [day for day in days if day >= since[:10]]
+    if until is not None:
+        days = [day for day in days if day < until[:10]]
+    return days
+
+def read_partition(day: str, output_dir: str = ANALYTICS_DIR,
+                   columns: Optional[List[str]] = None) -> "pd.DataFrame":
+    """Load one day of exported results (only the requested columns are read)"""
+    partition = os.path.join(output_dir, f"day={day}")
+    parts = sorted(
+        os.path.join(partition, name) for name in os.listdir(partition) if name.endswith(".parquet")
+    )
+    if not parts:
+        return pd.DataFrame(columns=columns or EXPORT_COLUMNS)
+    return pd.concat([pd.read_parquet(path, columns=columns) for path in parts], ignore_index=True)
+
+def model_disagreements(model_a: str, model_b: str, output_dir: str = ANALYTICS_DIR,
+                        since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Count, per day, scans where two models returned different decisions
+    
+    Partitions are read one at a time, so memory use is bounded by the
+    largest day rather than the whole dataset.
+    
+    Args:
+        model_a: First model name
+        model_b: Second model name
+        output_dir: Dataset root directory
+        since: First day to include (ISO date)
+        until: Day to stop before (ISO date, exclusive)
+        
+    Yields:
+        {day, scans, disagreements, rate} for each exported day in range
+        
+    Raises:
+        RuntimeError: If pandas/pyarrow are missing
+    """
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet analytics require pandas and pyarrow")
+    
+    for day in list_partitions(output_dir, since, until):
+        frame = read_partition(day, output_dir, columns=['scan_id', 'model_name', 'decision'])
+        # A scan exported twice (e.g. after an interrupted run) counts once
+        frame = frame.drop_duplicates(subset=['scan_id', 'model_name'])
+        a = frame[frame['model_name'] == model_a].set_index('scan_id')['decision']
+        b = frame[frame['model_name'] == model_b].set_index('scan_id')['decision']
+        both = a.to_frame('a').join(b.to_frame('b'), how='inner')
+        scans = len(both)
+        disagreements = int((both['a'] != both['b']).sum())
+        yield {
+            'day': day,
+            'scans': scans,
+            'disagreements': disagreements,
+            'rate': disagreements / scans if scans else 0.0
+        }
+
+if __name__ == "__main__":
+    # Usage: python -m modules.analytics [output_dir]
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else ANALYTICS_DIR
+    result = export_history(get_history_store(), target_dir)
+    print(f"Exported {result['entries']} entries ({result['rows']} rows) into "
+          f"{len(result['partitions'])} partitions under {target_dir}")
@@ -1,10 +1,16 @@
 import csv
 import os
+import signal
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from typing import Optional, Dict, Any
 import hashlib
 
+from modules.metrics import cache_counters
+
 # JWT Configuration - Add fallback for SECRET_KEY
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -13,83 +19,172 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "
 # Token storage file path
 TOKENS_FILE = "db/users.csv"
 
+# Maximum number of verified JWTs kept in the claims cache
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+def _write_sample_tokens_file(expires_at: str):
+    """Create the tokens CSV file with sample tokens"""
+    tokens_dir = os.path.dirname(TOKENS_FILE)
+    if tokens_dir:
+        os.makedirs(tokens_dir, exist_ok=True)
+    with open(TOKENS_FILE, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['token', 'sub', 'role', 'expires_at'])
+        # Add some sample tokens
+        writer.writerow(['sample_token_1', 'user1', 'user', expires_at])
+        writer.writerow(['sample_token_2', 'user2', 'admin', expires_at])
+
+def _read_token_rows():
+    """Yield stripped (token, sub, role, expires_at) rows from the CSV file"""
+    with open(TOKENS_FILE, 'r', newline='') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            # Strip whitespace from all values to prevent issues
+            yield (
+                row['token'].strip(),
+                row['sub'].strip(),
+                row['role'].strip(),
+                row['expires_at'].strip()
+            )
+
 def load_tokens_from_csv() -> Dict[str, Dict[str, Any]]:
     """Load valid tokens from CSV file"""
     tokens = {}
     
     # Create users.csv if it doesn't exist
     if not os.path.exists(TOKENS_FILE):
-        os.makedirs(os.path.dirname(TOKENS_FILE), exist_ok=True)
-        with open(TOKENS_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['token', 'sub', 'role', 'expires_at'])
-            # Add some sample tokens
-            writer.writerow(['sample_token_1', 'user1', 'user', '2025-12-31'])
-            writer.writerow(['sample_token_2', 'user2', 'admin', '2025-12-31'])
+        _write_sample_tokens_file('2025-12-31')
     
     try:
-        with open(TOKENS_FILE, 'r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Strip whitespace from all values to prevent issues
-                token = row['token'].strip()
-                sub = row['sub'].strip()
-                role = row['role'].strip()
-                expires_at = row['expires_at'].strip()
-                
-                tokens[token] = {
-                    'sub': sub,
-                    'role': role,
-                    'expires_at': expires_at
-                }
+        rows = list(_read_token_rows())
     except FileNotFoundError:
         print(f"Warning: {TOKENS_FILE} not found. Creating with sample data.")
-        # Create default tokens file
-        with open(TOKENS_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['token', 'sub', 'role', 'expires_at'])
-            writer.writerow(['sample_token_1', 'user1', 'user', '2024-12-31'])
-            writer.writerow(['sample_token_2', 'user2', 'admin', '2024-12-31'])
+        # Create default tokens file and load it
+        _write_sample_tokens_file('2024-12-31')
+        rows = list(_read_token_rows())
+    
+    for token, sub, role, expires_at in rows:
+        tokens[token] = {
+            'sub': sub,
+            'role': role,
+            'expires_at': expires_at
+        }
+    
+    return tokens
+
+def _parse_expiry(expires_at: str) -> Optional[datetime]:
+    """Parse a token expiry date, returning None if it cannot be parsed"""
+    try:
+        return datetime.strptime(expires_at, '%Y-%m-%d')
+    except ValueError:
+        # If date parsing fails, assume token is valid
+        return None
+
+class TokenIndex:
+    """
+    In-memory index of the tokens CSV file
+    
+    Tokens are keyed by their SHA-256 digest so plaintext tokens are not kept
+    in memory and lookups are a single dict access. Expiry dates are parsed
+    once at load time. The index reloads itself when the file's mtime or size
+    changes, or on the next lookup after mark_stale() (e.g. from SIGHUP).
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._file_signature = None
+        self._stale = True
+        self._lock = threading.Lock()
+    
+    def _current_signature(self):
+        try:
+            stat = os.stat(TOKENS_FILE)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def mark_stale(self):
+        """Force a reload on the next lookup"""
+        self._stale = True
+    
+    def refresh(self, force: bool = False):
+        """Reload the index if the tokens file changed since the last load"""
+        signature = self._current_signature()
+        if not force and not self._stale and signature == self._file_signature:
+            return
         
-        # Load the created file
-        with open(TOKENS_FILE, 'r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Strip whitespace from all values to prevent issues
-                token = row['token'].strip()
-                sub = row['sub'].strip()
-                role = row['role'].strip()
-                expires_at = row['expires_at'].strip()
-                
-                tokens[token] = {
-                    'sub': sub,
-                    'role': role,
-                    'expires_at': expires_at
+        with self._lock:
+            signature = self._current_signature()
+            if not force and not self._stale and signature == self._file_signature:
+                return
+            
+            # Cleared before loading so a signal received mid-load is not lost
+            self._stale = False
+            
+            # Creates the file with sample tokens if it is missing
+            tokens = load_tokens_from_csv()
+            entries = {}
+            for token, token_info in tokens.items():
+                entries[hash_token(token)] = {
+                    'sub': token_info['sub'],
+                    'role': token_info['role'],
+                    'expires_at': _parse_expiry(token_info['expires_at'])
                 }
+            
+            self._entries = entries
+            self._file_signature = self._current_signature()
     
-    return tokens
+    def lookup(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the index entry for a plaintext token, if any"""
+        self.refresh()
+        return self._entries.get(hash_token(token))
+    
+    def add(self, token: str, sub: str, role: str, expires_at: str):
+        """Add a token that was just appended to the tokens file"""
+        with self._lock:
+            self._entries[hash_token(token)] = {
+                'sub': sub,
+                'role': role,
+                'expires_at': _parse_expiry(expires_at)
+            }
+            # Only skip the reload if the index was current before the append
+            if not self._stale:
+                self._file_signature = self._current_signature()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Global token index instance
+_token_index = TokenIndex()
+
+def get_token_index() -> TokenIndex:
+    """Get the global token index"""
+    return _token_index
+
+def install_token_reload_signal(signum: int = getattr(signal, 'SIGHUP', None)):
+    """Reload the token index when the process receives signum (SIGHUP by default)"""
+    if signum is None:
+        return
+    try:
+        signal.signal(signum, lambda *_: _token_index.mark_stale())
+    except ValueError:
+        # Signal handlers can only be installed from the main thread
+        print("Warning: token reload signal handler not installed")
 
 def authenticate_token(token: str) -> Optional[Dict[str, Any]]:
     """Authenticate user token and return user info"""
     try:
-        tokens = load_tokens_from_csv()
-        
         # Strip whitespace from input token to prevent issues
         token = token.strip()
         
-        if token not in tokens:
+        token_info = _token_index.lookup(token)
+        if token_info is None:
             return None
         
-        token_info = tokens[token]
-        
         # Check if token is expired
-        try:
-            expires_at = datetime.strptime(token_info['expires_at'], '%Y-%m-%d')
-            if datetime.now() > expires_at:
-                return None
-        except ValueError:
-            # If date parsing fails, assume token is valid
-            pass
+        expires_at = token_info['expires_at']
+        if expires_at is not None and datetime.now() > expires_at:
+            return None
         
         return {
             'sub': token_info['sub'],
@@ -116,8 +211,84 @@ def create_jwt_token(user_info: Dict[str, Any]) -> str:
         print(f"JWT creation error: {e}")
         raise
 
+# Prometheus counters for the JWT cache
+_JWT_CACHE_HIT, _JWT_CACHE_MISS = cache_counters("jwt")
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified JWT claims
+    
+    Entries are keyed by the SHA-256 digest of the encoded token, so any change
+    to the token (including its signature) misses the cache. Entries are only
+    served until the token's exp claim.
+    """
+    
+    def __init__(self, max_size: int = JWT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Return cached claims for a token digest if present and not expired"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                _JWT_CACHE_MISS.inc()
+                return None
+            
+            claims, exp = entry
+            if time.time() > exp:
+                del self._entries[digest]
+                self.misses += 1
+                _JWT_CACHE_MISS.inc()
+                return None
+            
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            _JWT_CACHE_HIT.inc()
+            return dict(claims)
+    
+    def put(self, digest: str, claims: Dict[str, Any], exp: float):
+        """Cache verified claims until exp"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = (dict(claims), exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached claims"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counts"""
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# Global verified JWT cache instance
+_jwt_cache = VerifiedTokenCache()
+
+def get_jwt_cache() -> VerifiedTokenCache:
+    """Get the global verified JWT cache"""
+    return _jwt_cache
+
 def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     """Verify JWT token and return user info"""
+    digest = hash_token(token)
+    cached = _jwt_cache.get(digest)
+    if cached is not None:
+        return cached
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         sub: str = payload.get("sub")
@@ -128,10 +299,12 @@ def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
             return None
         
         # Check if token is expired
-        if datetime.utcnow() > datetime.fromtimestamp(exp):
+        if time.time() > exp:
             return None
         
-        return {"sub": sub, "role": role}
+        user_info = {"sub": sub, "role": role}
+        _jwt_cache.put(digest, user_info, exp)
+        return user_info
     
     except JWTError as e:
         print(f"JWT verification error: {e}")
@@ -148,4 +321,6 @@ def add_token_to_csv(token: str, sub: str, role: str, expires_at: str):
     """Add a new token to the CSV file"""
     with open(TOKENS_FILE, 'a', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow([token, sub, role, expires_at])
\ No newline at end of file
+        writer.writerow([token, sub, role, expires_at])
+    
+    _token_index.add(token.strip(), sub.strip(), role.strip(), expires_at.strip())
\ No newline at end of file
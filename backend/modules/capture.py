@@ -0,0 +1,89 @@
+import json
+import os
+import random
+import threading
+from typing import Dict, Any, Optional
+
+# Capture is off unless a file is configured; the API cannot change the path
+SCAN_CAPTURE_PATH = os.getenv("SCAN_CAPTURE_PATH", "")
+
+class ScanCapture:
+    """
+    Records sanitized scan inputs with their arrival time for later replay
+    
+    Opt-in: nothing is written unless SCAN_CAPTURE_PATH is set. Each sampled
+    scan is appended to the file as one JSON line with the wall-clock arrival
+    time, the requested deadline and the sanitized email text. No user
+    identifiers are stored. Capture stops once the file reaches max_bytes.
+    benchmarks/replay.py re-issues captured traffic.
+    """
+    
+    def __init__(self, path: str = SCAN_CAPTURE_PATH):
+        self.path = path
+        self.sample_rate = float(os.getenv("SCAN_CAPTURE_SAMPLE_RATE", "1"))
+        self.max_bytes = int(os.getenv("SCAN_CAPTURE_MAX_BYTES", str(100 * 1024 * 1024)))
+        self.records_written = 0
+        self._file = None
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0.0
+    
+    def configure(self, sample_rate: float, max_bytes: Optional[int] = None):
+        """Change the sampling rate (0 pauses capture)"""
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.sample_rate = sample_rate
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+    
+    def status(self) -> Dict[str, Any]:
+        """Return the current capture settings"""
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'sample_rate': self.sample_rate,
+            'max_bytes': self.max_bytes,
+            'records_written': self.records_written
+        }
+    
+    def record(self, arrival: float, email_text: str, deadline_ms: Optional[int] = None):
+        """
+        Append one scan input if capture is on and this scan is sampled
+        
+        Args:
+            arrival: time.time() when the request arrived
+            email_text: Sanitized email text
+            deadline_ms: Scan time budget of the request, if any
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        line = (json.dumps({'arrival': arrival, 'deadline_ms': deadline_ms, 'email_text': email_text}) + "\n").encode('utf-8')
+        with self._lock:
+            try:
+                if self._file is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._file = open(self.path, 'ab')
+                if self.max_bytes and self._file.tell() + len(line) > self.max_bytes:
+                    return
+                self._file.write(line)
+                self._file.flush()
+                self.records_written += 1
+            except OSError as e:
+                print(f"Failed to capture scan input: {e}")
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+# Global capture instance
+_capture = ScanCapture()
+
+def get_scan_capture() -> ScanCapture:
+    """Get the global scan capture"""
+    return _capture
@@ -0,0 +1,48 @@
+import time
+from typing import Dict, Any
+
+from fastapi import Depends, HTTPException, Request
+
+from modules.authenticate import verify_jwt_token
+from modules.metrics import AUTH_SECONDS
+
+async def get_current_user(req: Request) -> Dict[str, Any]:
+    """
+    FastAPI dependency returning the authenticated user from the auth cookie
+    
+    Args:
+        req: Incoming request
+        
+    Returns:
+        User info with 'sub' and 'role'
+        
+    Raises:
+        HTTPException: 401 if the cookie is missing, invalid or expired
+    """
+    start = time.perf_counter()
+    try:
+        # Get JWT from cookie
+        auth_cookie = req.cookies.get("auth_token")
+        if not auth_cookie:
+            raise HTTPException(status_code=401, detail="Authentication required")
+        
+        # Verify JWT (served from the verified claims cache when possible)
+        user_info = verify_jwt_token(auth_cookie)
+        if not user_info:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        
+        return user_info
+    finally:
+        req.state.auth_seconds = time.perf_counter() - start
+        AUTH_SECONDS.observe(req.state.auth_seconds)
+
+async def require_admin(user_info: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+    """
+    FastAPI dependency that only admits users with the admin role
+    
+    Raises:
+        HTTPException: 403 if the authenticated user is not an admin
+    """
+    if user_info.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user_info
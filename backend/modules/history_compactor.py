@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from modules.history_store import HistoryStore, get_history_store
+from modules.metrics import Counter, Histogram, LATENCY_BUCKETS
+
+# Seconds between compaction runs (0 disables the background compactor)
+HISTORY_COMPACT_INTERVAL_S = float(os.getenv("HISTORY_COMPACT_INTERVAL_S", "3600"))
+
+HISTORY_COMPACTED_ENTRIES = Counter(
+    "email_guard_history_compacted_entries_total",
+    "History entries deleted by retention compaction"
+)
+HISTORY_COMPACT_SECONDS = Histogram(
+    "email_guard_history_compact_seconds",
+    "Time taken by one history compaction run",
+    buckets=LATENCY_BUCKETS
+)
+
+class HistoryCompactor:
+    """
+    Background thread that applies history retention
+    
+    Every interval it runs HistoryStore.compact(), which deletes expired and
+    over-limit entries in small transactions so the history writer is only
+    ever held up for one batch at a time.
+    """
+    
+    def __init__(self, store: HistoryStore, interval: float = HISTORY_COMPACT_INTERVAL_S):
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start compacting in the background (no-op if disabled or already running)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the compactor, waiting for a run in progress to finish"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def run_once(self) -> int:
+        """Compact now and return the number of entries deleted"""
+        start = time.perf_counter()
+        deleted = self.store.compact()
+        HISTORY_COMPACT_SECONDS.observe(time.perf_counter() - start)
+        HISTORY_COMPACTED_ENTRIES.inc(deleted)
+        if deleted:
+            print(f"History compaction removed {deleted} entries")
+        return deleted
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"History compaction failed: {e}")
+
+# Global history compactor instance
+_compactor = None
+
+def get_history_compactor() -> HistoryCompactor:
+    """Get or create the global history compactor"""
+    global _compactor
+    if _compactor is None:
+        _compactor = HistoryCompactor(get_history_store())
+    return _compactor
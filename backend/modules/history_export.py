@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+from typing import Dict, Any, Iterable, Iterator
+
+# Export formats and their media types
+EXPORT_MEDIA_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# CSV has one row per model result
+CSV_COLUMNS = [
+    'id', 'timestamp', 'email_snippet',
+    'model_source', 'model_name', 'decision', 'confidence', 'description'
+]
+
+# Entries encoded before a chunk is handed to the response
+EXPORT_CHUNK_ENTRIES = 200
+
+def export_chunks(entries: Iterable[Dict[str, Any]], export_format: str,
+                  chunk_entries: int = EXPORT_CHUNK_ENTRIES) -> Iterator[str]:
+    """
+    Encode history entries as JSONL or CSV text chunks
+    
+    Entries are consumed lazily and at most chunk_entries are buffered, so
+    memory use does not depend on how much history is exported.
+    
+    Args:
+        entries: History entries, in the order they should be written
+        export_format: 'jsonl' or 'csv'
+        chunk_entries: Entries per yielded chunk
+        
+    Yields:
+        Chunks of the encoded export
+        
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+    return _csv_chunks(entries, chunk_entries) if export_format == 'csv' else _jsonl_chunks(entries, chunk_entries)
+
+def _jsonl_chunks(entries: Iterable[Dict[str, Any]], chunk_entries: int) -> Iterator[str]:
+    lines = []
+    for entry in entries:
+        lines.append(json.dumps(entry) + "\n")
+        if len(lines) >= chunk_entries:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+def _csv_chunks(entries: Iterable[Dict[str, Any]], chunk_entries: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    buffered = 0
+    for entry in entries:
+        for result in entry['results'] or [{}]:
+            writer.writerow([
+                entry['id'],
+                entry['timestamp'],
+                entry['email_snippet'],
+                result.get('model_source', ''),
+                result.get('model_name', ''),
+                result.get('decision', ''),
+                result.get('confidence', ''),
+                result.get('description', '')
+            ])
+        buffered += 1
+        if buffered >= chunk_entries:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            buffered = 0
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,1130 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+
+# History storage location
+HISTORY_DIR = os.getenv("HISTORY_DIR", "backend/scan_history")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(HISTORY_DIR, "history.db"))
+
+# Schema migrations, applied in order. PRAGMA user_version records how many ran.
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS scan_history (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        email_snippet TEXT NOT NULL,
+        results TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_scan_history_user_time
+        ON scan_history (user_id, timestamp);
+    CREATE TABLE IF NOT EXISTS history_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """,
+    # Keyset pagination and filter indexes. scan_results has one row per model
+    # result; scan_decisions has one row per distinct decision in a scan.
+    """
+    DROP INDEX IF EXISTS idx_scan_history_user_time;
+    CREATE INDEX IF NOT EXISTS idx_scan_history_user_time_id
+        ON scan_history (user_id, timestamp, id);
+    CREATE TABLE IF NOT EXISTS scan_results (
+        scan_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        decision TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_scan_results_scan
+        ON scan_results (scan_id);
+    CREATE INDEX IF NOT EXISTS idx_scan_results_user_model
+        ON scan_results (user_id, model_name, timestamp, scan_id);
+    CREATE INDEX IF NOT EXISTS idx_scan_results_user_model_decision
+        ON scan_results (user_id, model_name, decision, timestamp, scan_id);
+    CREATE TABLE IF NOT EXISTS scan_decisions (
+        scan_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        decision TEXT NOT NULL,
+        PRIMARY KEY (user_id, decision, timestamp, scan_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_scan_decisions_scan
+        ON scan_decisions (scan_id);
+    INSERT INTO scan_results (scan_id, user_id, timestamp, model_name, decision)
+        SELECT h.id, h.user_id, h.timestamp,
+               COALESCE(json_extract(r.value, '$.model_name'), 'unknown'),
+               COALESCE(json_extract(r.value, '$.decision'), 'unknown')
+        FROM scan_history h, json_each(h.results) r;
+    INSERT OR IGNORE INTO scan_decisions (scan_id, user_id, timestamp, decision)
+        SELECT scan_id, user_id, timestamp, decision FROM scan_results
+    """,
+    # Content-addressed, compressed snippets and results (see _migrate_to_blobs)
+    lambda conn: _migrate_to_blobs(conn),
+    # Retention settings and daily rollups (see _migrate_rollups)
+    lambda conn: _migrate_rollups(conn),
+    # Per-user lifetime counters behind /history/stats (see _migrate_stats)
+    lambda conn: _migrate_stats(conn),
+    # Commit order for incremental analytics exports (see _migrate_commit_seq)
+    lambda conn: _migrate_commit_seq(conn),
+    # Per-user change counter used for HTTP ETags
+    """
+    CREATE TABLE IF NOT EXISTS history_versions (
+        user_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    """,
+]
+
+# Blob codecs
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+# Blobs shorter than this are stored uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "64"))
+
+# Largest page /history will return
+MAX_PAGE_SIZE = 100
+
+# Default retention, overridable per user (0 means keep forever)
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+HISTORY_MAX_ENTRIES_PER_USER = int(os.getenv("HISTORY_MAX_ENTRIES_PER_USER", "0"))
+HISTORY_COMPACT_BATCH = int(os.getenv("HISTORY_COMPACT_BATCH", "500"))
+
+# Confidence histogram resolution and longest daily series for /history/stats
+CONFIDENCE_BUCKETS = 10
+MAX_STATS_DAYS = 365
+
+class HistoryStore:
+    """
+    SQLite-backed scan history
+    
+    The database runs in WAL mode so readers never block the writer, and
+    history is indexed by (user_id, timestamp) so reading a user's latest
+    entries does not depend on how many scans are stored in total. Each
+    thread gets its own connection.
+    """
+    
+    def __init__(self, db_path: str = HISTORY_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._pid = os.getpid()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, creating the schema on first use"""
+        if self._pid != os.getpid():
+            # Forked (e.g. by prefork.py): SQLite connections must not be shared with the parent
+            self._local = threading.local()
+            self._schema_lock = threading.Lock()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._migrate(conn)
+                    self._schema_ready = True
+        return conn
+    
+    def _migrate(self, conn: sqlite3.Connection):
+        """Bring the schema up to date"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for index in range(version, len(_MIGRATIONS)):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check inside the write lock in case another process migrated
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if current > index:
+                    conn.execute("COMMIT")
+                    continue
+                migration = _MIGRATIONS[index]
+                if callable(migration):
+                    migration(conn)
+                else:
+                    for statement in migration.split(";"):
+                        if statement.strip():
+                            conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {index + 1}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def add_entries(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert history entries in a single transaction
+        
+        Args:
+            entries: History entries with id, user_id, timestamp, email_snippet and results
+            
+        Returns:
+            Number of entries written
+        """
+        entries = list(entries)
+        if not entries:
+            return 0
+        
+        # Identical snippets and results are stored once and shared by digest
+        blobs = {}
+        rows = []
+        for entry in entries:
+            snippet_digest = _add_blob(blobs, entry['email_snippet'])
+            results_digest = _add_blob(blobs, _dump_results(entry['results']))
+            rows.append((entry['id'], entry['user_id'], entry['timestamp'], snippet_digest, results_digest))
+        
+        result_rows = []
+        decision_rows = set()
+        for entry in entries:
+            for result in entry['results']:
+                model_name = result.get('model_name', 'unknown')
+                decision = result.get('decision', 'unknown')
+                result_rows.append((entry['id'], entry['user_id'], entry['timestamp'], model_name, decision))
+                decision_rows.add((entry['id'], entry['user_id'], entry['timestamp'], decision))
+        scan_ids = [(row[0],) for row in rows]
+        
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Replacing an entry must also replace its filter index rows and rollups
+            replaced = []
+            for (scan_id,) in scan_ids:
+                row = conn.execute(
+                    "SELECT h.user_id, h.timestamp, r.codec, r.data FROM scan_history h "
+                    "JOIN history_blobs r ON r.digest = h.results_digest WHERE h.id = ?",
+                    (scan_id,)
+                ).fetchone()
+                if row is not None:
+                    replaced.append({
+                        'user_id': row[0],
+                        'timestamp': row[1],
+                        'results': json.loads(_decode_blob(row[2], row[3]))
+                    })
+            # Number the rows in commit order; writers hold the write lock, so a
+            # reader that sees a sequence number also sees every smaller one
+            row = conn.execute("SELECT value FROM history_meta WHERE key = 'commit_seq'").fetchone()
+            first_seq = (int(row[0]) if row else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO history_meta (key, value) VALUES ('commit_seq', ?)",
+                (str(first_seq + len(rows) - 1),)
+            )
+            _update_aggregates(conn, replaced, -1)
+            _update_aggregates(conn, entries, 1)
+            _bump_versions(conn, {entry['user_id'] for entry in entries})
+            conn.executemany("DELETE FROM scan_results WHERE scan_id = ?", scan_ids)
+            conn.executemany("DELETE FROM scan_decisions WHERE scan_id = ?", scan_ids)
+            conn.executemany(
+                "INSERT OR IGNORE INTO history_blobs (digest, codec, data) VALUES (?, ?, ?)",
+                [(digest,) + _encode_blob(raw) for digest, raw in blobs.items()]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO scan_history "
+                "(id, user_id, timestamp, snippet_digest, results_digest, commit_seq) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [row + (first_seq + index,) for index, row in enumerate(rows)]
+            )
+            conn.executemany(
+                "INSERT INTO scan_results (scan_id, user_id, timestamp, model_name, decision) "
+                "VALUES (?, ?, ?, ?, ?)",
+                result_rows
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO scan_decisions (scan_id, user_id, timestamp, decision) "
+                "VALUES (?, ?, ?, ?)",
+                decision_rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+    
+    def add_entry(self, entry: Dict[str, Any]):
+        """Insert a single history entry"""
+        self.add_entries([entry])
+    
+    def get_entries(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get a user's most recent history entries, newest first"""
+        return self.get_page(user_id, limit)
+    
+    def get_page(self, user_id: str, limit: int, before: Optional[Tuple[str, str]] = None,
+                 decision: Optional[str] = None, model_name: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get one page of a user's history, newest first, using keyset pagination
+        
+        Args:
+            user_id: User identifier
+            limit: Maximum number of entries to return
+            before: (timestamp, id) of the last entry of the previous page
+            decision: Only entries where some model returned this decision
+            model_name: Only entries with a result from this model (combined with
+                decision, that model must have returned the decision)
+            since: Only entries with timestamp >= since (ISO format)
+            until: Only entries with timestamp < until (ISO format)
+            
+        Returns:
+            List of history entries
+        """
+        # Pick the index table that matches the filters so the scan stays in key order
+        if model_name is not None:
+            source = "scan_results"
+            conditions = ["f.user_id = ?", "f.model_name = ?"]
+            params = [user_id, model_name]
+            if decision is not None:
+                conditions.append("f.decision = ?")
+                params.append(decision)
+        elif decision is not None:
+            source = "scan_decisions"
+            conditions = ["f.user_id = ?", "f.decision = ?"]
+            params = [user_id, decision]
+        else:
+            source = None
+            conditions = ["f.user_id = ?"]
+            params = [user_id]
+        
+        id_column = "f.scan_id" if source else "f.id"
+        if before is not None:
+            conditions.append(f"(f.timestamp, {id_column}) < (?, ?)")
+            params.extend(before)
+        if since is not None:
+            conditions.append("f.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("f.timestamp < ?")
+            params.append(until)
+        params.append(limit)
+        
+        join = f"{source} f JOIN scan_history h ON h.id = f.scan_id" if source else "scan_history f"
+        history = "h" if source else "f"
+        rows = self._connection().execute(
+            f"SELECT {history}.id, {history}.user_id, {history}.timestamp, "
+            f"s.codec AS snippet_codec, s.data AS snippet_data, "
+            f"r.codec AS results_codec, r.data AS results_data "
+            f"FROM {join} "
+            f"JOIN history_blobs s ON s.digest = {history}.snippet_digest "
+            f"JOIN history_blobs r ON r.digest = {history}.results_digest "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY f.timestamp DESC, {id_column} DESC LIMIT ?",
+            params
+        ).fetchall()
+        return [_row_to_entry(row) for row in rows]
+    
+    def iter_entries(self, user_id: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                     until: Optional[str] = None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate history oldest first, reading batch_size entries per query
+        
+        No read transaction is held between batches, so long iterations do not
+        stop the WAL from being checkpointed.
+        
+        Args:
+            user_id: Only this user's entries (all users if None)
+            after: Start after this (timestamp, id) position
+            until: Only entries with timestamp < until (ISO format)
+            batch_size: Entries fetched per query
+            
+        Yields:
+            History entries
+        """
+        position = tuple(after) if after is not None else None
+        while True:
+            conditions = []
+            params = []
+            if user_id is not None:
+                conditions.append("h.user_id = ?")
+                params.append(user_id)
+            if position is not None:
+                conditions.append("(h.timestamp, h.id) > (?, ?)")
+                params.extend(position)
+            if until is not None:
+                conditions.append("h.timestamp < ?")
+                params.append(until)
+            where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+            params.append(batch_size)
+            
+            rows = self._connection().execute(
+                "SELECT h.id, h.user_id, h.timestamp, "
+                "s.codec AS snippet_codec, s.data AS snippet_data, "
+                "r.codec AS results_codec, r.data AS results_data "
+                "FROM scan_history h "
+                "JOIN history_blobs s ON s.digest = h.snippet_digest "
+                "JOIN history_blobs r ON r.digest = h.results_digest "
+                f"{where}ORDER BY h.timestamp, h.id LIMIT ?",
+                params
+            ).fetchall()
+            for row in rows:
+                yield _row_to_entry(row)
+            if len(rows) < batch_size:
+                return
+            position = (rows[-1]['timestamp'], rows[-1]['id'])
+    
+    def iter_commits(self, after_seq: int = 0, batch_size: int = 500) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Iterate all users' history in commit order, reading batch_size entries per query
+        
+        Unlike timestamps, commit sequence numbers only grow, so an entry
+        committed late (e.g. after write-behind retries) still comes after
+        every position a previous iteration stopped at. A replaced entry
+        gets a new sequence number.
+        
+        Args:
+            after_seq: Start after this commit sequence number
+            batch_size: Entries fetched per query
+            
+        Yields:
+            (commit sequence number, history entry)
+        """
+        position = after_seq
+        while True:
+            rows = self._connection().execute(
+                "SELECT h.id, h.user_id, h.timestamp, h.commit_seq, "
+                "s.codec AS snippet_codec, s.data AS snippet_data, "
+                "r.codec AS results_codec, r.data AS results_data "
+                "FROM scan_history h "
+                "JOIN history_blobs s ON s.digest = h.snippet_digest "
+                "JOIN history_blobs r ON r.digest = h.results_digest "
+                "WHERE h.commit_seq > ? ORDER BY h.commit_seq LIMIT ?",
+                (position, batch_size)
+            ).fetchall()
+            for row in rows:
+                yield row['commit_seq'], _row_to_entry(row)
+            if len(rows) < batch_size:
+                return
+            position = rows[-1]['commit_seq']
+    
+    def get_daily_rollups(self, user_id: str, since: Optional[str] = None,
+                          until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get a user's per-day scan summaries, oldest first
+        
+        Rollups are maintained as entries are written and are not removed by
+        compaction, so they cover history that has already expired.
+        
+        Args:
+            user_id: User identifier
+            since: First day to include (YYYY-MM-DD)
+            until: Day to stop before (YYYY-MM-DD, exclusive)
+            
+        Returns:
+            List of {day, scans, decisions, models} dicts, where models maps each
+            model name to its decision counts and mean confidence
+        """
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if since is not None:
+            conditions.append("day >= ?")
+            params.append(since[:10])
+        if until is not None:
+            conditions.append("day < ?")
+            params.append(until[:10])
+        where = ' AND '.join(conditions)
+        
+        conn = self._connection()
+        days = {}
+        for row in conn.execute(f"SELECT day, scans FROM history_daily_scans WHERE {where} ORDER BY day", params):
+            days[row['day']] = {'day': row['day'], 'scans': row['scans'], 'decisions': {}, 'models': {}}
+        
+        rows = conn.execute(
+            f"SELECT day, model_name, decision, results, confidence_sum FROM history_daily_rollups "
+            f"WHERE {where}", params
+        )
+        for row in rows:
+            day = days.setdefault(row['day'], {'day': row['day'], 'scans': 0, 'decisions': {}, 'models': {}})
+            day['decisions'][row['decision']] = day['decisions'].get(row['decision'], 0) + row['results']
+            model = day['models'].setdefault(row['model_name'], {'decisions': {}, 'results': 0, 'confidence_sum': 0.0})
+            model['decisions'][row['decision']] = row['results']
+            model['results'] += row['results']
+            model['confidence_sum'] += row['confidence_sum']
+        
+        for day in days.values():
+            for model in day['models'].values():
+                confidence_sum = model.pop('confidence_sum')
+                model['mean_confidence'] = confidence_sum / model['results'] if model['results'] else 0.0
+        return [days[key] for key in sorted(days)]
+    
+    def get_stats(self, user_id: str, days: int = 30, today: Optional[str] = None,
+                  pending: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """
+        Get a user's scan statistics from the incrementally maintained counters
+        
+        Reads a bounded number of rows (models x decisions, histogram buckets
+        and days) however much history the user has. Counters cover every scan
+        ever stored, including entries since removed by retention.
+        
+        Args:
+            user_id: User identifier
+            days: Length of the daily series, ending today
+            today: Last day of the series (YYYY-MM-DD, defaults to the current date)
+            pending: Uncommitted entries to include (entries already stored are ignored)
+            
+        Returns:
+            Dictionary with total_scans, decisions, analyzers, confidence_histogram and daily
+        """
+        end = datetime.fromisoformat(today) if today else datetime.now()
+        day_keys = [(end - timedelta(days=offset)).date().isoformat() for offset in range(days - 1, -1, -1)]
+        conn = self._connection()
+        
+        row = conn.execute("SELECT scans FROM history_user_scans WHERE user_id = ?", (user_id,)).fetchone()
+        total_scans = row['scans'] if row else 0
+        totals = {
+            (row['model_name'], row['decision']): [row['results'], row['confidence_sum']]
+            for row in conn.execute(
+                "SELECT model_name, decision, results, confidence_sum FROM history_totals WHERE user_id = ?",
+                (user_id,)
+            )
+        }
+        buckets = [0] * CONFIDENCE_BUCKETS
+        for row in conn.execute(
+            "SELECT bucket, results FROM history_confidence_buckets WHERE user_id = ?", (user_id,)
+        ):
+            if 0 <= row['bucket'] < CONFIDENCE_BUCKETS:
+                buckets[row['bucket']] = row['results']
+        
+        daily = {day: {'day': day, 'scans': 0, 'decisions': {}} for day in day_keys}
+        if day_keys:
+            for day in self.get_daily_rollups(user_id, since=day_keys[0]):
+                if day['day'] in daily:
+                    daily[day['day']]['scans'] = day['scans']
+                    daily[day['day']]['decisions'] = day['decisions']
+        
+        # Fold in entries the write-behind queue has not committed yet
+        for entry in pending:
+            if conn.execute("SELECT 1 FROM scan_history WHERE id = ?", (entry['id'],)).fetchone():
+                continue
+            total_scans += 1
+            day = daily.get(entry['timestamp'][:10])
+            if day is not None:
+                day['scans'] += 1
+            for result in entry['results']:
+                confidence = float(result.get('confidence') or 0.0)
+                decision = result.get('decision', 'unknown')
+                total = totals.setdefault((result.get('model_name', 'unknown'), decision), [0, 0.0])
+                total[0] += 1
+                total[1] += confidence
+                buckets[_confidence_bucket(confidence)] += 1
+                if day is not None:
+                    day['decisions'][decision] = day['decisions'].get(decision, 0) + 1
+        
+        decisions = {}
+        analyzers = {}
+        for (model_name, decision), (results, confidence_sum) in sorted(totals.items()):
+            decisions[decision] = decisions.get(decision, 0) + results
+            analyzer = analyzers.setdefault(model_name, {'results': 0, 'decisions': {}, 'confidence_sum': 0.0})
+            analyzer['results'] += results
+            analyzer['decisions'][decision] = results
+            analyzer['confidence_sum'] += confidence_sum
+        for analyzer in analyzers.values():
+            confidence_sum = analyzer.pop('confidence_sum')
+            analyzer['mean_confidence'] = confidence_sum / analyzer['results'] if analyzer['results'] else 0.0
+        
+        return {
+            'total_scans': total_scans,
+            'decisions': decisions,
+            'analyzers': analyzers,
+            'confidence_histogram': [
+                {'min': index / CONFIDENCE_BUCKETS, 'max': (index + 1) / CONFIDENCE_BUCKETS, 'count': count}
+                for index, count in enumerate(buckets)
+            ],
+            'daily': [daily[day] for day in day_keys]
+        }
+    
+    def get_retention(self, user_id: str) -> Dict[str, int]:
+        """Get a user's effective retention (0 means unlimited)"""
+        row = self._connection().execute(
+            "SELECT ttl_days, max_entries FROM history_retention WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        ttl_days = row['ttl_days'] if row and row['ttl_days'] is not None else HISTORY_RETENTION_DAYS
+        max_entries = row['max_entries'] if row and row['max_entries'] is not None else HISTORY_MAX_ENTRIES_PER_USER
+        return {'ttl_days': ttl_days, 'max_entries': max_entries}
+    
+    def set_retention(self, user_id: str, ttl_days: Optional[int] = None, max_entries: Optional[int] = None):
+        """
+        Override retention for one user
+        
+        Args:
+            user_id: User identifier
+            ttl_days: Days to keep entries (None uses the default, 0 keeps forever)
+            max_entries: Most entries to keep (None uses the default, 0 is unlimited)
+            
+        Raises:
+            ValueError: If a limit is negative
+        """
+        if (ttl_days is not None and ttl_days < 0) or (max_entries is not None and max_entries < 0):
+            raise ValueError("Retention limits must not be negative")
+        conn = self._connection()
+        if ttl_days is None and max_entries is None:
+            conn.execute("DELETE FROM history_retention WHERE user_id = ?", (user_id,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO history_retention (user_id, ttl_days, max_entries) VALUES (?, ?, ?)",
+                (user_id, ttl_days, max_entries)
+            )
+    
+    def compact(self, now: Optional[datetime] = None, batch_size: int = HISTORY_COMPACT_BATCH) -> int:
+        """
+        Delete entries outside each user's retention, in short batched transactions
+        
+        Blobs no longer referenced by any entry are removed with them. Daily
+        rollups are left untouched.
+        
+        Args:
+            now: Reference time for TTLs (defaults to the current time)
+            batch_size: Entries deleted per transaction
+            
+        Returns:
+            Number of entries deleted
+        """
+        now = now or datetime.now()
+        conn = self._connection()
+        user_ids = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM scan_history").fetchall()]
+        
+        deleted = 0
+        for user_id in user_ids:
+            retention = self.get_retention(user_id)
+            if retention['ttl_days'] > 0:
+                cutoff = (now - timedelta(days=retention['ttl_days'])).isoformat()
+                deleted += self._delete_batches(user_id, "timestamp < ?", [cutoff], batch_size)
+            if retention['max_entries'] > 0:
+                # Everything older than the max_entries-th newest entry goes
+                oldest_kept = conn.execute(
+                    "SELECT timestamp, id FROM scan_history WHERE user_id = ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+                    (user_id, retention['max_entries'] - 1)
+                ).fetchone()
+                if oldest_kept is not None:
+                    deleted += self._delete_batches(
+                        user_id, "(timestamp, id) < (?, ?)", list(oldest_kept), batch_size
+                    )
+        return deleted
+    
+    def _delete_batches(self, user_id: str, condition: str, params: List[Any], batch_size: int) -> int:
+        """Delete a user's entries matching condition, batch_size entries per transaction"""
+        conn = self._connection()
+        deleted = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"SELECT id, snippet_digest, results_digest FROM scan_history "
+                    f"WHERE user_id = ? AND {condition} ORDER BY timestamp, id LIMIT ?",
+                    [user_id] + params + [batch_size]
+                ).fetchall()
+                scan_ids = [(row[0],) for row in rows]
+                conn.executemany("DELETE FROM scan_results WHERE scan_id = ?", scan_ids)
+                conn.executemany("DELETE FROM scan_decisions WHERE scan_id = ?", scan_ids)
+                conn.executemany("DELETE FROM scan_history WHERE id = ?", scan_ids)
+                if rows:
+                    _bump_versions(conn, [user_id])
+                
+                # Drop blobs that no remaining entry refers to
+                digests = {row[1] for row in rows} | {row[2] for row in rows}
+                conn.executemany(
+                    "DELETE FROM history_blobs WHERE digest = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM scan_history WHERE snippet_digest = ?) "
+                    "AND NOT EXISTS (SELECT 1 FROM scan_history WHERE results_digest = ?)",
+                    [(digest, digest, digest) for digest in digests]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            deleted += len(rows)
+            if len(rows) < batch_size:
+                return deleted
+    
+    def existing_ids(self, entry_ids: List[str]) -> Set[str]:
+        """Return the ids among entry_ids that are stored (at most 999 per call)"""
+        if not entry_ids:
+            return set()
+        placeholders = ", ".join("?" * len(entry_ids))
+        rows = self._connection().execute(
+            f"SELECT id FROM scan_history WHERE id IN ({placeholders})", entry_ids
+        ).fetchall()
+        return {row['id'] for row in rows}
+    
+    def get_version(self, user_id: str) -> int:
+        """Get a counter that changes whenever the user's stored history changes"""
+        row = self._connection().execute(
+            "SELECT version FROM history_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row['version'] if row else 0
+    
+    def get_meta(self, key: str):
+        """Read a value from the history_meta table"""
+        row = self._connection().execute(
+            "SELECT value FROM history_meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row['value'] if row else None
+    
+    def set_meta(self, key: str, value: str):
+        """Write a value to the history_meta table"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO history_meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+def _row_to_entry(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a scan_history row joined with its blobs to the API's history entry format"""
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'timestamp': row['timestamp'],
+        'email_snippet': _decode_blob(row['snippet_codec'], row['snippet_data']),
+        'results': json.loads(_decode_blob(row['results_codec'], row['results_data']))
+    }
+
+def _dump_results(results: List[Dict[str, Any]]) -> str:
+    """Serialize results canonically so identical results share a digest"""
+    return json.dumps(results, sort_keys=True, separators=(',', ':'))
+
+def _add_blob(blobs: Dict[bytes, str], content: str) -> bytes:
+    """Register content in a digest -> content map and return its digest"""
+    digest = hashlib.sha256(content.encode('utf-8')).digest()
+    blobs[digest] = content
+    return digest
+
+def _encode_blob(content: str) -> Tuple[int, bytes]:
+    """Return (codec, data) for a blob, compressing it when that saves space"""
+    raw = content.encode('utf-8')
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return CODEC_ZLIB, compressed
+    return CODEC_RAW, raw
+
+def _decode_blob(codec: int, data: bytes) -> str:
+    """Inverse of _encode_blob"""
+    if codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    return bytes(data).decode('utf-8')
+
+def _bump_versions(conn: sqlite3.Connection, user_ids: Iterable[str]):
+    """Increment the history version of each user (call inside a write transaction)"""
+    conn.executemany(
+        "INSERT INTO history_versions (user_id, version) VALUES (?, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+        [(user_id,) for user_id in user_ids]
+    )
+
+def _confidence_bucket(confidence: float) -> int:
+    """Index of the histogram bucket a confidence in [0, 1] falls into"""
+    return min(max(int(confidence * CONFIDENCE_BUCKETS), 0), CONFIDENCE_BUCKETS - 1)
+
+def _update_aggregates(conn: sqlite3.Connection, entries: List[Dict[str, Any]], sign: int):
+    """Add (sign=1) or subtract (sign=-1) entries from the rollups and lifetime counters"""
+    _update_daily_rollups(conn, entries, sign)
+    _update_stats(conn, entries, sign)
+
+def _update_stats(conn: sqlite3.Connection, entries: List[Dict[str, Any]], sign: int):
+    """Add (sign=1) or subtract (sign=-1) entries from the per-user lifetime counters"""
+    scans = {}
+    totals = {}
+    buckets = {}
+    for entry in entries:
+        user_id = entry['user_id']
+        scans[user_id] = scans.get(user_id, 0) + sign
+        for result in entry['results']:
+            confidence = float(result.get('confidence') or 0.0)
+            key = (user_id, result.get('model_name', 'unknown'), result.get('decision', 'unknown'))
+            count, confidence_sum = totals.get(key, (0, 0.0))
+            totals[key] = (count + sign, confidence_sum + sign * confidence)
+            bucket_key = (user_id, _confidence_bucket(confidence))
+            buckets[bucket_key] = buckets.get(bucket_key, 0) + sign
+    
+    conn.executemany(
+        "INSERT INTO history_user_scans (user_id, scans) VALUES (?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET scans = scans + excluded.scans",
+        list(scans.items())
+    )
+    conn.executemany(
+        "INSERT INTO history_totals (user_id, model_name, decision, results, confidence_sum) "
+        "VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (user_id, model_name, decision) DO UPDATE SET "
+        "results = results + excluded.results, confidence_sum = confidence_sum + excluded.confidence_sum",
+        [key + value for key, value in totals.items()]
+    )
+    conn.executemany(
+        "INSERT INTO history_confidence_buckets (user_id, bucket, results) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, bucket) DO UPDATE SET results = results + excluded.results",
+        [key + (count,) for key, count in buckets.items()]
+    )
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM history_totals WHERE user_id = ? AND model_name = ? AND decision = ? AND results <= 0",
+            list(totals)
+        )
+
+def _update_daily_rollups(conn: sqlite3.Connection, entries: Iterable[Dict[str, Any]], sign: int):
+    """Add (sign=1) or subtract (sign=-1) entries from the daily rollup tables"""
+    scans = {}
+    results = {}
+    for entry in entries:
+        day = entry['timestamp'][:10]
+        key = (entry['user_id'], day)
+        scans[key] = scans.get(key, 0) + sign
+        for result in entry['results']:
+            result_key = key + (result.get('model_name', 'unknown'), result.get('decision', 'unknown'))
+            count, confidence_sum = results.get(result_key, (0, 0.0))
+            results[result_key] = (count + sign, confidence_sum + sign * float(result.get('confidence') or 0.0))
+    
+    conn.executemany(
+        "INSERT INTO history_daily_scans (user_id, day, scans) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, day) DO UPDATE SET scans = scans + excluded.scans",
+        [key + (count,) for key, count in scans.items()]
+    )
+    conn.executemany(
+        "INSERT INTO history_daily_rollups (user_id, day, model_name, decision, results, confidence_sum) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (user_id, day, model_name, decision) DO UPDATE SET "
+        "results = results + excluded.results, confidence_sum = confidence_sum + excluded.confidence_sum",
+        [key + value for key, value in results.items()]
+    )
+    if sign < 0:
+        # Drop rows whose entries have all been replaced
+        conn.executemany(
+            "DELETE FROM history_daily_scans WHERE user_id = ? AND day = ? AND scans <= 0",
+            list(scans)
+        )
+        conn.executemany(
+            "DELETE FROM history_daily_rollups WHERE user_id = ? AND day = ? AND model_name = ? "
+            "AND decision = ? AND results <= 0",
+            list(results)
+        )
+
+def _migrate_to_blobs(conn: sqlite3.Connection):
+    """
+    Schema migration 3: move snippets and results into history_blobs
+    
+    scan_history rows keep only the digests of their snippet and results, so
+    repeated emails and verdicts are stored (compressed) once.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_blobs ("
+        "digest BLOB PRIMARY KEY, codec INTEGER NOT NULL, data BLOB NOT NULL"
+        ") WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE scan_history_v3 ("
+        "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+        "snippet_digest BLOB NOT NULL, results_digest BLOB NOT NULL)"
+    )
+    
+    cursor = conn.execute("SELECT id, user_id, timestamp, email_snippet, results FROM scan_history")
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        blobs = {}
+        rows = []
+        for row in batch:
+            snippet_digest = _add_blob(blobs, row[3])
+            results_digest = _add_blob(blobs, _dump_results(json.loads(row[4])))
+            rows.append((row[0], row[1], row[2], snippet_digest, results_digest))
+        conn.executemany(
+            "INSERT OR IGNORE INTO history_blobs (digest, codec, data) VALUES (?, ?, ?)",
+            [(digest,) + _encode_blob(raw) for digest, raw in blobs.items()]
+        )
+        conn.executemany("INSERT INTO scan_history_v3 VALUES (?, ?, ?, ?, ?)", rows)
+    
+    conn.execute("DROP TABLE scan_history")
+    conn.execute("ALTER TABLE scan_history_v3 RENAME TO scan_history")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scan_history_user_time_id "
+        "ON scan_history (user_id, timestamp, id)"
+    )
+
+def _migrate_stats(conn: sqlite3.Connection):
+    """
+    Schema migration 5: per-user lifetime counters
+    
+    Scan and result totals are seeded from the daily rollups, which also
+    cover compacted history. The confidence histogram can only be rebuilt
+    from entries that still exist.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_user_scans ("
+        "user_id TEXT PRIMARY KEY, scans INTEGER NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_totals ("
+        "user_id TEXT NOT NULL, model_name TEXT NOT NULL, decision TEXT NOT NULL, "
+        "results INTEGER NOT NULL, confidence_sum REAL NOT NULL, "
+        "PRIMARY KEY (user_id, model_name, decision)) WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_confidence_buckets ("
+        "user_id TEXT NOT NULL, bucket INTEGER NOT NULL, results INTEGER NOT NULL, "
+        "PRIMARY KEY (user_id, bucket)) WITHOUT ROWID"
+    )
+    conn.execute(
+        "INSERT INTO history_user_scans (user_id, scans) "
+        "SELECT user_id, SUM(scans) FROM history_daily_scans GROUP BY user_id"
+    )
+    conn.execute(
+        "INSERT INTO history_totals (user_id, model_name, decision, results, confidence_sum) "
+        "SELECT user_id, model_name, decision, SUM(results), SUM(confidence_sum) "
+        "FROM history_daily_rollups GROUP BY user_id, model_name, decision"
+    )
+    
+    buckets = {}
+    cursor = conn.execute(
+        "SELECT h.user_id, r.codec, r.data FROM scan_history h "
+        "JOIN history_blobs r ON r.digest = h.results_digest"
+    )
+    for row in cursor:
+        for result in json.loads(_decode_blob(row[1], row[2])):
+            key = (row[0], _confidence_bucket(float(result.get('confidence') or 0.0)))
+            buckets[key] = buckets.get(key, 0) + 1
+    conn.executemany(
+        "INSERT INTO history_confidence_buckets (user_id, bucket, results) VALUES (?, ?, ?)",
+        [key + (count,) for key, count in buckets.items()]
+    )
+
+def _migrate_commit_seq(conn: sqlite3.Connection):
+    """
+    Schema migration 6: commit sequence numbers
+    
+    Existing entries are numbered in (timestamp, id) order.
+    """
+    conn.execute("ALTER TABLE scan_history ADD COLUMN commit_seq INTEGER")
+    conn.execute("CREATE TEMP TABLE commit_order (id TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+    conn.execute(
+        "INSERT INTO commit_order (id, seq) "
+        "SELECT id, ROW_NUMBER() OVER (ORDER BY timestamp, id) FROM scan_history"
+    )
+    conn.execute(
+        "UPDATE scan_history SET commit_seq = "
+        "(SELECT seq FROM commit_order WHERE commit_order.id = scan_history.id)"
+    )
+    conn.execute("DROP TABLE commit_order")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_history_commit_seq ON scan_history (commit_seq)")
+    conn.execute(
+        "INSERT OR REPLACE INTO history_meta (key, value) "
+        "SELECT 'commit_seq', COUNT(*) FROM scan_history"
+    )
+
+def _migrate_rollups(conn: sqlite3.Connection):
+    """
+    Schema migration 4: per-user retention settings and daily rollups
+    
+    Rollups are built from existing history. The digest indexes let the
+    compactor find unreferenced blobs without scanning scan_history.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_history_snippet ON scan_history (snippet_digest)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_history_results ON scan_history (results_digest)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_retention ("
+        "user_id TEXT PRIMARY KEY, ttl_days INTEGER, max_entries INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_daily_scans ("
+        "user_id TEXT NOT NULL, day TEXT NOT NULL, scans INTEGER NOT NULL, "
+        "PRIMARY KEY (user_id, day)) WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS history_daily_rollups ("
+        "user_id TEXT NOT NULL, day TEXT NOT NULL, model_name TEXT NOT NULL, decision TEXT NOT NULL, "
+        "results INTEGER NOT NULL, confidence_sum REAL NOT NULL, "
+        "PRIMARY KEY (user_id, day, model_name, decision)) WITHOUT ROWID"
+    )
+    
+    cursor = conn.execute(
+        "SELECT h.user_id, h.timestamp, r.codec, r.data FROM scan_history h "
+        "JOIN history_blobs r ON r.digest = h.results_digest"
+    )
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        _update_daily_rollups(conn, [
+            {'user_id': row[0], 'timestamp': row[1], 'results': json.loads(_decode_blob(row[2], row[3]))}
+            for row in batch
+        ], 1)
+
+def entry_matches(entry: Dict[str, Any], before: Optional[Tuple[str, str]] = None,
+                  decision: Optional[str] = None, model_name: Optional[str] = None,
+                  since: Optional[str] = None, until: Optional[str] = None) -> bool:
+    """Check an in-memory history entry against the same filters as HistoryStore.get_page"""
+    key = (entry['timestamp'], entry['id'])
+    if before is not None and not key < tuple(before):
+        return False
+    if since is not None and entry['timestamp'] < since:
+        return False
+    if until is not None and entry['timestamp'] >= until:
+        return False
+    results = entry['results']
+    if model_name is not None:
+        results = [r for r in results if r.get('model_name', 'unknown') == model_name]
+    if decision is not None:
+        results = [r for r in results if r.get('decision', 'unknown') == decision]
+    if model_name is not None or decision is not None:
+        return bool(results)
+    return True
+
+def encode_cursor(entry: Dict[str, Any]) -> str:
+    """Encode the position after an entry as an opaque page cursor"""
+    raw = json.dumps([entry['timestamp'], entry['id']], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a page cursor produced by encode_cursor
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, entry_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Invalid history cursor")
+    if not isinstance(timestamp, str) or not isinstance(entry_id, str):
+        raise ValueError("Invalid history cursor")
+    return timestamp, entry_id
+
+def migrate_json_history(store: HistoryStore, history_dir: str = HISTORY_DIR, batch_size: int = 500) -> int:
+    """
+    Import per-scan JSON history files into the store
+    
+    Entries already in the store are overwritten with the same data, so the
+    migration can safely be re-run. The JSON files are left in place
+    (remove_migrated_json_history deletes them).
+    
+    Args:
+        store: Destination history store
+        history_dir: Directory containing <user_id>_<timestamp>.json files
+        batch_size: Number of entries inserted per transaction
+        
+    Returns:
+        Number of entries imported
+    """
+    if not os.path.isdir(history_dir):
+        return 0
+    
+    imported = 0
+    batch = []
+    for filename in os.listdir(history_dir):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(history_dir, filename), 'r') as f:
+                entry = json.load(f)
+            batch.append({
+                'id': entry['id'],
+                'user_id': entry['user_id'],
+                'timestamp': entry['timestamp'],
+                'email_snippet': entry.get('email_snippet', ''),
+                'results': entry.get('results', [])
+            })
+        except (json.JSONDecodeError, KeyError, TypeError, OSError) as e:
+            print(f"Skipping history file {filename}: {e}")
+            continue
+        
+        if len(batch) >= batch_size:
+            imported += store.add_entries(batch)
+            batch = []
+    
+    imported += store.add_entries(batch)
+    return imported
+
+def migrate_json_history_once(store: HistoryStore, history_dir: str = HISTORY_DIR) -> int:
+    """Run migrate_json_history unless it has already run against this store"""
+    if store.get_meta('json_migrated') is not None:
+        return 0
+    imported = migrate_json_history(store, history_dir)
+    store.set_meta('json_migrated', str(imported))
+    if imported:
+        print(f"Migrated {imported} JSON history entries into {store.db_path}")
+    return imported
+
+def remove_migrated_json_history(store: HistoryStore, history_dir: str = HISTORY_DIR,
+                                 batch_size: int = 500) -> int:
+    """
+    Delete legacy JSON history files whose entries are in the store
+    
+    Only run on request (python -m modules.history_store --remove-migrated);
+    the import at startup leaves the files alone. Files that cannot be read,
+    and files whose entry is not in the store, are left in place.
+    
+    Args:
+        store: History store the files were imported into
+        history_dir: Directory containing <user_id>_<timestamp>.json files
+        batch_size: Number of ids looked up per query
+        
+    Returns:
+        Number of files deleted
+    """
+    if not os.path.isdir(history_dir):
+        return 0
+    
+    removed = 0
+    batch = []
+    for filename in os.listdir(history_dir):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(history_dir, filename)
+        try:
+            with open(path, 'r') as f:
+                batch.append((path, json.load(f)['id']))
+        except (json.JSONDecodeError, KeyError, TypeError, OSError):
+            continue
+        
+        if len(batch) >= batch_size:
+            removed += _remove_stored_files(store, batch)
+            batch = []
+    
+    removed += _remove_stored_files(store, batch)
+    if removed:
+        print(f"Removed {removed} migrated JSON history files from {history_dir}")
+    return removed
+
+def _remove_stored_files(store: HistoryStore, files: List[Tuple[str, str]]) -> int:
+    """Delete the (path, entry id) files whose entries are stored"""
+    stored = store.existing_ids([entry_id for _, entry_id in files])
+    removed = 0
+    for path, entry_id in files:
+        if entry_id not in stored:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            print(f"Failed to remove history file {path}: {e}")
+    return removed
+
+# Global history store instance
+_store = None
+
+def get_history_store() -> HistoryStore:
+    """Get or create the global history store"""
+    global _store
+    if _store is None:
+        _store = HistoryStore()
+    return _store
+
+if __name__ == "__main__":
+    # Usage: python -m modules.history_store [history_dir] [--remove-migrated]
+    args = [arg for arg in sys.argv[1:] if arg != '--remove-migrated']
+    source_dir = args[0] if args else HISTORY_DIR
+    count = migrate_json_history(get_history_store(), source_dir)
+    print(f"Imported {count} history entries from {source_dir} into {HISTORY_DB_PATH}")
+    if '--remove-migrated' in sys.argv[1:]:
+        remove_migrated_json_history(get_history_store(), source_dir)
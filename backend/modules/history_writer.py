@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Any, Optional
+
+from modules.history_store import HistoryStore, get_history_store
+from modules.metrics import Counter, Gauge, Histogram, LATENCY_BUCKETS
+
+# Write-behind configuration
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "1") != "0"
+HISTORY_FLUSH_INTERVAL_MS = int(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "50"))
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "256"))
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))
+
+# Longest wait between retries of a failing flush (the wait doubles per failure)
+HISTORY_RETRY_MAX_S = float(os.getenv("HISTORY_RETRY_MAX_S", "30"))
+
+# Failed flushes after stop() before the remaining entries are given up
+HISTORY_STOP_RETRIES = 3
+
+HISTORY_QUEUE_DEPTH = Gauge(
+    "email_guard_history_queue_depth",
+    "History entries accepted but not yet committed"
+)
+HISTORY_FLUSH_SECONDS = Histogram(
+    "email_guard_history_flush_seconds",
+    "Time taken to commit one batch of history entries",
+    buckets=LATENCY_BUCKETS
+)
+HISTORY_FLUSH_ENTRIES = Histogram(
+    "email_guard_history_flush_entries",
+    "Number of history entries committed per batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+HISTORY_FLUSH_ERRORS = Counter(
+    "email_guard_history_flush_errors_total",
+    "History batches that failed to commit and were retried"
+)
+
+class HistoryWriter:
+    """
+    Write-behind queue for scan history
+    
+    submit() only appends to an in-memory queue. A background thread commits
+    queued entries in batches (one transaction per batch), so requests never
+    wait on disk I/O unless the queue is full. Entries stay in the queue until
+    their batch has committed, which lets readers merge not-yet-persisted
+    entries via pending_for(). stop() drains the queue before returning.
+    
+    Failed batches are retried with exponential backoff. Once stop() has been
+    called, the writer gives up after HISTORY_STOP_RETRIES more failures and
+    the entries still queued are lost.
+    """
+    
+    def __init__(self, store: HistoryStore, batch_size: int = HISTORY_FLUSH_BATCH,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL_MS / 1000.0,
+                 max_queue: int = HISTORY_QUEUE_MAX):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._pid = None
+    
+    def _reset_after_fork(self):
+        """Drop state inherited from a parent process; its queue is the parent's to flush"""
+        if self._pid is not None and self._pid != os.getpid():
+            self._pending = deque()
+            self._cond = threading.Condition()
+            self._thread = None
+            self._pid = None
+    
+    def _ensure_started(self):
+        """Start the flush thread if it is not running (call with the lock held)"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, entry: Dict[str, Any]):
+        """Queue a history entry for writing, blocking only if the queue is full"""
+        self._reset_after_fork()
+        with self._cond:
+            self._ensure_started()
+            while len(self._pending) >= self.max_queue and not self._stopping:
+                self._cond.wait()
+            self._pending.append(entry)
+            HISTORY_QUEUE_DEPTH.set(len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+    
+    def pending_for(self, user_id: str) -> List[Dict[str, Any]]:
+        """Return queued entries for a user that may not be committed yet"""
+        self._reset_after_fork()
+        with self._cond:
+            return [entry for entry in self._pending if entry['user_id'] == user_id]
+    
+    def queue_depth(self) -> int:
+        """Number of entries accepted but not yet committed"""
+        return len(self._pending)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is committed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending and self._thread is not None and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._pending
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Drain the queue and stop the flush thread"""
+        self._reset_after_fork()
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def _run(self):
+        failures = 0
+        stop_failures = 0
+        while True:
+            with self._cond:
+                if not self._pending and not self._stopping:
+                    # Entries arriving during the wait are committed together
+                    self._cond.wait(self.flush_interval)
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    continue
+                batch = list(islice(self._pending, self.batch_size))
+            
+            start = time.perf_counter()
+            try:
+                self.store.add_entries(batch)
+            except Exception as e:
+                HISTORY_FLUSH_ERRORS.inc()
+                failures += 1
+                with self._cond:
+                    delay = min(HISTORY_RETRY_MAX_S, max(self.flush_interval, 0.1) * 2 ** (failures - 1))
+                    if self._stopping:
+                        stop_failures += 1
+                        if stop_failures >= HISTORY_STOP_RETRIES:
+                            print(f"History flush failed, dropping {len(self._pending)} queued entries: {e}")
+                            return
+                        # Shutdown only waits for a few quick retries
+                        delay = max(self.flush_interval, 0.1)
+                    if failures == 1 or delay == HISTORY_RETRY_MAX_S:
+                        print(f"History flush failed, retrying in {delay:.1f}s: {e}")
+                    # stop() interrupts the wait
+                    self._cond.wait(delay)
+                continue
+            failures = 0
+            HISTORY_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            HISTORY_FLUSH_ENTRIES.observe(len(batch))
+            
+            with self._cond:
+                for _ in range(len(batch)):
+                    self._pending.popleft()
+                HISTORY_QUEUE_DEPTH.set(len(self._pending))
+                self._cond.notify_all()
+
+# Global history writer instance
+_writer = None
+
+def get_history_writer() -> HistoryWriter:
+    """Get or create the global history writer"""
+    global _writer
+    if _writer is None:
+        _writer = HistoryWriter(get_history_store())
+    return _writer
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+# Crockford base32 alphabet (no I, L, O, U), so ids sort the same as their bytes
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+class MonotonicIdGenerator:
+    """
+    Generates ULID-style ids: 48-bit millisecond timestamp + 80 random bits
+    
+    Ids are 26 characters, sort lexicographically in creation order and are
+    unique without coordination. Within one process, ids created in the same
+    millisecond (or while the clock steps backwards) increment the random part
+    instead of drawing a new one, so they stay strictly increasing.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+    
+    def new_id(self) -> str:
+        """Return a new unique, time-ordered id"""
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms <= self._last_ms:
+                now_ms = self._last_ms
+                random_part = self._last_random + 1
+                if random_part >= 1 << _RANDOM_BITS:
+                    # Random space for this millisecond exhausted; borrow the next one
+                    now_ms += 1
+                    random_part = int.from_bytes(os.urandom(10), 'big')
+            else:
+                random_part = int.from_bytes(os.urandom(10), 'big')
+            self._last_ms = now_ms
+            self._last_random = random_part
+        return _encode((now_ms << _RANDOM_BITS) | random_part)
+
+def _encode(value: int) -> str:
+    """Encode a 128-bit integer as 26 Crockford base32 characters"""
+    chars = []
+    for _ in range(26):
+        chars.append(_ALPHABET[value & 0x1F])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+def id_timestamp_ms(history_id: str) -> int:
+    """Return the millisecond timestamp encoded in an id from new_history_id"""
+    value = 0
+    for char in history_id[:10]:
+        value = (value << 5) | _ALPHABET.index(char)
+    return value
+
+# Global id generator instance
+_generator = MonotonicIdGenerator()
+
+def new_history_id() -> str:
+    """Return a new unique, time-ordered history entry id"""
+    return _generator.new_id()
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+# Metric classes (no-op stand-ins without prometheus_client) live next to the
+# analyzers, which declare metrics too; add the ai directory to the path as scan.py does
+for ai_path in ('/app/ai', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'ai')):
+    if os.path.isdir(ai_path) and ai_path not in sys.path:
+        sys.path.append(ai_path)
+
+from prometheus_compat import Counter, Gauge, Histogram, PROMETHEUS_AVAILABLE
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+else:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets (seconds) covering rule-based checks up to slow model inference
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Request level metrics
+SCAN_REQUESTS_IN_FLIGHT = Gauge(
+    "email_guard_scan_requests_in_flight",
+    "Scan requests currently being processed"
+)
+SCAN_REQUEST_SECONDS = Histogram(
+    "email_guard_scan_request_seconds",
+    "End-to-end /scan/email request latency",
+    buckets=LATENCY_BUCKETS
+)
+SCAN_ERRORS = Counter(
+    "email_guard_scan_errors_total",
+    "Failed scan requests by reason",
+    ["reason"]
+)
+SANITIZER_REJECTIONS = Counter(
+    "email_guard_sanitizer_rejections_total",
+    "Scan inputs rejected by verify_and_sanitize_input"
+)
+AUTH_SECONDS = Histogram(
+    "email_guard_auth_seconds",
+    "Time spent authenticating requests",
+    buckets=LATENCY_BUCKETS
+)
+
+# Scan pipeline metrics
+SCAN_SECONDS = Histogram(
+    "email_guard_scan_seconds",
+    "Time spent in scan_email",
+    buckets=LATENCY_BUCKETS
+)
+SCAN_DECISIONS = Counter(
+    "email_guard_scan_decisions_total",
+    "Model decisions returned by scan_email",
+    ["model_name", "decision"]
+)
+HISTORY_WRITE_SECONDS = Histogram(
+    "email_guard_history_write_seconds",
+    "Time spent persisting scan history",
+    buckets=LATENCY_BUCKETS
+)
+
+# Cache metrics (hit ratio = hit / (hit + miss))
+CACHE_REQUESTS = Counter(
+    "email_guard_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+
+@contextmanager
+def observe_seconds(metric):
+    """Observe the wall time of the with-block on a histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+def cache_counters(cache: str) -> Tuple[object, object]:
+    """Return pre-bound (hit, miss) counters for a cache"""
+    return CACHE_REQUESTS.labels(cache, "hit"), CACHE_REQUESTS.labels(cache, "miss")
+
+def render_metrics() -> bytes:
+    """Render all registered metrics in the Prometheus text format"""
+    if not PROMETHEUS_AVAILABLE:
+        return b""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Pre-forked workers (prefork.py) share metrics through files; aggregate all of them
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
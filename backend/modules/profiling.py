@@ -0,0 +1,87 @@
+import cProfile
+import os
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any
+
+# Profiles are only ever written here; the API can change the rate, not the path
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "backend/profiles")
+
+class SamplingProfiler:
+    """
+    Profiles a random fraction of requests with cProfile
+    
+    Sampling is off (rate 0) unless PROFILE_SAMPLE_RATE is set or an admin
+    enables it at runtime. Each sampled request is written to the output
+    directory as a .prof file readable with pstats or snakeviz. Only one
+    request is profiled at a time; concurrent samples are skipped.
+    """
+    
+    def __init__(self, output_dir: str = PROFILE_OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.max_profiles = int(os.getenv("PROFILE_MAX_FILES", "1000"))
+        self.profiles_written = 0
+        self._lock = threading.Lock()
+    
+    def configure(self, sample_rate: float, max_profiles: int = None):
+        """Change the sampling rate (0 disables profiling)"""
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.sample_rate = sample_rate
+        if max_profiles is not None:
+            self.max_profiles = max_profiles
+        self.profiles_written = 0
+    
+    def status(self) -> Dict[str, Any]:
+        """Return the current profiler settings"""
+        return {
+            'sample_rate': self.sample_rate,
+            'max_profiles': self.max_profiles,
+            'profiles_written': self.profiles_written,
+            'output_dir': self.output_dir
+        }
+    
+    @contextmanager
+    def maybe_profile(self, name: str):
+        """Profile the with-block if this call is sampled"""
+        if (self.sample_rate <= 0.0
+                or self.profiles_written >= self.max_profiles
+                or random.random() >= self.sample_rate
+                or not self._lock.acquire(blocking=False)):
+            yield
+            return
+        
+        profile = cProfile.Profile()
+        try:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is already active in this process
+                yield
+                return
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._write(profile, name)
+        finally:
+            self._lock.release()
+    
+    def _write(self, profile: cProfile.Profile, name: str):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}.prof"
+            profile.dump_stats(os.path.join(self.output_dir, filename))
+            self.profiles_written += 1
+        except OSError as e:
+            print(f"Failed to write profile: {e}")
+
+# Global profiler instance
+_profiler = SamplingProfiler()
+
+def get_profiler() -> SamplingProfiler:
+    """Get the global sampling profiler"""
+    return _profiler
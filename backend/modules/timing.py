@@ -0,0 +1,34 @@
+import re
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+class ServerTiming:
+    """Collects named stage durations for a Server-Timing response header"""
+    
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+    
+    def add(self, name: str, seconds: float):
+        """Record a stage duration in seconds"""
+        self.stages.append((name, seconds))
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Record the duration of the with-block as a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+    
+    def header_value(self) -> str:
+        """Format the stages as a Server-Timing header value (durations in ms)"""
+        return ", ".join(
+            f"{_metric_name(name)};dur={seconds * 1000:.2f}"
+            for name, seconds in self.stages
+        )
+
+def _metric_name(name: str) -> str:
+    """Restrict a stage name to characters allowed in a header token"""
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name)
@@ -0,0 +1,442 @@
+"""
+Pre-forked production server
+
+The master process imports email_guard, builds and warms the analyzers, and
+then forks the API workers. Model weights are inherited copy-on-write (and
+are file-backed with MODEL_MMAP), so N workers use close to a single copy of
+model memory and start serving without loading anything.
+
+Signals to the master:
+- SIGHUP: rebuild the analyzers (re-reading ANALYZERS_CONFIG and the model
+  files), start a new generation of workers and gracefully stop the old one
+- SIGTERM / SIGINT: stop the workers gracefully and exit
+
+Workers are recycled after WORKER_MAX_REQUESTS requests and replaced when
+they exit. Metrics from all workers are aggregated through
+PROMETHEUS_MULTIPROC_DIR (a temporary directory unless set).
+
+Each worker slot is pinned to its own set of cores with a matching number
+of torch threads (ai/cpu_topology.py), so workers do not oversubscribe the
+CPU. With --calibrate the master first measures every workers x threads
+split and uses the fastest.
+
+Usage:
+    python prefork.py --workers 4 --port 8000
+"""
+
+import argparse
+import gc
+import os
+import random
+import select
+import signal
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# API worker processes (0 = one per usable CPU core)
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", "0"))
+
+# Requests after which a worker is replaced (0 = never), plus up to JITTER more so workers do not restart together
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "0"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "0"))
+
+# Seconds a stopping worker may spend finishing in-flight requests before it is killed
+WORKER_GRACEFUL_TIMEOUT_S = float(os.getenv("WORKER_GRACEFUL_TIMEOUT_S", "30"))
+
+# Torch intra-op threads per worker (0 = the physical cores of the worker's CPU set)
+WORKER_TORCH_THREADS = int(os.getenv("WORKER_TORCH_THREADS", "0"))
+
+# Pin each worker to a disjoint set of cores
+WORKER_CPU_PINNING = os.getenv("WORKER_CPU_PINNING", "1") == "1"
+
+# Seconds to benchmark each workers x threads split at startup and pick the fastest (0 = off)
+WORKER_CALIBRATE_S = float(os.getenv("WORKER_CALIBRATE_S", "0"))
+
+# Scanned once in the master so every code path is imported and initialized before forking
+WARMUP_EMAIL = "Your account has been suspended. Verify your password at http://example.com/login"
+
+# Workers that exit sooner than this after starting are respawned with a delay
+MIN_WORKER_LIFETIME_S = 1.0
+
+class Worker:
+    """A forked API worker"""
+    
+    def __init__(self, pid: int, generation: int, slot: int):
+        self.pid = pid
+        self.generation = generation
+        # Index of the worker's CPU set; a replacement takes over the same slot
+        self.slot = slot
+        self.started = time.monotonic()
+        # Set when the master asked the worker to stop
+        self.stopping_since = None
+
+def prepare_metrics_dir() -> str:
+    """
+    Point PROMETHEUS_MULTIPROC_DIR at an empty directory
+    
+    Must run before prometheus_client is imported, since it picks its value
+    storage at import time.
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="email_guard_metrics_")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            # Left over from a previous run
+            os.remove(os.path.join(path, name))
+    return path
+
+class PreforkServer:
+    """
+    Master process: loads the models, forks workers and keeps them running
+    
+    Args:
+        workers: Number of API workers (0 = one per usable core)
+        host, port: Address to listen on (bound once in the master and shared by all workers)
+        max_requests: Requests after which a worker is replaced (0 = never)
+        max_requests_jitter: Random extra requests per worker
+        graceful_timeout: Seconds a stopping worker gets to finish in-flight requests
+        torch_threads: Torch intra-op threads per worker (0 = derived from its CPU set)
+        pinning: Pin each worker to a disjoint set of cores
+        calibrate_seconds: Benchmark each workers x threads split this long and
+            use the fastest, overriding workers and torch_threads (0 = off)
+    """
+    
+    def __init__(self, workers: int = PREFORK_WORKERS, host: str = "0.0.0.0", port: int = 8000,
+                 max_requests: int = WORKER_MAX_REQUESTS,
+                 max_requests_jitter: int = WORKER_MAX_REQUESTS_JITTER,
+                 graceful_timeout: float = WORKER_GRACEFUL_TIMEOUT_S,
+                 torch_threads: int = WORKER_TORCH_THREADS,
+                 pinning: bool = WORKER_CPU_PINNING,
+                 calibrate_seconds: float = WORKER_CALIBRATE_S):
+        self.num_workers = workers
+        self.host = host
+        self.port = port
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.torch_threads = torch_threads
+        self.pinning = pinning
+        self.calibrate_seconds = calibrate_seconds
+        # Per slot: CPUs to pin to (None = not pinned) and torch threads
+        self.cpu_sets: List[Optional[List[int]]] = []
+        self.slot_threads: List[int] = []
+        self.workers: Dict[int, Worker] = {}
+        self.generation = 0
+        self.socket = None
+        self.app = None
+        self._signals: List[int] = []
+        self._wakeup = None
+        self._respawn_after = 0.0
+    
+    def load(self, reload: bool = False):
+        """Import the app and build and warm the analyzers"""
+        import scan
+        import app as api
+        self.app = api.app
+        
+        if scan.INFERENCE_SOCKET:
+            print(f"Models run in the inference server at {scan.INFERENCE_SOCKET}")
+            return
+        if not scan.EMAIL_GUARD_AVAILABLE:
+            print("email_guard not available; workers will serve without models")
+            return
+        import email_guard
+        # Torch's OpenMP pool does not survive fork: a child of a process that ran
+        # multi-threaded ops hangs on its first parallel op, so the master stays single-threaded
+        if email_guard.load_ml_libraries():
+            email_guard.torch.set_num_threads(1)
+        
+        start = time.perf_counter()
+        analyzer = email_guard.reload_analyzer() if reload else email_guard.get_analyzer()
+        analyzer.analyze_email(WARMUP_EMAIL)
+        print(f"✓ Loaded {len(analyzer.analyzers)} analyzers in {time.perf_counter() - start:.1f}s")
+        
+        # Keep the garbage collector from writing to (and so copying) every inherited object
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+    
+    def plan(self):
+        """Decide the number of workers and each slot's cores and threads"""
+        try:
+            import cpu_topology
+        except ImportError:
+            workers = self.num_workers or os.cpu_count() or 1
+            self.num_workers = workers
+            self.cpu_sets = [None] * workers
+            self.slot_threads = [self.torch_threads or max(1, (os.cpu_count() or 1) // workers)] * workers
+            return
+        
+        groups = cpu_topology.usable_core_groups()
+        if self.calibrate_seconds > 0:
+            self.calibrate(cpu_topology, groups)
+        workers = self.num_workers or len(groups)
+        self.num_workers = workers
+        
+        if self.pinning:
+            self.cpu_sets = cpu_topology.plan_workers(workers, groups)
+            self.slot_threads = [self.torch_threads or cpu_topology.threads_for(cpus, groups) for cpus in self.cpu_sets]
+        else:
+            self.cpu_sets = [None] * workers
+            self.slot_threads = [self.torch_threads or max(1, len(groups) // workers)] * workers
+        print(f"{len(groups)} usable cores; worker CPU sets: "
+              + ", ".join(f"{cpus or 'any'} x{threads}" for cpus, threads in zip(self.cpu_sets, self.slot_threads)))
+    
+    def calibrate(self, cpu_topology, groups: List[List[int]]):
+        """Measure every workers x threads split with the warm-up email and keep the fastest"""
+        import scan
+        if scan.INFERENCE_SOCKET or not scan.EMAIL_GUARD_AVAILABLE:
+            print("Skipping calibration: no models in this process")
+            return
+        import email_guard
+        analyzer = email_guard.get_analyzer()
+        (workers, threads), _ = cpu_topology.calibrate(
+            lambda: analyzer.analyze_email(WARMUP_EMAIL), self.calibrate_seconds, groups
+        )
+        print(f"Calibrated: {workers} workers x {threads} threads")
+        self.num_workers = workers
+        self.torch_threads = threads
+    
+    def bind(self):
+        """Open the listening socket the workers will share"""
+        from uvicorn import Config
+        self.socket = Config(self.app, host=self.host, port=self.port).bind_socket()
+    
+    def run(self) -> int:
+        """Serve until SIGTERM or SIGINT"""
+        self.load()
+        self.plan()
+        self.bind()
+        self._install_signals()
+        print(f"Master {os.getpid()} serving on {self.host}:{self.port} with {self.num_workers} workers")
+        self.spawn_workers()
+        
+        while True:
+            self._wait(1.0)
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.stop()
+                    return 0
+                if signum == signal.SIGHUP:
+                    self.reload()
+            self.reap_workers()
+            self.kill_stragglers()
+            self.spawn_workers()
+    
+    def _install_signals(self):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self._wakeup = (read_fd, write_fd)
+        signal.set_wakeup_fd(write_fd)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+    
+    def _on_signal(self, signum, frame):
+        if signum != signal.SIGCHLD:
+            self._signals.append(signum)
+    
+    def _wait(self, timeout: float):
+        """Sleep until a signal arrives or timeout passes"""
+        try:
+            ready, _, _ = select.select([self._wakeup[0]], [], [], timeout)
+        except InterruptedError:
+            return
+        if ready:
+            try:
+                while os.read(self._wakeup[0], 4096):
+                    pass
+            except BlockingIOError:
+                pass
+    
+    def spawn_workers(self):
+        """Fork workers until the current generation has num_workers"""
+        if time.monotonic() < self._respawn_after:
+            return
+        used = {worker.slot for worker in self.workers.values()
+                if worker.generation == self.generation and worker.stopping_since is None}
+        for slot in range(self.num_workers):
+            if slot not in used:
+                self.spawn_worker(slot)
+    
+    def spawn_worker(self, slot: int):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = Worker(pid, self.generation, slot)
+            print(f"Started worker {pid} (generation {self.generation}, slot {slot})")
+            return
+        
+        status = 1
+        try:
+            status = self._run_worker(slot)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+    
+    def _run_worker(self, slot: int) -> int:
+        """Body of a forked worker; returns the exit status"""
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        os.close(self._wakeup[0])
+        os.close(self._wakeup[1])
+        gc.unfreeze()
+        
+        cpus, threads = self.cpu_sets[slot], self.slot_threads[slot]
+        try:
+            import cpu_topology
+            cpu_topology.pin_current_process(cpus, threads)
+        except ImportError:
+            pass
+        
+        import email_guard
+        if email_guard._analyzer is not None:
+            email_guard._analyzer.residency.after_fork()
+            if email_guard.torch is not None:
+                email_guard.torch.set_num_threads(threads)
+        
+        import uvicorn
+        max_requests = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else None
+        server = None
+        
+        async def app(scope, receive, send):
+            # uvicorn only checks the request limit every 0.1s and, when shutting down, closes
+            # connections accepted in the meantime without answering them. Stop accepting as
+            # soon as the limit is reached so new connections go to the other workers.
+            if (max_requests is not None and scope['type'] == 'http'
+                    and server.server_state.total_requests >= max_requests):
+                for listener in server.servers:
+                    listener.close()
+            await self.app(scope, receive, send)
+        
+        config = uvicorn.Config(
+            app,
+            limit_max_requests=max_requests,
+            timeout_graceful_shutdown=self.graceful_timeout
+        )
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.socket])
+        return 0
+    
+    def reap_workers(self):
+        """Collect exited workers"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self._mark_dead(pid)
+            
+            code = os.waitstatus_to_exitcode(status)
+            if worker.stopping_since is None:
+                print(f"Worker {pid} exited with status {code}; replacing it")
+                if code != 0 and time.monotonic() - worker.started < MIN_WORKER_LIFETIME_S:
+                    # Crashing on startup: do not fork in a tight loop
+                    self._respawn_after = time.monotonic() + MIN_WORKER_LIFETIME_S
+            else:
+                print(f"Worker {pid} stopped")
+    
+    def _mark_dead(self, pid: int):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+        except ImportError:
+            pass
+    
+    def stop_worker(self, worker: Worker, signum: int = signal.SIGTERM):
+        """Ask a worker to finish its in-flight requests and exit"""
+        if worker.stopping_since is None:
+            worker.stopping_since = time.monotonic()
+        try:
+            os.kill(worker.pid, signum)
+        except ProcessLookupError:
+            pass
+    
+    def kill_stragglers(self):
+        """Kill workers that did not stop within the graceful timeout"""
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.stopping_since is not None and now - worker.stopping_since > self.graceful_timeout + 5:
+                print(f"Worker {worker.pid} did not stop in time; killing it")
+                self.stop_worker(worker, signal.SIGKILL)
+    
+    def reload(self):
+        """Rebuild the analyzers, then replace every worker with one forked from the new state"""
+        print("Reloading analyzers")
+        try:
+            self.load(reload=True)
+        except Exception as e:
+            print(f"Reload failed, keeping the current workers: {e}")
+            return
+        
+        old_workers = list(self.workers.values())
+        self.generation += 1
+        self._respawn_after = 0.0
+        # The listening socket is shared, so the new workers accept while the old ones drain
+        self.spawn_workers()
+        for worker in old_workers:
+            self.stop_worker(worker)
+    
+    def stop(self):
+        """Stop all workers gracefully, killing any that outlive the timeout"""
+        print("Stopping workers")
+        for worker in list(self.workers.values()):
+            self.stop_worker(worker)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap_workers()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            self.stop_worker(worker, signal.SIGKILL)
+        self.reap_workers()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with models loaded once and shared by forked workers")
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS,
+                        help="API worker processes (default: PREFORK_WORKERS, 0 = one per usable core)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-requests", type=int, default=WORKER_MAX_REQUESTS,
+                        help="Replace a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=WORKER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=float, default=WORKER_GRACEFUL_TIMEOUT_S)
+    parser.add_argument("--torch-threads", type=int, default=WORKER_TORCH_THREADS,
+                        help="Torch intra-op threads per worker (default: physical cores of its CPU set)")
+    parser.add_argument("--pin", action=argparse.BooleanOptionalAction, default=WORKER_CPU_PINNING,
+                        help="Pin each worker to a disjoint set of cores (default: WORKER_CPU_PINNING)")
+    parser.add_argument("--calibrate", type=float, default=WORKER_CALIBRATE_S, metavar="SECONDS",
+                        help="Benchmark each workers x threads split for SECONDS and use the fastest")
+    args = parser.parse_args(argv)
+    
+    # Master and worker output interleaves in one log; write it out line by line
+    sys.stdout.reconfigure(line_buffering=True)
+    prepare_metrics_dir()
+    server = PreforkServer(
+        workers=max(0, args.workers),
+        host=args.host,
+        port=args.port,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+        torch_threads=args.torch_threads,
+        pinning=args.pin,
+        calibrate_seconds=args.calibrate
+    )
+    return server.run()
+
+if __name__ == "__main__":
+    sys.exit(main())
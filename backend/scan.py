@@ -1,39 +1,107 @@
 import sys
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import hashlib
 import json
+import time
 from datetime import datetime
 
+from modules.metrics import SCAN_SECONDS, SCAN_DECISIONS, HISTORY_WRITE_SECONDS, observe_seconds
+from modules.history_store import get_history_store, entry_matches, encode_cursor, decode_cursor
+from modules.history_writer import HISTORY_WRITE_BEHIND, get_history_writer
+from modules.ids import new_history_id
+from modules.timing import ServerTiming
+
 # Add the ai directory to the path to import email_guard
 ai_path = '/app/ai'
 sys.path.append(ai_path)
 
 # Try to import email_guard
 try:
-    from email_guard import analyze_email_with_models
+    from email_guard import analyze_email_with_models, collect_stage_timings
     print("Successfully imported email_guard")
     EMAIL_GUARD_AVAILABLE = True
 except ImportError as e:
     print(f"Failed to import email_guard: {e}")
     EMAIL_GUARD_AVAILABLE = False
 
-def scan_email(email_text: str) -> List[Dict[str, Any]]:
+# Unix socket of a standalone inference server (ai/inference_server.py); empty = analyze in this process
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+
+_inference_client = None
+
+def get_inference_client():
+    """Get the pooled client for INFERENCE_SOCKET"""
+    global _inference_client
+    if _inference_client is None:
+        from inference_server import InferenceClient
+        _inference_client = InferenceClient(INFERENCE_SOCKET)
+    return _inference_client
+
+def models_available() -> bool:
+    """Whether scans can reach the models, in this process or on the inference server"""
+    return bool(INFERENCE_SOCKET) or EMAIL_GUARD_AVAILABLE
+
+def get_model_status(known_version: Optional[int] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """
+    Model registry version and model status from wherever the models run
+    
+    Args:
+        known_version: Registry version the caller already has the status for
+        
+    Returns:
+        (registry version, email_guard.get_model_info() result); the status is
+        None when it is local and unchanged since known_version. Both come
+        from a single round trip to the inference server.
+    """
+    if INFERENCE_SOCKET:
+        info = get_inference_client().info()
+        return info['registry_version'], info['models']
+    from email_guard import get_model_info as local_model_info
+    from email_guard import get_model_registry_version as local_registry_version
+    # Read the version first so a concurrent change is seen again next time
+    version = local_registry_version()
+    if version == known_version:
+        return version, None
+    return version, local_model_info()
+
+def get_model_residency() -> Dict[str, Dict[str, Any]]:
+    """Per-model residency from wherever the models run"""
+    if INFERENCE_SOCKET:
+        return get_inference_client().info()['residency']
+    from email_guard import get_model_residency as local_model_residency
+    return local_model_residency()
+
+def scan_email(email_text: str, timing: Optional[ServerTiming] = None,
+               deadline: Optional[float] = None, omitted: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     """
     Scan email text using available AI models
     
     Args:
         email_text: Sanitized email text to analyze
+        timing: Optional collector for per-analyzer stage durations
+        deadline: Optional time.monotonic() deadline; analyzers that would
+            not finish in time are skipped
+        omitted: Optional list that receives the names of skipped analyzers
         
     Returns:
         List of model results with required fields (only successful analyses)
     """
+    start = time.perf_counter()
     try:
-        # Only use email_guard if available
-        if not EMAIL_GUARD_AVAILABLE:
+        if INFERENCE_SOCKET:
+            # Models run in the inference server, batched with other workers' scans
+            model_results, stage_timings = get_inference_client().analyze(email_text, deadline=deadline, omitted=omitted)
+        elif not EMAIL_GUARD_AVAILABLE:
+            # Only use email_guard if available
             return []
-        
-        # Get results from AI models
-        model_results = analyze_email_with_models(email_text)
+        else:
+            # Get results from AI models
+            with collect_stage_timings() as stage_timings:
+                model_results = analyze_email_with_models(email_text, deadline=deadline, omitted=omitted)
+        if timing is not None:
+            for name, seconds in stage_timings:
+                timing.add(name, seconds)
         
         # Ensure all results have required fields
         validated_results = []
@@ -46,6 +114,7 @@ def scan_email(email_text: str) -> List[Dict[str, Any]]:
                 'description': result.get('description', 'No description available')
             }
             validated_results.append(validated_result)
+            SCAN_DECISIONS.labels(validated_result['model_name'], validated_result['decision']).inc()
         
         return validated_results
     
@@ -53,6 +122,8 @@ def scan_email(email_text: str) -> List[Dict[str, Any]]:
         # Return empty list if analysis fails (no fallback)
         print(f"Email analysis failed: {e}")
         return []
+    finally:
+        SCAN_SECONDS.observe(time.perf_counter() - start)
 
 def save_scan_history(user_id: str, email_text: str, results: List[Dict[str, Any]]) -> str:
     """
@@ -66,23 +137,21 @@ def save_scan_history(user_id: str, email_text: str, results: List[Dict[str, Any
     Returns:
         History entry ID
     """
-    # Create history directory if it doesn't exist
-    history_dir = "backend/scan_history"
-    os.makedirs(history_dir, exist_ok=True)
-    
-    # Create history entry
+    # Create history entry; ids are unique even for scans within the same second
     history_entry = {
-        'id': f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        'id': new_history_id(),
         'user_id': user_id,
         'timestamp': datetime.now().isoformat(),
         'email_snippet': email_text[:200] + "..." if len(email_text) > 200 else email_text,
         'results': results
     }
     
-    # Save to file
-    history_file = os.path.join(history_dir, f"{history_entry['id']}.json")
-    with open(history_file, 'w') as f:
-        json.dump(history_entry, f, indent=2)
+    # Queue for the background writer, or write synchronously if write-behind is off
+    with observe_seconds(HISTORY_WRITE_SECONDS):
+        if HISTORY_WRITE_BEHIND:
+            get_history_writer().submit(history_entry)
+        else:
+            get_history_store().add_entry(history_entry)
     
     return history_entry['id']
 
@@ -95,24 +164,128 @@ def get_scan_history(user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         limit: Maximum number of entries to return
         
     Returns:
-        List of history entries
+        List of history entries, newest first
     """
-    history_dir = "backend/scan_history"
-    if not os.path.exists(history_dir):
-        return []
+    return get_scan_history_page(user_id, limit)['history']
+
+def get_scan_history_page(user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                          decision: Optional[str] = None, model_name: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get one page of filtered scan history for a user
+    
+    Args:
+        user_id: User identifier
+        limit: Maximum number of entries to return
+        cursor: next_cursor from the previous page, if any
+        decision: Only entries where some model returned this decision
+        model_name: Only entries with a result from this model
+        since: Only entries at or after this ISO timestamp
+        until: Only entries before this ISO timestamp
+        
+    Returns:
+        Dictionary with 'history' (newest first) and 'next_cursor' (None on the last page)
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    filters = {
+        'before': decode_cursor(cursor) if cursor else None,
+        'decision': decision,
+        'model_name': model_name,
+        'since': since,
+        'until': until
+    }
+    
+    # Snapshot the write-behind queue before reading the store: an entry
+    # committed in between is then in both (and de-duplicated) instead of neither
+    pending = get_history_writer().pending_for(user_id) if HISTORY_WRITE_BEHIND else []
+    
+    # Fetch one extra row to know whether another page exists
+    history_entries = get_history_store().get_page(user_id, limit + 1, **filters)
     
-    history_entries = []
-    
-    # Get all history files for the user
-    for filename in os.listdir(history_dir):
-        if filename.startswith(f"{user_id}_") and filename.endswith('.json'):
-            try:
-                with open(os.path.join(history_dir, filename), 'r') as f:
-                    entry = json.load(f)
-                    history_entries.append(entry)
-            except (json.JSONDecodeError, FileNotFoundError):
-                continue
-    
-    # Sort by timestamp (newest first) and limit results
-    history_entries.sort(key=lambda x: x['timestamp'], reverse=True)
-    return history_entries[:limit]
\ No newline at end of file
+    # Include matching entries still waiting in the write-behind queue
+    if pending:
+        stored_ids = {entry['id'] for entry in history_entries}
+        history_entries.extend(
+            entry for entry in pending
+            if entry['id'] not in stored_ids and entry_matches(entry, **filters)
+        )
+        history_entries.sort(key=lambda x: (x['timestamp'], x['id']), reverse=True)
+    
+    page = history_entries[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(history_entries) > limit and page else None
+    return {'history': page, 'next_cursor': next_cursor}
+
+def get_scan_history_etag(user_id: str, query: str = "") -> str:
+    """
+    Get a strong ETag for a user's history as returned by get_scan_history_page
+    
+    Only reads the user's history version and the write-behind queue, so it
+    is cheap enough to check on every poll.
+    
+    Args:
+        user_id: User identifier
+        query: Canonical form of the page and filter parameters
+        
+    Returns:
+        Quoted ETag value
+    """
+    # Read the queue before the version: an entry committed in between then
+    # still changes the tag instead of vanishing from both
+    pending = get_history_writer().pending_for(user_id) if HISTORY_WRITE_BEHIND else []
+    version = get_history_store().get_version(user_id)
+    digest = hashlib.sha256(user_id.encode())
+    digest.update(f"|{version}|{query}|".encode())
+    for entry in pending:
+        digest.update(entry['id'].encode())
+    return f'"h-{digest.hexdigest()[:32]}"'
+
+def iter_scan_history(user_id: str, since: Optional[str] = None,
+                      until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate a user's full scan history, oldest first, without loading it into memory
+    
+    Entries still in the write-behind queue come last. The queue is read
+    before the store, so an entry committed meanwhile is yielded once: by
+    the store if the iteration had not passed it yet, otherwise from the
+    queue snapshot (then possibly after newer entries).
+    
+    Args:
+        user_id: User identifier
+        since: Only entries at or after this ISO timestamp
+        until: Only entries before this ISO timestamp
+        
+    Yields:
+        History entries
+    """
+    pending = get_history_writer().pending_for(user_id) if HISTORY_WRITE_BEHIND else []
+    pending_ids = {entry['id'] for entry in pending}
+    
+    after = None
+    if since is not None:
+        # Keyset positions sort before every entry with timestamp >= since
+        after = (since, "")
+    yielded_pending = set()
+    for entry in get_history_store().iter_entries(user_id, after=after, until=until):
+        if entry['id'] in pending_ids:
+            yielded_pending.add(entry['id'])
+        yield entry
+    
+    for entry in sorted(pending, key=lambda x: (x['timestamp'], x['id'])):
+        if entry['id'] not in yielded_pending and entry_matches(entry, since=since, until=until):
+            yield entry
+
+def get_scan_stats(user_id: str, days: int = 30) -> Dict[str, Any]:
+    """
+    Get summary statistics of a user's scans
+    
+    Args:
+        user_id: User identifier
+        days: Length of the daily series, ending today
+        
+    Returns:
+        Dictionary with total_scans, decisions, analyzers, confidence_histogram and daily
+    """
+    pending = get_history_writer().pending_for(user_id) if HISTORY_WRITE_BEHIND else []
+    return get_history_store().get_stats(user_id, days, pending=pending)
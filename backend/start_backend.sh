@@ -25,6 +25,13 @@ fi
 
 echo "Models ready!"
 
+# Pre-forked mode: models load once in the master before the workers are forked
+if [ "${SERVER_MODE:-uvicorn}" = "prefork" ]; then
+    echo "Starting pre-forked server..."
+    cd /app
+    exec python3 prefork.py
+fi
+
 # Start model preloading in background (non-blocking)
 echo "Starting model preloading in background..."
 cd /app
@@ -0,0 +1,77 @@
+# benchmarks/corpus.py
+"""
+Reproducible synthetic email corpus for benchmarks
+
+The same seed always yields the same emails, so results from different
+builds are measured on identical input.
+"""
+
+import random
+from typing import List, Dict
+
+# Sentence pools per class; emails are built by sampling from these
+_SENTENCES = {
+    'phishing': [
+        "Your account has been suspended due to unusual activity.",
+        "Verify your password immediately to avoid permanent closure.",
+        "Click here to confirm your banking details: http://secure-{word}.tk/login",
+        "Urgent action required within 24 hours.",
+        "We detected an unauthorized login attempt from a new device.",
+        "Please update your payment information to continue using our service.",
+        "Your invoice #{number} is attached, open it to avoid late fees.",
+    ],
+    'spam': [
+        "Congratulations, you have won a free {word} gift card!",
+        "Limited time offer: buy one get one free on all {word} products.",
+        "Earn ${number} per week working from home.",
+        "Unsubscribe at any time by replying STOP.",
+        "Exclusive deal for our valued customers, act now.",
+        "Lose weight fast with our miracle {word} supplement.",
+    ],
+    'safe': [
+        "Hi team, the meeting has moved to {number} pm tomorrow.",
+        "Please find the minutes from last week's {word} review attached.",
+        "Thanks for your help with the {word} migration.",
+        "Let me know if you have any questions about the proposal.",
+        "The quarterly report is ready for your review.",
+        "Lunch is on me on Friday to celebrate the {word} launch.",
+    ],
+}
+
+_WORDS = [
+    "paypal", "amazon", "office", "project", "budget", "security", "apple",
+    "delivery", "cloud", "quarterly", "design", "shipping", "wallet", "portal",
+]
+
+def generate_email(rng: random.Random, label: str, size: int) -> str:
+    """Build one email of the given class, roughly size characters long"""
+    lines = [
+        f"From: {rng.choice(_WORDS)}@example.com",
+        f"Subject: {rng.choice(_SENTENCES[label]).format(word=rng.choice(_WORDS), number=rng.randint(1, 9999))}",
+        "",
+        f"Dear {rng.choice(['customer', 'user', 'colleague', 'team'])},",
+    ]
+    text = "\n".join(lines)
+    while len(text) < size:
+        sentence = rng.choice(_SENTENCES[label]).format(word=rng.choice(_WORDS), number=rng.randint(1, 9999))
+        text += " " + sentence
+    return text[:size]
+
+def generate_corpus(count: int, seed: int = 1234, sizes: List[int] = (500, 1500, 4000)) -> List[Dict[str, str]]:
+    """
+    Generate a labelled corpus with a fixed class and size mix
+    
+    Args:
+        count: Number of emails
+        seed: Random seed
+        sizes: Email sizes in characters, cycled through
+        
+    Returns:
+        List of {'label', 'text'} dicts
+    """
+    rng = random.Random(seed)
+    labels = ['phishing', 'spam', 'safe']
+    return [
+        {'label': labels[index % len(labels)], 'text': generate_email(rng, labels[index % len(labels)], sizes[index % len(sizes)])}
+        for index in range(count)
+    ]
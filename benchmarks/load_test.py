@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# benchmarks/load_test.py
+"""
+HTTP load generator for the Email Guard API
+
+Drives backend/app.py either in-process through httpx's ASGI transport (no
+APISIX, etcd or network involved) or a running server given with --url.
+Each virtual user logs in once, then issues a weighted mix of auth, scan
+and history requests back to back until the duration or request budget is
+used up. Scanned emails come from the benchmark corpus with a weighted size
+distribution.
+
+The in-process target is isolated: it writes history and profiles to a
+temporary directory that is removed afterwards, never captures traffic, and
+authenticates with generated tokens, whatever the environment says.
+
+Reports throughput, latency percentiles and error rates per request type as
+JSON, in the same result format as run_benchmarks.py so --baseline works
+the same way.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 16 --duration 30
+    python benchmarks/load_test.py --mix scan=1 --sizes 4000:1 --requests 500
+    python benchmarks/load_test.py --url http://localhost:8000 --token sample_token_1 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+import httpx
+
+# run_benchmarks also puts ai/ and backend/ on the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import generate_email
+from run_benchmarks import DEFAULT_THRESHOLD, compare_to_baseline, percentile
+
+# Default request mix (type=weight) and email sizes (characters:weight)
+DEFAULT_MIX = "auth=1,scan=8,history=1"
+DEFAULT_SIZES = "500:5,1500:3,4000:2"
+
+REQUEST_TYPES = ('auth', 'scan', 'history')
+
+# Base URL used for the in-process ASGI transport
+INPROCESS_URL = "http://testserver"
+
+def parse_weights(spec: str, types: Optional[Tuple[str, ...]] = None, separator: str = "=") -> List[Tuple[str, float]]:
+    """
+    Parse "a=1,b=3" style weights
+    
+    Args:
+        spec: Comma separated name<separator>weight pairs
+        types: Allowed names, if restricted
+        separator: Separator between name and weight
+        
+    Raises:
+        ValueError: On an unknown name, a negative weight or if all weights are zero
+    """
+    weights = []
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(separator)
+        if types is not None and name not in types:
+            raise ValueError(f"unknown request type '{name}' (expected one of: {', '.join(types)})")
+        value = float(weight or 1)
+        if value < 0:
+            raise ValueError(f"weight for '{name}' must not be negative")
+        weights.append((name, value))
+    if not any(weight for _, weight in weights):
+        raise ValueError(f"at least one weight in '{spec}' must be positive")
+    return weights
+
+def summarize(samples: List[float], errors: Dict[str, int], seconds: float) -> Dict[str, Any]:
+    """Latency percentiles, throughput and error rate of one request type"""
+    samples = sorted(samples)
+    error_count = sum(errors.values())
+    return {
+        'kind': 'latency',
+        'calls': len(samples),
+        'errors': error_count,
+        'error_rate': error_count / len(samples) if samples else 0.0,
+        'errors_by_status': dict(sorted(errors.items())),
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+        'throughput_per_s': len(samples) / seconds if seconds else 0.0
+    }
+
+class LoadStats:
+    """Latency samples and errors per request type"""
+    
+    def __init__(self):
+        self.samples = {request_type: [] for request_type in REQUEST_TYPES}
+        self.errors = {request_type: {} for request_type in REQUEST_TYPES}
+    
+    def record(self, request_type: str, seconds: float, error: Optional[str] = None):
+        self.samples[request_type].append(seconds)
+        if error is not None:
+            self.errors[request_type][error] = self.errors[request_type].get(error, 0) + 1
+    
+    def results(self, seconds: float) -> Dict[str, Any]:
+        results = {
+            f"load.{request_type}": summarize(self.samples[request_type], self.errors[request_type], seconds)
+            for request_type in REQUEST_TYPES if self.samples[request_type]
+        }
+        total_errors = {}
+        for errors in self.errors.values():
+            for status, count in errors.items():
+                total_errors[status] = total_errors.get(status, 0) + count
+        results['load.total'] = summarize(
+            [sample for samples in self.samples.values() for sample in samples], total_errors, seconds
+        )
+        return results
+
+class VirtualUser:
+    """One client session: a cookie jar, an auth token and the last seen history ETag"""
+    
+    def __init__(self, client: httpx.AsyncClient, token: str, rng: random.Random, sizes: List[Tuple[str, float]]):
+        self.client = client
+        self.token = token
+        self.rng = rng
+        self.sizes = sizes
+        self.history_etag = None
+    
+    async def request(self, request_type: str) -> httpx.Response:
+        if request_type == 'auth':
+            return await self.client.post("/auth/token", json={'token': self.token})
+        if request_type == 'scan':
+            size = int(self.rng.choices([s for s, _ in self.sizes], [w for _, w in self.sizes])[0])
+            label = self.rng.choice(('phishing', 'spam', 'safe'))
+            return await self.client.post("/scan/email", json={'email_text': generate_email(self.rng, label, size)})
+        # Poll history like the dashboard does, revalidating with the last ETag
+        headers = {'If-None-Match': self.history_etag} if self.history_etag else {}
+        response = await self.client.get("/history", params={'limit': 10}, headers=headers)
+        if response.status_code == 200:
+            self.history_etag = response.headers.get('etag')
+        return response
+    
+    async def timed(self, request_type: str, stats: Optional[LoadStats]):
+        """Issue one request and record its latency and outcome"""
+        start = time.perf_counter()
+        error = None
+        try:
+            response = await self.request(request_type)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if stats is not None:
+            stats.record(request_type, time.perf_counter() - start, error)
+
+async def run_load(client_factory, tokens: List[str], concurrency: int = 8, duration: float = 10.0,
+                   requests: Optional[int] = None, mix: str = DEFAULT_MIX, sizes: str = DEFAULT_SIZES,
+                   seed: int = 1234, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Run the load test and return the results
+    
+    Args:
+        client_factory: Callable returning a new httpx.AsyncClient for the target
+        tokens: Auth tokens, assigned to virtual users round robin
+        concurrency: Virtual users issuing requests at the same time
+        duration: Seconds to run (ignored when requests is given)
+        requests: Total measured requests to issue instead of a duration
+        mix: Request type weights, e.g. "auth=1,scan=8,history=1"
+        sizes: Email size weights in characters, e.g. "500:5,1500:3,4000:2"
+        seed: Seed for the request mix and email content
+        warmup: Unmeasured scans before the run, so model loading is not counted
+        
+    Returns:
+        Dictionary of load.<type> and load.total results plus the elapsed seconds
+    """
+    request_mix = parse_weights(mix, REQUEST_TYPES)
+    size_mix = parse_weights(sizes, separator=":")
+    clients = [client_factory() for _ in range(concurrency)]
+    users = [
+        VirtualUser(client, tokens[index % len(tokens)], random.Random(seed + index), size_mix)
+        for index, client in enumerate(clients)
+    ]
+    stats = LoadStats()
+    try:
+        # Log every user in before the clock starts
+        await asyncio.gather(*(user.timed('auth', None) for user in users))
+        for _ in range(warmup):
+            await users[0].timed('scan', None)
+        
+        issued = 0
+        start = time.perf_counter()
+        stop_at = start + duration
+        
+        async def drive(user: VirtualUser):
+            nonlocal issued
+            types = [t for t, _ in request_mix]
+            weights = [w for _, w in request_mix]
+            while (issued < requests) if requests is not None else (time.perf_counter() < stop_at):
+                issued += 1
+                await user.timed(user.rng.choices(types, weights)[0], stats)
+        
+        await asyncio.gather(*(drive(user) for user in users))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+    
+    return {'seconds': elapsed, 'results': stats.results(elapsed)}
+
+def _write_tokens_file(path: str, count: int) -> List[str]:
+    """Create a tokens CSV with count load-test users"""
+    expires_at = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
+    tokens = [f"load_test_token_{index}" for index in range(count)]
+    with open(path, 'w') as f:
+        f.write("token,sub,role,expires_at\n")
+        for index, token in enumerate(tokens):
+            f.write(f"{token},load-user-{index},user,{expires_at}\n")
+    return tokens
+
+@asynccontextmanager
+async def inprocess_target(concurrency: int, models_dir: Optional[str] = None):
+    """
+    Start backend/app.py in this process with isolated history and generated users
+    
+    Exported HISTORY_DIR, HISTORY_DB_PATH, PROFILE_OUTPUT_DIR and
+    SCAN_CAPTURE_PATH are overridden, so synthetic scans never reach real
+    history or captures.
+    
+    Yields:
+        (client_factory, tokens)
+    """
+    with tempfile.TemporaryDirectory(prefix="email-guard-load-", ignore_cleanup_errors=True) as workdir:
+        # Configuration is read at import time, so it has to be set before app is imported
+        os.environ["HISTORY_DIR"] = os.path.join(workdir, "history")
+        os.environ["HISTORY_DB_PATH"] = os.path.join(workdir, "history", "history.db")
+        os.environ["PROFILE_OUTPUT_DIR"] = os.path.join(workdir, "profiles")
+        os.environ["SCAN_CAPTURE_PATH"] = ""
+        if models_dir:
+            os.environ["EMAIL_GUARD_MODELS_DIR"] = models_dir
+        
+        from modules import authenticate
+        authenticate.TOKENS_FILE = os.path.join(workdir, "users.csv")
+        tokens = _write_tokens_file(authenticate.TOKENS_FILE, max(1, concurrency))
+        import app
+        
+        transport = httpx.ASGITransport(app=app.app)
+        async with app.app.router.lifespan_context(app.app):
+            yield (lambda: httpx.AsyncClient(transport=transport, base_url=INPROCESS_URL, timeout=None)), tokens
+
+@asynccontextmanager
+async def remote_target(url: str, tokens: List[str], timeout: float = 60.0):
+    """A server that is already running, e.g. uvicorn or the APISIX gateway"""
+    limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+    yield (lambda: httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits)), tokens
+
+async def _run(args) -> Dict[str, Any]:
+    if args.url:
+        if not args.token:
+            raise SystemExit("--token is required with --url")
+        target = remote_target(args.url, args.token, args.timeout)
+    else:
+        target = inprocess_target(args.concurrency, args.models_dir)
+    async with target as (client_factory, tokens):
+        return await run_load(
+            client_factory, tokens, concurrency=args.concurrency, duration=args.duration,
+            requests=args.requests, mix=args.mix, sizes=args.sizes, seed=args.seed, warmup=args.warmup
+        )
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the Email Guard API")
+    parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--token", action="append", help="Auth token for --url (repeat for several users)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, help="Total requests to issue instead of --duration")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Request weights (default: %(default)s)")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Email size weights, chars:weight (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured scans before the run")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout for --url")
+    parser.add_argument("--models-dir", help="Directory containing the model folders (in-process only)")
+    parser.add_argument("--output", help="Write the JSON report here (default: print it)")
+    parser.add_argument("--baseline", help="Fail if results regress against this report")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown as a fraction (default: %(default)s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Fail if the overall error rate exceeds this fraction (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    run = asyncio.run(_run(args))
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'target': args.url or 'in-process',
+            'concurrency': args.concurrency,
+            'seconds': run['seconds'],
+            'mix': args.mix,
+            'sizes': args.sizes,
+            'seed': args.seed
+        },
+        'results': run['results']
+    }
+    
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded)
+    else:
+        print(encoded)
+    
+    for name, result in report['results'].items():
+        print(f"{name:14s} {result['calls']:7d} calls {result['throughput_per_s']:9.1f}/s  "
+              f"p50 {result['p50_ms']:8.1f}ms  p95 {result['p95_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  "
+              f"errors {result['error_rate']:.2%} {result['errors_by_status'] or ''}", file=sys.stderr)
+    
+    status = 0
+    error_rate = report['results']['load.total']['error_rate']
+    if error_rate > args.max_error_rate:
+        print(f"Error rate {error_rate:.2%} exceeds {args.max_error_rate:.2%}", file=sys.stderr)
+        status = 1
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"Performance regressions (threshold {args.threshold:.0%}):", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            status = 1
+        else:
+            print(f"No regressions against {args.baseline}", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# benchmarks/replay.py
+"""
+Replay captured scan traffic and compare two builds
+
+The backend records sanitized scan inputs with their arrival times when
+SCAN_CAPTURE_PATH is set (backend/modules/capture.py). This tool re-issues
+such a capture against EmailAnalyzer directly or against the API, either
+with the original inter-arrival gaps (optionally sped up or slowed down)
+or as fast as possible, and saves every verdict and latency. Two saved runs
+can then be compared: per-model verdict agreement, confidence drift and
+latency percentiles.
+
+Usage:
+    python benchmarks/replay.py run capture.jsonl --output before.json
+    python benchmarks/replay.py run capture.jsonl --speed 4 --target api --output after.json
+    python benchmarks/replay.py run capture.jsonl --url http://localhost:8000 --token sample_token_1 --output after.json
+    python benchmarks/replay.py compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Awaitable, Optional, Tuple
+
+import httpx
+
+# run_benchmarks also puts ai/ and backend/ on the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import percentile
+
+# A scan function returns (results, omitted analyzers, error)
+ScanFunction = Callable[[str, Optional[int]], Awaitable[Tuple[List[Dict[str, Any]], List[str], Optional[str]]]]
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Read a capture file, ordered by arrival time"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record['arrival'])
+    return records[:limit] if limit is not None else records
+
+def schedule_offsets(records: List[Dict[str, Any]], speed: float) -> List[float]:
+    """
+    Seconds after the start of the replay at which each record is sent
+    
+    speed 1 keeps the captured gaps, 2 halves them, and 0 sends everything
+    at once (bounded by the replay concurrency).
+    """
+    if speed <= 0 or not records:
+        return [0.0] * len(records)
+    first = records[0]['arrival']
+    return [(record['arrival'] - first) / speed for record in records]
+
+async def replay(records: List[Dict[str, Any]], scan: ScanFunction, speed: float = 1.0,
+                 concurrency: int = 8) -> List[Dict[str, Any]]:
+    """
+    Re-issue captured scans on schedule and record each outcome
+    
+    Latency is measured from the scheduled send time, so it includes any
+    time spent waiting for a free concurrency slot; service time starts when
+    the scan is actually issued.
+    
+    Returns:
+        One outcome per record, in capture order
+    """
+    slots = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    
+    async def issue(index: int, record: Dict[str, Any], offset: float) -> Dict[str, Any]:
+        await asyncio.sleep(max(0.0, start + offset - loop.time()))
+        scheduled = time.perf_counter()
+        async with slots:
+            issued = time.perf_counter()
+            try:
+                results, omitted, error = await scan(record['email_text'], record.get('deadline_ms'))
+            except Exception as e:
+                results, omitted, error = [], [], f"{type(e).__name__}: {e}"
+        finished = time.perf_counter()
+        return {
+            'index': index,
+            'latency_ms': (finished - scheduled) * 1000,
+            'service_ms': (finished - issued) * 1000,
+            'results': {
+                result['model_name']: {'decision': result['decision'], 'confidence': result['confidence']}
+                for result in results
+            },
+            'omitted': omitted,
+            'error': error
+        }
+    
+    offsets = schedule_offsets(records, speed)
+    return list(await asyncio.gather(*(
+        issue(index, record, offset) for index, (record, offset) in enumerate(zip(records, offsets))
+    )))
+
+def analyzer_target(concurrency: int, models_dir: Optional[str] = None) -> ScanFunction:
+    """Scan through EmailAnalyzer in this process, on a pool of concurrency threads"""
+    import email_guard
+    if models_dir:
+        email_guard.models_dir = models_dir
+    analyzer = email_guard.get_analyzer()
+    pool = ThreadPoolExecutor(concurrency)
+    
+    def analyze(text: str, deadline_ms: Optional[int]):
+        omitted = []
+        deadline = time.monotonic() + deadline_ms / 1000.0 if deadline_ms else None
+        results = analyzer.analyze_email(text, deadline=deadline, omitted=omitted)
+        return results, omitted, None
+    
+    async def scan(text: str, deadline_ms: Optional[int]):
+        return await asyncio.get_running_loop().run_in_executor(pool, analyze, text, deadline_ms)
+    return scan
+
+def api_target(client: httpx.AsyncClient) -> ScanFunction:
+    """Scan through POST /scan/email with an already logged-in client"""
+    async def scan(text: str, deadline_ms: Optional[int]):
+        headers = {'X-Scan-Deadline-Ms': str(deadline_ms)} if deadline_ms else {}
+        response = await client.post("/scan/email", json={'email_text': text}, headers=headers)
+        if response.status_code != 200:
+            return [], [], str(response.status_code)
+        body = response.json()
+        return body['results'], body.get('omitted_analyzers', []), None
+    return scan
+
+def summarize_run(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Latency percentiles and error count of one replay"""
+    latencies = sorted(outcome['latency_ms'] for outcome in outcomes)
+    service = sorted(outcome['service_ms'] for outcome in outcomes)
+    return {
+        'scans': len(outcomes),
+        'errors': sum(1 for outcome in outcomes if outcome['error']),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'service_p50_ms': percentile(service, 0.50),
+        'service_p95_ms': percentile(service, 0.95)
+    }
+
+def compare_runs(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare two saved replays of the same capture
+    
+    Returns:
+        Dictionary with per-model verdict agreement and confidence drift, and
+        the latency summary of both runs
+        
+    Raises:
+        ValueError: If the runs replayed different captures
+    """
+    if before['meta']['capture_records'] != after['meta']['capture_records']:
+        raise ValueError("runs replayed captures of different length")
+    
+    models = {}
+    for first, second in zip(before['outcomes'], after['outcomes']):
+        for model_name in set(first['results']) | set(second['results']):
+            stats = models.setdefault(model_name, {'compared': 0, 'changed': 0, 'missing': 0, 'confidence_delta': 0.0})
+            if model_name not in first['results'] or model_name not in second['results']:
+                stats['missing'] += 1
+                continue
+            a, b = first['results'][model_name], second['results'][model_name]
+            stats['compared'] += 1
+            stats['changed'] += a['decision'] != b['decision']
+            stats['confidence_delta'] += abs(a['confidence'] - b['confidence'])
+    
+    for stats in models.values():
+        compared = stats['compared']
+        stats['agreement'] = (compared - stats['changed']) / compared if compared else 0.0
+        stats['mean_confidence_delta'] = stats.pop('confidence_delta') / compared if compared else 0.0
+    
+    return {
+        'models': dict(sorted(models.items())),
+        'before': summarize_run(before['outcomes']),
+        'after': summarize_run(after['outcomes'])
+    }
+
+async def _run_api(args, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if args.url:
+        if not args.token:
+            raise SystemExit("--token is required with --url")
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            await client.post("/auth/token", json={'token': args.token})
+            return await replay(records, api_target(client), args.speed, args.concurrency)
+    
+    from load_test import inprocess_target
+    async with inprocess_target(1, args.models_dir) as (client_factory, tokens):
+        async with client_factory() as client:
+            await client.post("/auth/token", json={'token': tokens[0]})
+            return await replay(records, api_target(client), args.speed, args.concurrency)
+
+def run_command(args) -> int:
+    records = load_capture(args.capture, args.limit)
+    if args.target == 'api' or args.url:
+        outcomes = asyncio.run(_run_api(args, records))
+    else:
+        scan = analyzer_target(args.concurrency, args.models_dir)
+        outcomes = asyncio.run(replay(records, scan, args.speed, args.concurrency))
+    
+    run = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'capture': args.capture,
+            'capture_records': len(records),
+            'target': args.url or args.target,
+            'speed': args.speed,
+            'concurrency': args.concurrency,
+            'label': args.label
+        },
+        'summary': summarize_run(outcomes),
+        'outcomes': outcomes
+    }
+    with open(args.output, 'w') as f:
+        json.dump(run, f)
+    
+    summary = run['summary']
+    print(f"Replayed {summary['scans']} scans ({summary['errors']} errors): "
+          f"p50 {summary['p50_ms']:.1f}ms  p95 {summary['p95_ms']:.1f}ms  p99 {summary['p99_ms']:.1f}ms", file=sys.stderr)
+    return 0
+
+def compare_command(args) -> int:
+    with open(args.before, 'r') as f:
+        before = json.load(f)
+    with open(args.after, 'r') as f:
+        after = json.load(f)
+    comparison = compare_runs(before, after)
+    print(json.dumps(comparison, indent=2))
+    
+    for name in ('before', 'after'):
+        summary = comparison[name]
+        print(f"{name:8s} p50 {summary['p50_ms']:9.1f}ms  p95 {summary['p95_ms']:9.1f}ms  "
+              f"p99 {summary['p99_ms']:9.1f}ms  errors {summary['errors']}", file=sys.stderr)
+    status = 0
+    for model_name, stats in comparison['models'].items():
+        print(f"{model_name:28s} agreement {stats['agreement']:.2%}  changed {stats['changed']}  "
+              f"missing {stats['missing']}  mean |Δconfidence| {stats['mean_confidence_delta']:.4f}", file=sys.stderr)
+        if args.min_agreement is not None and stats['agreement'] < args.min_agreement:
+            status = 1
+    return status
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured scan traffic and compare builds")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    run_parser = commands.add_parser("run", help="Replay a capture and save verdicts and latencies")
+    run_parser.add_argument("capture", help="Capture file written via SCAN_CAPTURE_PATH")
+    run_parser.add_argument("--output", required=True, help="Where to save the replay results")
+    run_parser.add_argument("--target", choices=["analyzer", "api"], default="analyzer",
+                            help="EmailAnalyzer in-process, or the API (in-process unless --url is given)")
+    run_parser.add_argument("--url", help="Base URL of a running server (implies --target api)")
+    run_parser.add_argument("--token", help="Auth token for --url")
+    run_parser.add_argument("--speed", type=float, default=1.0,
+                            help="Replay speed relative to capture (0 = as fast as possible; default: %(default)s)")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Scans in flight at most")
+    run_parser.add_argument("--limit", type=int, help="Only replay the first N captured scans")
+    run_parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout for --url")
+    run_parser.add_argument("--models-dir", help="Directory containing the model folders")
+    run_parser.add_argument("--label", help="Free-form build label stored with the results")
+    run_parser.set_defaults(handler=run_command)
+    
+    compare_parser = commands.add_parser("compare", help="Compare two saved replays")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--min-agreement", type=float,
+                                help="Exit with status 1 if any model's verdict agreement is below this fraction")
+    compare_parser.set_defaults(handler=compare_command)
+    
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# benchmarks/run_benchmarks.py
+"""
+Performance benchmarks for the analyzers and the scan pipeline
+
+Measures, on a seeded synthetic corpus:
+- per-analyzer latency (p50/p95/p99)
+- batched inference throughput of the HuggingFace models versus batch size
+  and torch thread count
+- pipeline throughput versus the number of concurrent scanning threads
+- sanitizer and rule-engine cost across input sizes
+- end-to-end sanitize + scan_email latency
+
+Results are written as JSON. With --baseline the run fails (exit code 1)
+when a result is worse than the stored baseline by more than --threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT_DIR, 'ai'))
+sys.path.append(os.path.join(ROOT_DIR, 'backend'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import generate_corpus, generate_email
+
+# Default allowed slowdown before a result counts as a regression
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.25"))
+
+# Input sizes (characters) for the sanitizer and rule-engine benchmarks
+INPUT_SIZES = [256, 1000, 4000, 10000]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def measure_latency(fn: Callable[[Any], Any], inputs: List[Any], repeat: int = 1, warmup: int = 3) -> Dict[str, Any]:
+    """
+    Time fn on every input and summarize the per-call latency
+    
+    Returns:
+        Latency result with p50/p95/p99/mean in milliseconds and calls per second
+    """
+    for item in inputs[:warmup]:
+        fn(item)
+    
+    samples = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start
+    
+    samples.sort()
+    return {
+        'kind': 'latency',
+        'calls': len(samples),
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+        'throughput_per_s': len(samples) / total if total else 0.0
+    }
+
+def measure_throughput(fn: Callable[[List[Any]], Any], inputs: List[Any], batch_size: int,
+                       threads: int = 1) -> Dict[str, Any]:
+    """
+    Run fn over inputs in batches, optionally from several threads, and report items per second
+    """
+    batches = [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+    fn(batches[0])  # warm-up
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(fn, batches))
+    else:
+        for batch in batches:
+            fn(batch)
+    total = time.perf_counter() - start
+    return {
+        'kind': 'throughput',
+        'items': len(inputs),
+        'batch_size': batch_size,
+        'threads': threads,
+        'throughput_per_s': len(inputs) / total if total else 0.0
+    }
+
+def resident(analyzer, instance, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    Wrap fn so every call holds instance resident, as scans do
+    
+    An evicted model is reloaded (during warm-up, in practice) instead of
+    timing the early return of an unloaded analyzer.
+    
+    Raises:
+        RuntimeError: From the wrapped call, if the model could not be loaded
+    """
+    def call(item):
+        with analyzer.residency.acquire(instance):
+            if hasattr(instance, 'is_loaded') and not instance.is_loaded():
+                raise RuntimeError(f"Model {instance.model_name} is not loaded")
+            return fn(item)
+    return call
+
+def bench_analyzers(analyzer, texts: List[str], repeat: int) -> Dict[str, Any]:
+    """Per-analyzer latency percentiles"""
+    return {
+        f"analyzer.{instance.model_name}": measure_latency(
+            resident(analyzer, instance, lambda text, instance=instance: instance.analyze(text)), texts, repeat
+        )
+        for instance in analyzer.analyzers
+    }
+
+def bench_batching(analyzer, texts: List[str], batch_sizes: List[int], thread_counts: List[int]) -> Dict[str, Any]:
+    """Batched inference throughput of each HuggingFace model, reloading evicted ones"""
+    from email_guard import HuggingFaceAnalyzer
+    
+    results = {}
+    models = [a for a in analyzer.analyzers if isinstance(a, HuggingFaceAnalyzer)]
+    if not models:
+        return results
+    
+    import torch
+    original_threads = torch.get_num_threads()
+    try:
+        for instance in models:
+            def infer(batch, instance=instance):
+                inputs = instance.tokenizer(batch, return_tensors="pt", truncation=True,
+                                            max_length=512, padding=True).to(instance.device)
+                with torch.no_grad():
+                    instance.model(**inputs)
+            
+            for threads in thread_counts:
+                torch.set_num_threads(threads)
+                for batch_size in batch_sizes:
+                    key = f"batch.{instance.model_name}.bs{batch_size}.torch{threads}"
+                    results[key] = measure_throughput(resident(analyzer, instance, infer), texts, batch_size)
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+def bench_concurrency(texts: List[str], thread_counts: List[int]) -> Dict[str, Any]:
+    """Whole-pipeline throughput with several scans running concurrently"""
+    from email_guard import analyze_email_with_models
+    
+    def scan_batch(batch):
+        for text in batch:
+            analyze_email_with_models(text)
+    
+    return {
+        f"pipeline.threads{threads}": measure_throughput(scan_batch, texts, 1, threads)
+        for threads in thread_counts
+    }
+
+def bench_sizes(seed: int, repeat: int) -> Dict[str, Any]:
+    """Sanitizer and rule-engine cost across input sizes"""
+    import random
+    from email_guard import RuleBasedAnalyzer
+    from modules.verify import verify_and_sanitize_input
+    
+    rule_engine = RuleBasedAnalyzer()
+    results = {}
+    for size in INPUT_SIZES:
+        rng = random.Random(seed + size)
+        texts = [generate_email(rng, label, size) for label in ('phishing', 'spam', 'safe') for _ in range(10)]
+        results[f"sanitizer.{size}"] = measure_latency(verify_and_sanitize_input, texts, repeat)
+        results[f"rules.{size}"] = measure_latency(rule_engine.analyze, texts, repeat)
+    return results
+
+def bench_end_to_end(texts: List[str], repeat: int) -> Dict[str, Any]:
+    """Sanitize + scan_email, as done for each /scan/email request"""
+    from modules.verify import verify_and_sanitize_input
+    from scan import scan_email
+    
+    return {'scan_email': measure_latency(lambda text: scan_email(verify_and_sanitize_input(text)), texts, repeat)}
+
+def run_benchmarks(corpus_size: int = 60, seed: int = 1234, repeat: int = 1,
+                   batch_sizes: List[int] = (1, 4, 16), thread_counts: List[int] = (1, 2, 4),
+                   models_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run every benchmark and return the machine-readable report
+    
+    Args:
+        corpus_size: Emails in the synthetic corpus
+        seed: Corpus seed
+        repeat: Passes over the corpus for latency benchmarks
+        batch_sizes: Batch sizes for the batching benchmark
+        thread_counts: Torch threads (batching) and scanning threads (concurrency)
+        models_dir: Override email_guard.models_dir
+        
+    Returns:
+        Dictionary with 'meta' and 'results' (benchmark name -> measurements)
+    """
+    import email_guard
+    if models_dir:
+        email_guard.models_dir = models_dir
+    analyzer = email_guard.get_analyzer()
+    texts = [email['text'] for email in generate_corpus(corpus_size, seed)]
+    
+    results = {}
+    results.update(bench_analyzers(analyzer, texts, repeat))
+    results.update(bench_batching(analyzer, texts, list(batch_sizes), list(thread_counts)))
+    results.update(bench_concurrency(texts, list(thread_counts)))
+    results.update(bench_sizes(seed, repeat))
+    results.update(bench_end_to_end(texts, repeat))
+    
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'corpus_size': corpus_size,
+            'seed': seed,
+            'repeat': repeat,
+            'analyzers': [instance.model_name for instance in analyzer.analyzers]
+        },
+        'results': results
+    }
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    List results that regressed by more than threshold against a baseline
+    
+    Latency results compare p95; throughput results compare items per second.
+    Benchmarks missing from either report are ignored.
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        if current['kind'] == 'latency':
+            if previous['p95_ms'] > 0 and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(f"{name}: p95 {previous['p95_ms']:.3f}ms -> {current['p95_ms']:.3f}ms")
+        elif previous['throughput_per_s'] > 0 and \
+                current['throughput_per_s'] < previous['throughput_per_s'] / (1 + threshold):
+            regressions.append(
+                f"{name}: {previous['throughput_per_s']:.1f}/s -> {current['throughput_per_s']:.1f}/s"
+            )
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Email Guard analyzers and scan pipeline")
+    parser.add_argument("--output", help="Write the JSON report here (default: print it)")
+    parser.add_argument("--baseline", help="Fail if results regress against this report")
+    parser.add_argument("--save-baseline", help="Also write the report here as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown as a fraction (default: %(default)s)")
+    parser.add_argument("--corpus-size", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus for latency benchmarks")
+    parser.add_argument("--batch-sizes", default="1,4,16")
+    parser.add_argument("--threads", default="1,2,4")
+    parser.add_argument("--models-dir", help="Directory containing the model folders")
+    args = parser.parse_args(argv)
+    
+    report = run_benchmarks(
+        corpus_size=args.corpus_size, seed=args.seed, repeat=args.repeat,
+        batch_sizes=[int(value) for value in args.batch_sizes.split(",")],
+        thread_counts=[int(value) for value in args.threads.split(",")],
+        models_dir=args.models_dir
+    )
+    
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded)
+    else:
+        print(encoded)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(encoded)
+    
+    for name, result in report['results'].items():
+        if result['kind'] == 'latency':
+            print(f"{name:48s} p50 {result['p50_ms']:9.3f}ms  p95 {result['p95_ms']:9.3f}ms  "
+                  f"p99 {result['p99_ms']:9.3f}ms", file=sys.stderr)
+        else:
+            print(f"{name:48s} {result['throughput_per_s']:12.1f} items/s", file=sys.stderr)
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"Performance regressions (threshold {args.threshold:.0%}):", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+        print(f"No regressions against {args.baseline}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,7 @@ interface ScanResult {
   }>;
   timestamp: string;
   email_snippet: string;
+  omitted_analyzers?: string[];
 }
 
 function App() {
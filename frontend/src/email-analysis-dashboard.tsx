@@ -13,6 +13,7 @@ interface ScanResult {
   results: ModelResult[];
   timestamp: string;
   email_snippet: string;
+  omitted_analyzers?: string[];
 }
 
 interface HistoryEntry {
@@ -28,26 +29,73 @@ interface DashboardProps {
   onNewScan: () => void;
 }
 
+interface HistoryFilters {
+  decision: string;
+  model: string;
+  since: string;
+  until: string;
+}
+
+interface HistoryStats {
+  total_scans: number;
+  decisions: Record<string, number>;
+  analyzers: Record<string, { results: number; decisions: Record<string, number>; mean_confidence: number }>;
+}
+
+const HISTORY_PAGE_SIZE = 10;
+
 const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewScan }) => {
   const [history, setHistory] = useState<HistoryEntry[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [filters, setFilters] = useState<HistoryFilters>({ decision: '', model: '', since: '', until: '' });
+  const [stats, setStats] = useState<HistoryStats | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
 
   useEffect(() => {
     loadHistory();
-  }, []);
+  }, [filters]);
+
+  useEffect(() => {
+    loadStats();
+  }, [currentScan]);
+
+  const loadStats = async () => {
+    try {
+      const response = await axios.get(`${import.meta.env.VITE_API_URL || 'http://localhost:9080'}/history/stats`, {
+        params: { days: 7 },
+        withCredentials: true
+      });
+      if (response.status === 200) {
+        setStats(response.data);
+      }
+    } catch (err) {
+      // Summary numbers are optional; history errors are reported by loadHistory
+      setStats(null);
+    }
+  };
 
-  const loadHistory = async () => {
+  const loadHistory = async (cursor?: string) => {
     setLoading(true);
     setError('');
 
     try {
+      const params: Record<string, string | number> = { limit: HISTORY_PAGE_SIZE };
+      if (cursor) params.cursor = cursor;
+      if (filters.decision) params.decision = filters.decision;
+      if (filters.model) params.model = filters.model;
+      if (filters.since) params.since = filters.since;
+      if (filters.until) params.until = filters.until;
+
       const response = await axios.get(`${import.meta.env.VITE_API_URL || 'http://localhost:9080'}/history`, {
+        params,
         withCredentials: true
       });
 
       if (response.status === 200) {
-        setHistory(response.data.history || []);
+        const page: HistoryEntry[] = response.data.history || [];
+        setHistory(cursor ? (previous) => [...previous, ...page] : page);
+        setNextCursor(response.data.next_cursor || null);
       }
     } catch (err: any) {
       if (err.response?.status === 401) {
@@ -103,6 +151,10 @@ const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewSc
     return `${(confidence * 100).toFixed(1)}%`;
   };
 
+  const updateFilter = (name: keyof HistoryFilters, value: string) => {
+    setFilters((previous) => ({ ...previous, [name]: value }));
+  };
+
   return (
     <div className="min-h-screen bg-dark-950 py-12 relative overflow-hidden">
       {/* Background Effects */}
@@ -168,6 +220,11 @@ const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewSc
                 </svg>
                 <span>Analyzed: {formatTimestamp(currentScan.timestamp)}</span>
               </span>
+              {currentScan.omitted_analyzers && currentScan.omitted_analyzers.length > 0 && (
+                <span className="inline-flex items-center space-x-3 bg-yellow-500/10 text-yellow-400 px-4 py-2 rounded-lg ml-3">
+                  <span>Skipped to meet time limit: {currentScan.omitted_analyzers.join(', ')}</span>
+                </span>
+              )}
             </div>
             
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
@@ -205,6 +262,25 @@ const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewSc
           </div>
         )}
 
+        {/* Summary Statistics */}
+        {stats && stats.total_scans > 0 && (
+          <div className="grid grid-cols-2 lg:grid-cols-4 gap-6 mb-10">
+            <div className="cyber-card p-6">
+              <div className="text-sm text-dark-400 mb-2 font-medium">Total Scans</div>
+              <div className="text-3xl font-bold text-dark-50">{stats.total_scans}</div>
+            </div>
+            {['phishing', 'spam', 'safe'].map((decision) => (
+              <div key={decision} className="cyber-card p-6">
+                <div className="flex items-center space-x-2 text-sm text-dark-400 mb-2 font-medium">
+                  {getDecisionIcon(decision)}
+                  <span className="capitalize">{decision} results</span>
+                </div>
+                <div className="text-3xl font-bold text-dark-50">{stats.decisions[decision] || 0}</div>
+              </div>
+            ))}
+          </div>
+        )}
+
         {/* History Section */}
         <div className="cyber-card p-8 relative">
           {/* Card Glow Effect */}
@@ -221,8 +297,46 @@ const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewSc
               <p className="text-dark-300">Previous security assessments</p>
             </div>
           </div>
+
+          <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-4 mb-8 relative">
+            <select
+              value={filters.decision}
+              onChange={(e) => updateFilter('decision', e.target.value)}
+              className="cyber-input"
+            >
+              <option value="">All decisions</option>
+              <option value="phishing">Phishing</option>
+              <option value="spam">Spam</option>
+              <option value="safe">Safe</option>
+            </select>
+            <select
+              value={filters.model}
+              onChange={(e) => updateFilter('model', e.target.value)}
+              className="cyber-input"
+            >
+              <option value="">All models</option>
+              <option value="cybersectony-distilbert">cybersectony-distilbert</option>
+              <option value="aamosh-distilbert">aamosh-distilbert</option>
+              <option value="phishing-detection-py">phishing-detection-py</option>
+              <option value="rule-based">rule-based</option>
+            </select>
+            <input
+              type="date"
+              value={filters.since}
+              onChange={(e) => updateFilter('since', e.target.value)}
+              className="cyber-input"
+              aria-label="From date"
+            />
+            <input
+              type="date"
+              value={filters.until}
+              onChange={(e) => updateFilter('until', e.target.value)}
+              className="cyber-input"
+              aria-label="Before date"
+            />
+          </div>
           
-          {loading ? (
+          {loading && history.length === 0 ? (
             <div className="text-center py-16">
               <div className="loading-spinner text-cyber-500 mx-auto mb-6 w-12 h-12"></div>
               <div className="text-dark-300 text-lg">Loading history...</div>
@@ -284,6 +398,17 @@ const EmailAnalysisDashboard: React.FC<DashboardProps> = ({ currentScan, onNewSc
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <div className="text-center pt-2">
+                  <button
+                    onClick={() => loadHistory(nextCursor)}
+                    disabled={loading}
+                    className="cyber-button px-8 py-3"
+                  >
+                    {loading ? 'Loading...' : 'Load more'}
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>
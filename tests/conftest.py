@@ -0,0 +1,55 @@
+"""
+Shared test fixtures
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the ai directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai'))
+
+
+@pytest.fixture(scope="session")
+def tiny_models_dir(tmp_path_factory):
+    """Directory with tiny random stand-ins for both HuggingFace models"""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from tiny_models import create_tiny_models
+
+    models_dir = tmp_path_factory.mktemp("models")
+    create_tiny_models(str(models_dir))
+    return str(models_dir)
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    TestClient for the backend app with a rules-only analyzer and its own users and history
+
+    Tokens: "t1" (user u1) and "a1" (admin); log in with client.post("/auth/token", json={"token": ...}).
+    """
+    from fastapi.testclient import TestClient
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    import analyzer_registry
+    import email_guard
+    from modules import history_compactor, history_store, history_writer
+
+    (tmp_path / "db").mkdir()
+    (tmp_path / "db" / "users.csv").write_text(
+        "token,sub,role,expires_at\nt1,u1,user,2099-01-01\na1,admin1,admin,2099-01-01\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analyzer_registry, "EMAIL_GUARD_ANALYZERS", "rule-based")
+    analyzer = email_guard.EmailAnalyzer()
+    monkeypatch.setattr(email_guard, "_analyzer", analyzer)
+    monkeypatch.setattr(history_store, "_store", history_store.HistoryStore(str(tmp_path / "history.db")))
+    monkeypatch.setattr(history_writer, "_writer", None)
+    monkeypatch.setattr(history_compactor, "_compactor", None)
+
+    import app
+    monkeypatch.setattr(app, "_models_status_cache", None)
+    with TestClient(app.app) as client:
+        yield client
+    analyzer.residency.stop()
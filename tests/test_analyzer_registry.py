@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the config-driven analyzer registry
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai')
+
+# Add the ai directory to the path
+sys.path.append(AI_DIR)
+
+import analyzer_registry
+from analyzer_registry import load_analyzer_specs
+
+
+class EchoAnalyzer:
+    """Minimal analyzer declared through a class path in the tests"""
+
+    def __init__(self, decision="safe", model_path=None):
+        self.model_name = f"echo-{decision}"
+        self.model_source = "Custom"
+        self.model_path = model_path
+        self.decision = decision
+
+    def is_ready(self):
+        return True
+
+    def analyze(self, email_text):
+        return {'model_source': self.model_source, 'model_name': self.model_name,
+                'decision': self.decision, 'confidence': 1.0, 'description': self.model_path or ''}
+
+
+def write_config(tmp_path, analyzers):
+    path = tmp_path / "analyzers.json"
+    path.write_text(json.dumps({'analyzers': analyzers}))
+    return str(path)
+
+
+def test_specs_are_validated_and_filtered(tmp_path):
+    assert [spec['name'] for spec in load_analyzer_specs(path="", enabled_names="")] == [
+        'cybersectony-distilbert', 'aamosh-distilbert', 'phishing-detection-py', 'rule-based'
+    ]
+    assert [spec['name'] for spec in load_analyzer_specs(path="", enabled_names="rule-based")] == ['rule-based']
+
+    config = write_config(tmp_path, [
+        {'name': 'a', 'class': 'x.A'},
+        {'name': 'b', 'class': 'x.B', 'enabled': False},
+    ])
+    assert [spec['name'] for spec in load_analyzer_specs(path=config, enabled_names="")] == ['a']
+    with pytest.raises(ValueError):
+        load_analyzer_specs(path=config, enabled_names="c")
+    with pytest.raises(ValueError):
+        load_analyzer_specs(path=write_config(tmp_path, [{'name': 'a', 'class': 'x.A', 'weight': 1}]))
+    with pytest.raises(ValueError):
+        load_analyzer_specs(path=write_config(tmp_path, [{'name': 'a', 'class': 'x.A'}] * 2))
+
+
+def test_email_analyzer_builds_configured_analyzers(tmp_path, monkeypatch):
+    import email_guard
+    monkeypatch.setattr(analyzer_registry, "ANALYZERS_CONFIG", write_config(tmp_path, [
+        {'name': 'echo', 'class': 'test_analyzer_registry:EchoAnalyzer',
+         'options': {'decision': 'spam'}, 'model_path': 'echo-model', 'cost_ms': 30},
+        {'name': 'broken', 'class': 'test_analyzer_registry:MissingAnalyzer'},
+        {'name': 'rule-based', 'class': 'email_guard.RuleBasedAnalyzer'},
+    ]))
+    monkeypatch.setattr(analyzer_registry, "EMAIL_GUARD_ANALYZERS", "")
+
+    analyzer = email_guard.EmailAnalyzer()
+    assert [instance.model_name for instance in analyzer.analyzers] == ['echo-spam', 'rule-based']
+    assert analyzer.expected_latency['echo-spam'] == pytest.approx(0.03)
+    assert analyzer.analyze_email("Hello there, friend")[0]['description'] == 'echo-model'
+
+
+def test_rules_only_deployment_does_not_import_ml_libraries():
+    code = (
+        "import sys, email_guard\n"
+        "analyzer = email_guard.EmailAnalyzer()\n"
+        "assert [a.model_name for a in analyzer.analyzers] == ['rule-based']\n"
+        "assert 'torch' not in sys.modules and 'transformers' not in sys.modules\n"
+    )
+    env = dict(os.environ, EMAIL_GUARD_ANALYZERS="rule-based", ANALYZERS_CONFIG="")
+    subprocess.run([sys.executable, "-c", code], cwd=AI_DIR, env=env, check=True, capture_output=True)
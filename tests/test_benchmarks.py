@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark corpus and regression check
+"""
+
+import os
+import sys
+
+# Add the benchmarks directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from corpus import generate_corpus
+from run_benchmarks import compare_to_baseline, percentile
+
+
+def test_corpus_is_reproducible():
+    assert generate_corpus(12, seed=7) == generate_corpus(12, seed=7)
+    assert generate_corpus(12, seed=7) != generate_corpus(12, seed=8)
+    assert [len(email['text']) for email in generate_corpus(3, sizes=[100, 200, 300])] == [100, 200, 300]
+
+
+def test_regressions_are_reported_beyond_threshold():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.0
+    baseline = {'results': {
+        'analyzer.rule-based': {'kind': 'latency', 'p95_ms': 10.0},
+        'pipeline.threads1': {'kind': 'throughput', 'throughput_per_s': 100.0},
+        'removed': {'kind': 'latency', 'p95_ms': 1.0},
+    }}
+    report = {'results': {
+        'analyzer.rule-based': {'kind': 'latency', 'p95_ms': 12.0},
+        'pipeline.threads1': {'kind': 'throughput', 'throughput_per_s': 70.0},
+        'added': {'kind': 'latency', 'p95_ms': 1.0},
+    }}
+    assert compare_to_baseline(report, baseline, threshold=0.25) == [
+        'pipeline.threads1: 100.0/s -> 70.0/s'
+    ]
+    assert len(compare_to_baseline(report, baseline, threshold=0.1)) == 2
+
+
+def test_evicted_models_are_reloaded_for_benchmarks(tiny_models_dir, monkeypatch):
+    import email_guard
+    from run_benchmarks import bench_analyzers, bench_batching
+
+    monkeypatch.setattr(email_guard, "models_dir", tiny_models_dir)
+    analyzer = email_guard.EmailAnalyzer()
+    texts = [email['text'] for email in generate_corpus(4, seed=1)]
+    try:
+        assert analyzer.residency.evict("aamosh-distilbert")
+        bench_analyzers(analyzer, texts, 1)
+        assert analyzer.residency.report()["aamosh-distilbert"]["loads"] == 2
+
+        assert analyzer.residency.evict("cybersectony-distilbert")
+        results = bench_batching(analyzer, texts, [2], [1])
+        assert "batch.cybersectony-distilbert.bs2.torch1" in results
+    finally:
+        analyzer.residency.stop()
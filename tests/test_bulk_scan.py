@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline bulk scanner
+"""
+
+import json
+import mailbox
+import os
+import sys
+from email.message import EmailMessage
+
+import pytest
+
+# Add the ai directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai'))
+
+from bulk_scan import find_mailboxes, message_text, run_bulk_scan
+
+
+def make_message(index, html=False):
+    message = EmailMessage()
+    message['From'] = f"sender{index}@example.com"
+    message['Subject'] = f"Message {index}"
+    message['Message-ID'] = f"<{index}@example.com>"
+    if html:
+        message.set_content("<p>Urgent: verify your <b>password</b> now</p>", subtype='html')
+    else:
+        message.set_content("Hello, see you at lunch.")
+    return message
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = tmp_path / "archive"
+    root.mkdir()
+    box = mailbox.mbox(str(root / "old.mbox"))
+    for index in range(3):
+        box.add(make_message(index))
+    box.close()
+    maildir = mailbox.Maildir(str(root / "Maildir"))
+    for index in range(3, 5):
+        maildir.add(make_message(index, html=True))
+    return root
+
+
+def test_message_text_prefers_plain_and_strips_html():
+    headers, text = message_text(bytes(make_message(7, html=True)))
+    assert headers['subject'] == "Message 7"
+    assert "<b>" not in text and "password" in text
+
+
+def test_bulk_scan_resumes_from_checkpoint(archive, tmp_path):
+    assert [kind for kind, _ in find_mailboxes([str(archive)])] == ['maildir', 'mbox']
+    output = str(tmp_path / "results.jsonl")
+    models_dir = str(tmp_path / "no-models")
+
+    first = run_bulk_scan([str(archive)], output, batch_size=2, models_dir=models_dir, limit=3)
+    assert first['messages'] == 3
+
+    # A record written after the last checkpoint (e.g. by a crashed run) is discarded
+    with open(output, 'a') as f:
+        f.write('{"partial": true}\n')
+
+    second = run_bulk_scan([str(archive)], output, batch_size=2, models_dir=models_dir)
+    assert second['messages'] == 2
+
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record['subject'] for record in records) == [f"Message {index}" for index in range(5)]
+    assert all(record['results'] for record in records)
+
+
+def test_existing_output_needs_restart(archive, tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text('{"kept": true}\n')
+    models_dir = str(tmp_path / "no-models")
+
+    with pytest.raises(FileExistsError):
+        run_bulk_scan([str(archive)], str(output), models_dir=models_dir)
+    assert output.read_text() == '{"kept": true}\n'
+
+    assert run_bulk_scan([str(archive)], str(output), models_dir=models_dir, restart=True)['messages'] == 5
+    assert "kept" not in output.read_text()
+
+
+def test_bulk_scan_with_worker_pool(archive, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    summary = run_bulk_scan([str(archive)], output, workers=2, batch_size=2, models_dir=str(tmp_path / "no-models"))
+    assert summary == {'messages': 5, 'errors': 0, 'seconds': summary['seconds']}
+    with open(output) as f:
+        assert sorted(json.loads(line)['subject'] for line in f) == [f"Message {index}" for index in range(5)]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for ETag / If-None-Match handling on /history and /models/status
+"""
+
+SCAN_TEXT = "verify your password now at http://x.tk"
+
+
+class StaticAnalyzer:
+    model_name = "static"
+    model_source = "Custom"
+
+    def analyze(self, email_text):
+        return {'model_source': self.model_source, 'model_name': self.model_name,
+                'decision': 'safe', 'confidence': 1.0, 'description': ''}
+
+
+def test_history_etag(api):
+    api.post("/auth/token", json={"token": "t1"})
+    assert api.post("/scan/email", json={"email_text": SCAN_TEXT}).status_code == 200
+
+    first = api.get("/history")
+    etag = first.headers["ETag"]
+    assert len(first.json()['history']) == 1
+
+    cached = api.get("/history", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+    assert api.get("/history", headers={"If-None-Match": f'W/{etag}'}).status_code == 304
+    assert api.get("/history?limit=5", headers={"If-None-Match": etag}).status_code == 200
+
+    assert api.post("/scan/email", json={"email_text": SCAN_TEXT}).status_code == 200
+    changed = api.get("/history", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()['history']) == 2
+
+
+def test_models_status_etag(api):
+    import email_guard
+
+    first = api.get("/models/status")
+    etag = first.headers["ETag"]
+    assert first.json()['status'] == "partial"
+    assert api.get("/models/status", headers={"If-None-Match": etag}).status_code == 304
+
+    email_guard.get_analyzer().add_analyzer(StaticAnalyzer())
+    changed = api.get("/models/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()['models']['total_models'] == 2
+
+
+def test_models_status_takes_one_inference_server_round_trip(api, monkeypatch):
+    import scan
+
+    class CountingClient:
+        calls = 0
+
+        def info(self):
+            self.calls += 1
+            return {'registry_version': 7, 'residency': {},
+                    'models': {'ml_models_loaded': True, 'total_models': 3}}
+
+    client = CountingClient()
+    monkeypatch.setattr(scan, "INFERENCE_SOCKET", "/tmp/inference.sock")
+    monkeypatch.setattr(scan, "get_inference_client", lambda: client)
+
+    first = api.get("/models/status")
+    assert first.json()['status'] == "ready"
+    assert client.calls == 1
+    # Same registry version: the cached body and ETag are reused
+    assert api.get("/models/status", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert client.calls == 2
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for CPU detection, per-worker core assignment and split calibration
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the ai directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai'))
+
+import cpu_topology
+
+
+def make_sysfs(root, cores, siblings=2, cpu_max=None):
+    """Fake /sys with `cores` physical cores of `siblings` logical CPUs each (Linux numbering)"""
+    for sibling in range(siblings):
+        for core in range(cores):
+            cpu = sibling * cores + core
+            topology = root / f"devices/system/cpu/cpu{cpu}/topology"
+            topology.mkdir(parents=True)
+            (topology / "physical_package_id").write_text("0\n")
+            (topology / "core_id").write_text(f"{core}\n")
+    if cpu_max is not None:
+        (root / "fs/cgroup").mkdir(parents=True)
+        (root / "fs/cgroup/cpu.max").write_text(cpu_max + "\n")
+    return str(root)
+
+
+def test_cgroup_limits(tmp_path):
+    assert cpu_topology.cgroup_cpu_limit(str(tmp_path)) is None
+
+    v2 = make_sysfs(tmp_path / "v2", 1, cpu_max="250000 100000")
+    assert cpu_topology.cgroup_cpu_limit(v2) == 2.5
+    unlimited = make_sysfs(tmp_path / "unlimited", 1, cpu_max="max 100000")
+    assert cpu_topology.cgroup_cpu_limit(unlimited) is None
+
+    v1 = tmp_path / "v1/fs/cgroup/cpu,cpuacct"
+    v1.mkdir(parents=True)
+    (v1 / "cpu.cfs_quota_us").write_text("400000\n")
+    (v1 / "cpu.cfs_period_us").write_text("100000\n")
+    assert cpu_topology.cgroup_cpu_limit(str(tmp_path / "v1")) == 4.0
+
+
+def test_siblings_are_grouped_and_quota_applied(tmp_path, monkeypatch):
+    root = make_sysfs(tmp_path, 4, cpu_max="300000 100000")
+    monkeypatch.setattr(cpu_topology, "available_cpus", lambda: list(range(8)))
+
+    assert cpu_topology.core_groups(list(range(8)), root) == [[0, 4], [1, 5], [2, 6], [3, 7]]
+    # One CPU per physical core before any SMT sibling
+    assert cpu_topology.usable_core_groups(root) == [[0], [1], [2]]
+    assert cpu_topology.usable_cores(root) == 3
+
+
+def test_siblings_fill_the_quota_after_every_core(tmp_path, monkeypatch):
+    root = make_sysfs(tmp_path, 2, cpu_max="300000 100000")
+    monkeypatch.setattr(cpu_topology, "available_cpus", lambda: list(range(4)))
+
+    groups = cpu_topology.usable_core_groups(root)
+    assert groups == [[0, 2], [1]]
+    assert sum(cpu_topology.threads_for(cpus, groups) for cpus in cpu_topology.plan_workers(2, groups)) == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3, 8, 16])
+def test_worker_cpu_sets_are_disjoint(workers):
+    groups = [[core, core + 8] for core in range(8)]
+    plan = cpu_topology.plan_workers(workers, groups)
+
+    assert len(plan) == workers
+    assigned = [cpu for cpus in plan for cpu in cpus]
+    assert len(assigned) == len(set(assigned)) == 16
+    if workers <= len(groups):
+        # Whole physical cores, one torch thread per core
+        assert all(cpu + 8 in cpus for cpus in plan for cpu in cpus if cpu < 8)
+        assert sum(cpu_topology.threads_for(cpus, groups) for cpus in plan) == 8
+
+
+def test_calibrate_prefers_low_latency_among_equal_throughput():
+    measurements = {
+        (8, 1): {'throughput': 100.0, 'p50_ms': 70.0, 'p95_ms': 90.0},
+        (4, 2): {'throughput': 98.0, 'p50_ms': 35.0, 'p95_ms': 45.0},
+        (2, 4): {'throughput': 80.0, 'p50_ms': 20.0, 'p95_ms': 25.0},
+        (1, 8): {'throughput': 50.0, 'p50_ms': 18.0, 'p95_ms': 20.0},
+    }
+    groups = [[core] for core in range(8)]
+    assert cpu_topology.candidate_splits(8) == list(measurements)
+
+    best, results = cpu_topology.calibrate(
+        lambda: None, 0.1, groups,
+        measure=lambda workers, threads, work, duration, groups: measurements[(workers, threads)]
+    )
+    assert best == (4, 2)
+    assert results == measurements
+
+
+def test_measure_split_runs_in_forked_workers():
+    cpus = cpu_topology.available_cpus()
+    stats = cpu_topology.measure_split(1, 1, lambda: sum(range(1000)), 0.2, [cpus])
+    assert stats['throughput'] > 0
+    assert 0 < stats['p50_ms'] <= stats['p95_ms']
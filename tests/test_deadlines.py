@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for scan deadlines: skipped analyzers, partial results and latency estimates
+"""
+
+import time
+
+import pytest
+
+SCAN_TEXT = "verify your password now at http://x.tk"
+
+
+class SlowAnalyzer:
+    """Analyzer whose calls take a configurable time"""
+
+    def __init__(self, seconds=0.0):
+        self.model_name = "slow"
+        self.model_source = "Custom"
+        self.seconds = seconds
+
+    def analyze(self, email_text):
+        time.sleep(self.seconds)
+        return {'model_source': self.model_source, 'model_name': self.model_name,
+                'decision': 'safe', 'confidence': 1.0, 'description': ''}
+
+    def analyze_batch(self, email_texts):
+        return [self.analyze(email_text) for email_text in email_texts]
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    import analyzer_registry
+    import email_guard
+    monkeypatch.setattr(analyzer_registry, "EMAIL_GUARD_ANALYZERS", "rule-based")
+    instance = email_guard.EmailAnalyzer()
+    yield instance
+    instance.residency.stop()
+
+
+def test_slow_analyzer_is_skipped_and_reported(analyzer):
+    slow = SlowAnalyzer()
+    analyzer.add_analyzer(slow)
+    analyzer.expected_latency['slow'] = 5.0
+
+    omitted = []
+    results = analyzer.analyze_email(SCAN_TEXT, deadline=time.monotonic() + 0.2, omitted=omitted)
+    assert [result['model_name'] for result in results] == ['rule-based']
+    assert omitted == ['slow']
+
+    omitted = []
+    results = analyzer.analyze_email(SCAN_TEXT, deadline=time.monotonic() - 1, omitted=omitted)
+    assert results == []
+    assert omitted == ['rule-based', 'slow']
+    assert len(analyzer.analyze_email(SCAN_TEXT)) == 2
+
+
+def test_one_slow_call_does_not_disable_an_analyzer(analyzer):
+    slow = SlowAnalyzer(0.3)
+    analyzer.add_analyzer(slow)
+    analyzer.analyze_email(SCAN_TEXT)
+    slow.seconds = 0.0
+
+    omitted = []
+    analyzer.analyze_email(SCAN_TEXT, deadline=time.monotonic() + 0.2, omitted=omitted)
+    assert omitted == ['slow']
+
+    # The estimate decays while the analyzer is skipped, so it is tried again...
+    analyzer._skipped_since['slow'] -= 60
+    omitted = []
+    results = analyzer.analyze_email(SCAN_TEXT, deadline=time.monotonic() + 0.2, omitted=omitted)
+    assert omitted == []
+    assert 'slow' in [result['model_name'] for result in results]
+    # ...and the fast call brings it down from the decayed value
+    assert analyzer.expected_latency['slow'] < 0.1
+
+
+def test_estimate_holds_under_low_traffic(analyzer, monkeypatch):
+    import email_guard
+    clock = [1000.0]
+    monkeypatch.setattr(email_guard.time, "monotonic", lambda: clock[0])
+    analyzer.add_analyzer(SlowAnalyzer(0.05))
+
+    # One scan a minute, each with room for the analyzer
+    for _ in range(10):
+        clock[0] += 60
+        analyzer.analyze_email(SCAN_TEXT, deadline=clock[0] + 1.0)
+    assert analyzer.expected_seconds('slow') == pytest.approx(0.05, rel=0.5)
+
+    clock[0] += 60
+    omitted = []
+    analyzer.analyze_email(SCAN_TEXT, deadline=clock[0] + 0.02, omitted=omitted)
+    assert omitted == ['slow']
+
+
+def test_batch_latency_is_recorded_per_email(analyzer):
+    slow = SlowAnalyzer(0.1)
+    analyzer.add_analyzer(slow)
+    analyzer.analyze_batch([SCAN_TEXT] * 4)
+    # The batch took ~0.4s, but each email's share of it was ~0.1s
+    assert 0.05 < analyzer.expected_latency['slow'] < 0.2
+
+    # Each email in a batch waits for all of it, so the batch is gated on the total...
+    omitted = [[] for _ in range(4)]
+    results = analyzer.analyze_batch([SCAN_TEXT] * 4, deadlines=[time.monotonic() + 0.25] * 4, omitted=omitted)
+    assert omitted == [['slow']] * 4
+    assert all([result['model_name'] for result in email_results] == ['rule-based'] for email_results in results)
+    # ...while a single email fits
+    omitted = []
+    analyzer.analyze_email(SCAN_TEXT, deadline=time.monotonic() + 0.25, omitted=omitted)
+    assert omitted == []
+
+
+def test_scan_endpoint_deadlines(api):
+    import email_guard
+    analyzer = email_guard.get_analyzer()
+    api.post("/auth/token", json={"token": "t1"})
+
+    analyzer.add_analyzer(SlowAnalyzer())
+    analyzer.expected_latency['slow'] = 5.0
+    response = api.post("/scan/email", json={"email_text": SCAN_TEXT}, headers={"X-Scan-Deadline-Ms": "500"})
+    assert response.status_code == 200
+    assert response.json()['omitted_analyzers'] == ['slow']
+    assert [result['model_name'] for result in response.json()['results']] == ['rule-based']
+
+    analyzer.expected_latency['rule-based'] = 5.0
+    response = api.post("/scan/email", json={"email_text": SCAN_TEXT}, headers={"X-Scan-Deadline-Ms": "500"})
+    assert response.status_code == 504
+    assert "rule-based, slow" in response.json()['detail']
+
+    assert api.post("/scan/email", json={"email_text": SCAN_TEXT},
+                    headers={"X-Scan-Deadline-Ms": "soon"}).status_code == 400
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite scan history store
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+# Add the backend directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from modules.history_store import (
+    HistoryStore, decode_cursor, encode_cursor, migrate_json_history, migrate_json_history_once,
+    remove_migrated_json_history
+)
+from modules.history_export import export_chunks
+from modules.history_writer import HistoryWriter
+from modules.ids import MonotonicIdGenerator, id_timestamp_ms
+
+
+def make_entry(user_id, timestamp, decision='safe'):
+    return {
+        'id': f"{user_id}_{timestamp}",
+        'user_id': user_id,
+        'timestamp': timestamp,
+        'email_snippet': f"Email from {timestamp}",
+        'results': [{
+            'model_source': 'built-in',
+            'model_name': 'rule-based',
+            'decision': decision,
+            'confidence': 0.9,
+            'description': 'test'
+        }]
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.db"))
+
+
+def test_entries_are_returned_newest_first_per_user(store):
+    store.add_entries([
+        make_entry('user1', '2025-07-23T09:00:00'),
+        make_entry('user1', '2025-07-23T11:00:00'),
+        make_entry('user2', '2025-07-23T12:00:00'),
+        make_entry('user1', '2025-07-23T10:00:00'),
+    ])
+
+    history = store.get_entries('user1', limit=2)
+    assert [entry['timestamp'] for entry in history] == ['2025-07-23T11:00:00', '2025-07-23T10:00:00']
+    assert history[0]['results'][0]['model_name'] == 'rule-based'
+    assert store.get_entries('user3') == []
+
+
+def test_database_uses_wal_and_user_time_index(store):
+    conn = store._connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM scan_history WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT 10",
+        ('user1',)
+    ).fetchall()
+    assert any('idx_scan_history_user_time_id' in row[3] for row in plan)
+    assert not any('TEMP B-TREE' in row[3] for row in plan)
+
+
+def test_keyset_pages_cover_history_exactly_once(store):
+    store.add_entries([make_entry('user1', f'2025-07-23T09:00:{i:02d}') for i in range(25)])
+
+    seen = []
+    before = None
+    while True:
+        page = store.get_page('user1', 10, before=before)
+        seen.extend(entry['id'] for entry in page)
+        if len(page) < 10:
+            break
+        before = decode_cursor(encode_cursor(page[-1]))
+
+    assert len(seen) == 25
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_page_filters(store):
+    entry = make_entry('user1', '2025-07-23T09:00:00', decision='phishing')
+    entry['results'].append({'model_name': 'aamosh-distilbert', 'decision': 'safe', 'confidence': 0.7})
+    store.add_entries([
+        entry,
+        make_entry('user1', '2025-07-24T09:00:00', decision='safe'),
+        make_entry('user1', '2025-07-25T09:00:00', decision='phishing'),
+    ])
+
+    def ids(**filters):
+        return [e['timestamp'][:10] for e in store.get_page('user1', 10, **filters)]
+
+    assert ids(decision='phishing') == ['2025-07-25', '2025-07-23']
+    assert ids(decision='safe') == ['2025-07-24', '2025-07-23']
+    assert ids(model_name='aamosh-distilbert') == ['2025-07-23']
+    assert ids(model_name='rule-based', decision='safe') == ['2025-07-24']
+    assert ids(model_name='aamosh-distilbert', decision='phishing') == []
+    assert ids(since='2025-07-24T00:00:00', until='2025-07-25T00:00:00') == ['2025-07-24']
+
+    # Replacing an entry replaces its filter rows too
+    store.add_entry(make_entry('user1', '2025-07-25T09:00:00', decision='spam'))
+    assert ids(decision='phishing') == ['2025-07-23']
+    assert ids(decision='spam') == ['2025-07-25']
+
+
+def test_migrate_json_history(store, tmp_path):
+    history_dir = tmp_path / "scan_history"
+    history_dir.mkdir()
+    for entry in (make_entry('user1', '2025-07-23T09:03:56'), make_entry('user2', '2025-07-23T09:04:31')):
+        (history_dir / f"{entry['id']}.json").write_text(json.dumps(entry, indent=2))
+    (history_dir / "broken.json").write_text("{not json")
+
+    assert migrate_json_history_once(store, str(history_dir)) == 2
+    assert len(store.get_entries('user1')) == 1
+    assert len(store.get_entries('user2')) == 1
+
+    # The import leaves the files alone
+    assert len(os.listdir(history_dir)) == 3
+
+    # The one-shot migration does not run again, the plain migrator is idempotent
+    assert migrate_json_history_once(store, str(history_dir)) == 0
+    assert migrate_json_history(store, str(history_dir)) == 2
+    assert len(store.get_entries('user1')) == 1
+
+    # Removal on request deletes files whose entries are stored, and only those
+    orphan = make_entry('user3', '2025-07-23T09:05:00')
+    (history_dir / f"{orphan['id']}.json").write_text(json.dumps(orphan))
+    assert remove_migrated_json_history(store, str(history_dir)) == 2
+    assert sorted(os.listdir(history_dir)) == ["broken.json", f"{orphan['id']}.json"]
+
+
+def test_writer_commits_in_batches_and_drains_on_stop(store):
+    writer = HistoryWriter(store, batch_size=4, flush_interval=0.01)
+    for i in range(10):
+        writer.submit(make_entry('user1', f'2025-07-23T09:00:{i:02d}'))
+
+    writer.stop(timeout=5)
+    assert writer.queue_depth() == 0
+    assert len(store.get_entries('user1', limit=100)) == 10
+
+
+def test_writer_exposes_uncommitted_entries(store):
+    class BlockedStore:
+        def add_entries(self, entries):
+            raise OSError("disk unavailable")
+
+    writer = HistoryWriter(BlockedStore(), flush_interval=0.01)
+    writer.submit(make_entry('user1', '2025-07-23T09:00:00'))
+    writer.submit(make_entry('user2', '2025-07-23T09:00:01'))
+
+    assert [entry['user_id'] for entry in writer.pending_for('user1')] == ['user1']
+    assert writer.flush(timeout=0.1) is False
+    assert writer.queue_depth() == 2
+
+    # stop() gives up on a store that keeps failing instead of retrying forever
+    thread = writer._thread
+    start = time.monotonic()
+    writer.stop(timeout=5)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 2
+
+
+class CommittingStore:
+    """Store read during which the writer commits its queue"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def _commit(self):
+        self.queue.clear()
+        return []
+
+    def get_page(self, user_id, limit, **filters):
+        return self._commit()
+
+    def iter_entries(self, user_id, after=None, until=None):
+        yield from self._commit()
+
+
+class QueueWriter:
+    def __init__(self, queue):
+        self.queue = queue
+
+    def pending_for(self, user_id):
+        return [entry for entry in self.queue if entry['user_id'] == user_id]
+
+
+def test_entries_committed_while_reading_are_not_lost(monkeypatch):
+    import scan
+    entry = make_entry('user1', '2025-07-23T09:00:00')
+    queue = [entry]
+    monkeypatch.setattr(scan, "HISTORY_WRITE_BEHIND", True)
+    monkeypatch.setattr(scan, "get_history_store", lambda: CommittingStore(queue))
+    monkeypatch.setattr(scan, "get_history_writer", lambda: QueueWriter(queue))
+
+    assert scan.get_scan_history_page('user1')['history'] == [entry]
+
+    queue.append(entry)
+    assert list(scan.iter_scan_history('user1')) == [entry]
+
+    # Committed before the store read: in both, yielded once
+    class CommittedStore:
+        def iter_entries(self, user_id, after=None, until=None):
+            yield entry
+    queue.append(entry)
+    monkeypatch.setattr(scan, "get_history_store", CommittedStore)
+    assert list(scan.iter_scan_history('user1')) == [entry]
+
+
+def test_history_ids_are_unique_and_ordered():
+    generator = MonotonicIdGenerator()
+    ids = [generator.new_id() for _ in range(10000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(history_id) == 26 for history_id in ids)
+    assert abs(id_timestamp_ms(ids[-1]) - id_timestamp_ms(ids[0])) < 60_000
+
+
+def test_identical_content_is_stored_once(store):
+    entries = [make_entry('user1', f'2025-07-23T09:00:0{i}') for i in range(5)]
+    for entry in entries:
+        entry['email_snippet'] = "Same email body " * 20
+    store.add_entries(entries)
+
+    conn = store._connection()
+    assert conn.execute("SELECT COUNT(*) FROM history_blobs").fetchone()[0] == 2
+    # The repeated snippet is long enough to be compressed
+    codecs = {row[0] for row in conn.execute("SELECT codec FROM history_blobs")}
+    assert 1 in codecs
+
+    history = store.get_entries('user1')
+    assert len(history) == 5
+    assert history[0]['email_snippet'] == "Same email body " * 20
+    assert history[0]['results'] == entries[0]['results']
+
+
+def test_compaction_applies_retention_and_keeps_rollups(store):
+    store.add_entries([
+        make_entry('user1', '2025-07-01T09:00:00', 'phishing'),
+        make_entry('user1', '2025-07-20T09:00:00'),
+        make_entry('user1', '2025-07-21T09:00:00'),
+        make_entry('user1', '2025-07-22T09:00:00'),
+        make_entry('user2', '2025-07-01T09:00:00'),
+    ])
+    store.set_retention('user1', ttl_days=10, max_entries=2)
+
+    deleted = store.compact(now=datetime(2025, 7, 23), batch_size=1)
+    assert deleted == 2
+    assert [entry['timestamp'] for entry in store.get_entries('user1')] == [
+        '2025-07-22T09:00:00', '2025-07-21T09:00:00'
+    ]
+    # Blobs of deleted entries are gone, shared ones are kept
+    conn = store._connection()
+    referenced = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT snippet_digest FROM scan_history UNION SELECT results_digest FROM scan_history)"
+    ).fetchone()[0]
+    assert conn.execute("SELECT COUNT(*) FROM history_blobs").fetchone()[0] == referenced
+    # No default retention, so other users are untouched
+    assert len(store.get_entries('user2')) == 1
+
+    # Rollups still include the deleted entries
+    days = store.get_daily_rollups('user1')
+    assert [day['day'] for day in days] == ['2025-07-01', '2025-07-20', '2025-07-21', '2025-07-22']
+    assert days[0]['decisions'] == {'phishing': 1}
+    assert days[0]['models']['rule-based']['mean_confidence'] == pytest.approx(0.9)
+
+
+def test_replacing_an_entry_does_not_double_count_rollups(store):
+    entry = make_entry('user1', '2025-07-23T09:00:00')
+    store.add_entry(entry)
+    entry['results'][0]['decision'] = 'phishing'
+    store.add_entry(entry)
+
+    days = store.get_daily_rollups('user1')
+    assert days[0]['scans'] == 1
+    assert days[0]['decisions'] == {'phishing': 1}
+
+
+def test_stats_are_maintained_incrementally(store):
+    store.add_entries([
+        make_entry('user1', '2025-07-21T09:00:00', 'phishing'),
+        make_entry('user1', '2025-07-23T09:00:00'),
+        make_entry('user1', '2025-07-23T10:00:00'),
+    ])
+    pending = make_entry('user1', '2025-07-23T11:00:00')
+    pending['results'][0]['confidence'] = 0.15
+
+    stats = store.get_stats('user1', days=3, today='2025-07-23', pending=[pending])
+    assert stats['total_scans'] == 4
+    assert stats['decisions'] == {'phishing': 1, 'safe': 3}
+    assert stats['analyzers']['rule-based']['results'] == 4
+    assert stats['analyzers']['rule-based']['mean_confidence'] == pytest.approx(0.7125)
+    assert [bucket['count'] for bucket in stats['confidence_histogram']] == [0, 1, 0, 0, 0, 0, 0, 0, 0, 3]
+    assert [(day['day'], day['scans']) for day in stats['daily']] == [
+        ('2025-07-21', 1), ('2025-07-22', 0), ('2025-07-23', 3)
+    ]
+
+    # Counters survive compaction and ignore pending entries that were committed meanwhile
+    store.add_entry(pending)
+    store.set_retention('user1', max_entries=1)
+    store.compact()
+    stats = store.get_stats('user1', days=3, today='2025-07-23', pending=[pending])
+    assert stats['total_scans'] == 4
+    assert stats['decisions'] == {'phishing': 1, 'safe': 3}
+
+
+def test_export_streams_history_in_chunks(store):
+    store.add_entries([make_entry('user1', f'2025-07-23T09:00:{second:02d}') for second in range(5)])
+    store.add_entry(make_entry('user2', '2025-07-23T09:00:00'))
+
+    chunks = list(export_chunks(store.iter_entries('user1', batch_size=2), 'jsonl', chunk_entries=2))
+    assert len(chunks) == 3
+    lines = "".join(chunks).splitlines()
+    assert [json.loads(line)['timestamp'][-2:] for line in lines] == ['00', '01', '02', '03', '04']
+
+    text = "".join(export_chunks(store.iter_entries('user1', until='2025-07-23T09:00:02'), 'csv'))
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert [row['id'] for row in rows] == ['user1_2025-07-23T09:00:00', 'user1_2025-07-23T09:00:01']
+    assert rows[0]['model_name'] == 'rule-based'
+
+    with pytest.raises(ValueError):
+        export_chunks([], 'xml')
+
+
+def test_history_version_changes_with_stored_history(store):
+    assert store.get_version('user1') == 0
+    store.add_entries([make_entry('user1', '2025-07-22T09:00:00'), make_entry('user1', '2025-07-23T09:00:00')])
+    version = store.get_version('user1')
+    assert version > 0
+    assert store.get_version('user2') == 0
+
+    # Compacting nothing leaves the version alone; deleting entries bumps it
+    store.compact()
+    assert store.get_version('user1') == version
+    store.set_retention('user1', max_entries=1)
+    store.compact()
+    assert store.get_version('user1') > version
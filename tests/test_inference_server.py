@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the standalone inference server and its pooled client
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Add the ai directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai'))
+
+import analyzer_registry
+from inference_server import InferenceServer, InferenceClient, encode, decode
+
+PHISHING_EMAIL = "URGENT: verify your password now at http://secure-paypal.tk/login or your account is suspended."
+SAFE_EMAIL = "Hi team, the weekly meeting moves to 3pm on Thursday. Thanks, Anna"
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    import email_guard
+    monkeypatch.setattr(analyzer_registry, "EMAIL_GUARD_ANALYZERS", "rule-based")
+    return email_guard.EmailAnalyzer()
+
+
+@pytest.fixture
+def server(analyzer, tmp_path):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    instance = InferenceServer(analyzer, str(tmp_path / "inference.sock"), max_batch=8, batch_wait_ms=50)
+    asyncio.run_coroutine_threadsafe(instance.start(), loop).result(10)
+    yield instance
+    asyncio.run_coroutine_threadsafe(instance.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+
+def test_concurrent_scans_are_batched(server, analyzer):
+    client = InferenceClient(server.socket_path, pool_size=8)
+    texts = [PHISHING_EMAIL, SAFE_EMAIL] * 8
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(client.analyze, texts))
+    client.close()
+
+    for text, (results, timings) in zip(texts, responses):
+        assert results == analyzer.analyze_email(text)
+        assert "rule-based" in {name for name, _ in timings}
+    assert server.scans == len(texts)
+    assert server.batches < len(texts)
+
+
+def test_concurrent_api_scans_share_batches(server, api, monkeypatch):
+    import scan
+    monkeypatch.setattr(scan, "INFERENCE_SOCKET", server.socket_path)
+    monkeypatch.setattr(scan, "_inference_client", InferenceClient(server.socket_path, pool_size=8))
+    api.post("/auth/token", json={"token": "t1"})
+
+    texts = [PHISHING_EMAIL, SAFE_EMAIL] * 8
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda text: api.post("/scan/email", json={"email_text": text}), texts))
+    scan._inference_client.close()
+
+    assert all(response.status_code == 200 for response in responses)
+    assert server.scans == len(texts)
+    assert server.batches < len(texts)
+
+
+def test_deadline_and_omitted_are_propagated(server):
+    client = InferenceClient(server.socket_path)
+    omitted = []
+    results, _ = client.analyze(PHISHING_EMAIL, deadline=time.monotonic() - 1, omitted=omitted)
+    assert results == []
+    assert omitted == ["rule-based"]
+
+
+def test_json_requests_get_json_responses(server):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(10)
+        conn.connect(server.socket_path)
+        conn.sendall(encode({'id': 1, 'op': 'scan', 'text': SAFE_EMAIL}, use_msgpack=False))
+        conn.sendall(encode({'id': 2, 'op': 'nope'}, use_msgpack=False))
+        received = b""
+        responses = {}
+        while len(responses) < 2:
+            received += conn.recv(65536)
+            while len(received) >= 4 and len(received) >= 4 + int.from_bytes(received[:4], "big"):
+                length = int.from_bytes(received[:4], "big")
+                message, was_msgpack = decode(received[4:4 + length])
+                assert not was_msgpack
+                responses[message['id']] = message
+                received = received[4 + length:]
+
+    assert responses[1]['results'][0]['model_name'] == "rule-based"
+    assert "unknown op" in responses[2]['error']
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for cached JWT verification
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# Add the backend directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+pytest.importorskip("jose")
+
+from modules import authenticate
+
+
+@pytest.fixture(autouse=True)
+def jwt_cache(monkeypatch):
+    """Use a fresh, small claims cache for every test"""
+    cache = authenticate.VerifiedTokenCache(max_size=2)
+    monkeypatch.setattr(authenticate, "_jwt_cache", cache)
+    return cache
+
+
+def test_verified_claims_are_cached(jwt_cache):
+    token = authenticate.create_jwt_token({'sub': 'user1', 'role': 'user'})
+
+    assert authenticate.verify_jwt_token(token) == {'sub': 'user1', 'role': 'user'}
+    assert authenticate.verify_jwt_token(token) == {'sub': 'user1', 'role': 'user'}
+    assert jwt_cache.stats()['hits'] == 1
+    assert jwt_cache.stats()['misses'] == 1
+
+
+def test_tampered_token_is_not_served_from_cache(jwt_cache):
+    token = authenticate.create_jwt_token({'sub': 'user1', 'role': 'user'})
+    authenticate.verify_jwt_token(token)
+
+    assert authenticate.verify_jwt_token(token[:-2] + "xx") is None
+    assert jwt_cache.stats()['size'] == 1
+
+
+def test_cache_entries_expire_and_are_bounded(jwt_cache):
+    jwt_cache.put("expired", {'sub': 'user1', 'role': 'user'}, time.time() - 1)
+    assert jwt_cache.get("expired") is None
+
+    for digest in ("a", "b", "c"):
+        jwt_cache.put(digest, {'sub': digest, 'role': 'user'}, time.time() + 60)
+    assert jwt_cache.get("a") is None
+    assert jwt_cache.get("c") == {'sub': 'c', 'role': 'user'}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the HTTP load generator
+"""
+
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the benchmarks directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from load_test import parse_weights, run_load
+
+
+def test_parse_weights():
+    assert parse_weights("auth=1,scan=8", ('auth', 'scan', 'history')) == [('auth', 1.0), ('scan', 8.0)]
+    assert parse_weights("500:5,4000", separator=":") == [('500', 5.0), ('4000', 1.0)]
+    with pytest.raises(ValueError):
+        parse_weights("upload=1", ('auth', 'scan', 'history'))
+    with pytest.raises(ValueError):
+        parse_weights("scan=0")
+
+
+def test_run_load_reports_latency_and_errors():
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.url.path, request.headers.get('if-none-match')))
+        if request.url.path == "/scan/email":
+            # Every other scan fails
+            return httpx.Response(200 if len(seen) % 2 else 503, json={'results': []})
+        if request.url.path == "/history":
+            return httpx.Response(200, json={'items': []}, headers={'ETag': '"h-1"'})
+        return httpx.Response(200, json={'message': 'ok'})
+
+    transport = httpx.MockTransport(handler)
+    run = asyncio.run(run_load(
+        lambda: httpx.AsyncClient(transport=transport, base_url="http://testserver"),
+        ['token'], concurrency=3, requests=60, mix="scan=1,history=1", warmup=0
+    ))
+
+    results = run['results']
+    assert results['load.total']['calls'] == 60
+    assert results['load.scan']['calls'] + results['load.history']['calls'] == 60
+    assert 'load.auth' not in results
+    assert results['load.history']['errors'] == 0
+    assert results['load.scan']['errors_by_status'] == {'503': results['load.scan']['errors']}
+    assert 0 < results['load.total']['error_rate'] < 1
+    # Users log in before measuring and revalidate history with the ETag they saw
+    assert [path for _, path, _ in seen[:3]] == ["/auth/token"] * 3
+    assert any(etag == '"h-1"' for _, path, etag in seen if path == "/history")
+
+
+def test_inprocess_target_is_isolated(tmp_path, monkeypatch):
+    from load_test import inprocess_target
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    from modules import authenticate, history_compactor, history_store, history_writer
+
+    real = tmp_path / "real"
+    for name in ("HISTORY_DIR", "HISTORY_DB_PATH", "PROFILE_OUTPUT_DIR", "SCAN_CAPTURE_PATH"):
+        monkeypatch.setenv(name, str(real / name))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(authenticate, "TOKENS_FILE", authenticate.TOKENS_FILE)
+    monkeypatch.setattr(history_store, "_store", history_store.HistoryStore(str(tmp_path / "history.db")))
+    monkeypatch.setattr(history_writer, "_writer", None)
+    monkeypatch.setattr(history_compactor, "_compactor", None)
+
+    async def run():
+        async with inprocess_target(1) as (client_factory, tokens):
+            workdir = os.path.dirname(os.environ["HISTORY_DIR"])
+            assert os.environ["SCAN_CAPTURE_PATH"] == ""
+            assert all(not os.environ[name].startswith(str(real))
+                       for name in ("HISTORY_DIR", "HISTORY_DB_PATH", "PROFILE_OUTPUT_DIR"))
+            async with client_factory() as client:
+                assert (await client.get("/health")).status_code == 200
+        return workdir
+
+    workdir = asyncio.run(run())
+    assert os.path.isabs(workdir) and not os.path.exists(workdir)
+    assert not real.exists()
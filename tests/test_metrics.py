@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus /metrics endpoint
+"""
+
+import re
+
+SCAN_TEXT = "verify your password now at http://x.tk"
+
+
+def test_metrics_after_scan(api):
+    assert api.post("/auth/token", json={"token": "t1"}).status_code == 200
+    assert api.post("/scan/email", json={"email_text": SCAN_TEXT}).status_code == 200
+
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for series in ("email_guard_auth_seconds_count",
+                   "email_guard_scan_request_seconds_count",
+                   "email_guard_scan_seconds_count",
+                   'email_guard_analyzer_seconds_count{analyzer="rule-based"}',
+                   'email_guard_cache_requests_total{cache="jwt",result="miss"}'):
+        assert series in body
+    assert re.search(r'email_guard_scan_decisions_total\{decision="\w+",model_name="rule-based"\} \d', body)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-forked server (backend/prefork.py)
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-forking needs os.fork")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        assert process.poll() is None, "".join(process.output)
+        try:
+            if client.get("/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise AssertionError("server did not start")
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "db").mkdir()
+    (tmp_path / "db" / "users.csv").write_text("token,sub,role,expires_at\nt1,u1,user,2099-01-01\n")
+    port = free_port()
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([BACKEND_DIR, os.path.join(ROOT_DIR, 'ai')]),
+               HISTORY_DIR=str(tmp_path / "history"),
+               PROMETHEUS_MULTIPROC_DIR=str(tmp_path / "metrics"),
+               EMAIL_GUARD_ANALYZERS="rule-based")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "prefork.py"), "--workers", "2",
+         "--host", "127.0.0.1", "--port", str(port), "--max-requests", "3"],
+        cwd=tmp_path, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    # Collect the master's and workers' output without blocking on the pipe
+    process.output = []
+    threading.Thread(target=lambda: process.output.extend(process.stdout), daemon=True).start()
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30,
+                          headers={"Connection": "close"})
+    try:
+        wait_until_up(client, process)
+        yield client, process
+    finally:
+        client.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def test_workers_are_recycled_and_metrics_aggregated(server):
+    client, process = server
+    client.post("/auth/token", json={"token": "t1"})
+    for _ in range(8):
+        response = client.post("/scan/email", json={"email_text": "verify your password now at http://x.tk"})
+        assert response.status_code == 200
+        assert response.json()["results"]
+
+    # Workers check their request count periodically, so recycling is not immediate
+    deadline = time.monotonic() + 30
+    while not any("replacing it" in line for line in process.output) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert any("replacing it" in line for line in process.output)
+
+    # Scans counted in recycled and live workers are all summed
+    metrics = client.get("/metrics").text
+    counts = [line for line in metrics.splitlines() if line.startswith("email_guard_scan_seconds_count")]
+    assert counts == ["email_guard_scan_seconds_count 8.0"]
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=60) == 0
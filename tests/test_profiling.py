@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for Server-Timing headers and sampled request profiling
+"""
+
+import os
+import pstats
+import re
+import sys
+
+import pytest
+
+# Add the backend directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from modules import profiling
+from modules.profiling import SamplingProfiler
+from modules.timing import ServerTiming
+
+SCAN_TEXT = "verify your password now at http://x.tk"
+
+
+def profile_some_work(profiler, calls):
+    for _ in range(calls):
+        with profiler.maybe_profile("scan_email"):
+            sum(range(100))
+
+
+def test_server_timing_header_format():
+    timing = ServerTiming()
+    timing.add("auth", 0.0012)
+    timing.add("rule-based", 0.25)
+    timing.add("model name/v2", 0.5)
+    with timing.stage("history"):
+        pass
+
+    parts = timing.header_value().split(", ")
+    assert parts[:3] == ["auth;dur=1.20", "rule-based;dur=250.00", "model_name_v2;dur=500.00"]
+    assert re.fullmatch(r"history;dur=\d+\.\d\d", parts[3])
+    assert ServerTiming().header_value() == ""
+
+
+def test_profiler_sample_rate_and_cap(tmp_path, monkeypatch):
+    profiler = SamplingProfiler(str(tmp_path))
+    profiler.configure(0.0, max_profiles=10)
+    profile_some_work(profiler, 20)
+    assert profiler.profiles_written == 0
+    assert not os.listdir(tmp_path)
+
+    # With random() at 0.3 a rate of 0.25 never samples and 0.5 always does
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.3)
+    profiler.configure(0.25, max_profiles=10)
+    profile_some_work(profiler, 5)
+    assert profiler.profiles_written == 0
+
+    profiler.configure(0.5, max_profiles=3)
+    profile_some_work(profiler, 5)
+    assert profiler.profiles_written == 3
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 3
+    assert all(name.startswith("scan_email_") and name.endswith(".prof") for name in files)
+    pstats.Stats(str(tmp_path / files[0]))
+
+    with pytest.raises(ValueError):
+        profiler.configure(1.5)
+
+
+def test_admin_profiling_endpoints(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", SamplingProfiler(str(tmp_path / "profiles")))
+
+    assert api.get("/admin/profiling").status_code == 401
+    api.post("/auth/token", json={"token": "t1"})
+    assert api.get("/admin/profiling").status_code == 403
+    assert api.put("/admin/profiling", json={"sample_rate": 1.0}).status_code == 403
+
+    api.post("/auth/token", json={"token": "a1"})
+    assert api.get("/admin/profiling").json()['sample_rate'] == 0.0
+    assert api.put("/admin/profiling", json={"sample_rate": 2.0}).status_code == 400
+    status = api.put("/admin/profiling", json={"sample_rate": 1.0, "max_profiles": 1}).json()
+    assert (status['sample_rate'], status['max_profiles'], status['profiles_written']) == (1.0, 1, 0)
+
+    response = api.post("/scan/email", json={"email_text": SCAN_TEXT})
+    assert response.status_code == 200
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages == ["auth", "verify", "rule-based", "scan", "history"]
+    assert api.get("/admin/profiling").json()['profiles_written'] == 1
+    assert len(os.listdir(tmp_path / "profiles")) == 1
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for scan traffic capture and replay
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# Add the backend and benchmarks directories to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from modules.capture import ScanCapture
+from replay import compare_runs, load_capture, replay, schedule_offsets
+
+
+def test_capture_is_opt_in_and_bounded(tmp_path):
+    ScanCapture(path="").record(1.0, "not written")
+
+    path = str(tmp_path / "capture.jsonl")
+    capture = ScanCapture(path=path)
+    capture.max_bytes = 200
+    capture.record(20.0, "second email", deadline_ms=500)
+    capture.record(10.0, "first email")
+    capture.record(30.0, "x" * 500)
+    capture.close()
+
+    assert capture.records_written == 2
+    records = load_capture(path)
+    assert [record['email_text'] for record in records] == ["first email", "second email"]
+    assert records[1]['deadline_ms'] == 500
+    assert all('user' not in key for record in records for key in record)
+
+
+def test_replay_schedule_and_comparison():
+    records = [{'arrival': 100.0 + offset, 'email_text': f"email {offset}"} for offset in (0.0, 0.2, 0.4)]
+    assert schedule_offsets(records, 1.0) == pytest.approx([0.0, 0.2, 0.4])
+    assert schedule_offsets(records, 2.0) == pytest.approx([0.0, 0.1, 0.2])
+    assert schedule_offsets(records, 0) == [0.0, 0.0, 0.0]
+
+    def build(decision_for_last):
+        async def scan(text, deadline_ms):
+            decision = decision_for_last if text == "email 0.4" else "safe"
+            return [{'model_name': 'model-a', 'decision': decision, 'confidence': 0.9}], [], None
+        outcomes = asyncio.run(replay(records, scan, speed=0, concurrency=2))
+        return {'meta': {'capture_records': len(records)}, 'outcomes': outcomes}
+
+    before, after = build("safe"), build("phishing")
+    assert [outcome['index'] for outcome in before['outcomes']] == [0, 1, 2]
+    comparison = compare_runs(before, after)
+    assert comparison['models']['model-a']['changed'] == 1
+    assert comparison['models']['model-a']['agreement'] == pytest.approx(2 / 3)
+    assert comparison['after']['scans'] == 3
+    json.dumps(comparison)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the model residency manager
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Add the ai directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai'))
+
+from residency import ModelResidencyManager
+
+
+class FakeModel:
+    def __init__(self, name, size):
+        self.model_name = name
+        self.size = size
+        self.loaded = True
+        self.loads = 0
+
+    def load_model(self):
+        time.sleep(0.05)
+        self.loads += 1
+        self.loaded = True
+
+    def unload(self):
+        self.loaded = False
+
+    def is_loaded(self):
+        return self.loaded
+
+    def resident_bytes(self):
+        return self.size if self.loaded else 0
+
+    def estimated_bytes(self):
+        return self.size
+
+    def dtype_name(self):
+        return "float32"
+
+
+def test_budget_evicts_least_recently_used():
+    changes = []
+    manager = ModelResidencyManager(budget_bytes=250, idle_evict_s=0,
+                                    on_change=lambda name, event, size: changes.append((name, event)))
+    a, b, c = FakeModel("a", 100), FakeModel("b", 100), FakeModel("c", 100)
+    manager.register(a)
+    manager.register(b)
+    with manager.acquire(a):
+        pass
+    # Registering c goes over budget: b was used least recently
+    manager.register(c)
+    assert (a.loaded, b.loaded, c.loaded) == (True, False, True)
+    assert changes == [("b", "evict")]
+
+    # Using b again reloads it, evicting a (c was registered after a was last used)
+    with manager.acquire(b):
+        assert b.loaded
+    assert b.loads == 1
+    assert not a.loaded and c.loaded
+    assert ("b", "load") in changes
+
+    report = manager.report()
+    assert report["b"]["resident_bytes"] == 100 and report["a"]["resident_bytes"] == 0
+    assert report["b"]["loads"] == 2 and report["b"]["evictions"] == 1
+
+
+def test_models_in_use_are_not_evicted_and_reload_is_single_flight():
+    manager = ModelResidencyManager(budget_bytes=0, idle_evict_s=10)
+    model = FakeModel("m", 100)
+    manager.register(model)
+
+    with manager.acquire(model):
+        assert manager.evict("m") is False
+        assert manager.evict_idle(now=time.monotonic() + 60) == []
+    assert manager.evict_idle(now=time.monotonic() + 60) == ["m"]
+
+    def use():
+        with manager.acquire(model):
+            assert model.loaded
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.loaded and model.loads == 1
+
+
+def test_reload_time_is_not_analyzer_latency(monkeypatch):
+    import analyzer_registry
+    import email_guard
+    monkeypatch.setattr(analyzer_registry, "EMAIL_GUARD_ANALYZERS", "rule-based")
+
+    class SlowLoadingModel(FakeModel):
+        model_source = "Custom"
+
+        def load_model(self):
+            time.sleep(0.3)
+            self.loaded = True
+
+        def analyze(self, email_text):
+            return {'model_source': self.model_source, 'model_name': self.model_name,
+                    'decision': 'safe', 'confidence': 1.0, 'description': ''}
+
+    analyzer = email_guard.EmailAnalyzer()
+    model = SlowLoadingModel("evictable", 100)
+    analyzer.add_analyzer(model)
+    analyzer.residency.register(model)
+    model.unload()
+
+    assert len(analyzer.analyze_email("Hello there")) == 2
+    assert model.loaded
+    assert analyzer.expected_latency["evictable"] < 0.1
+    analyzer.residency.stop()
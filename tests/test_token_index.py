@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-memory token index used by authenticate_token
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the backend directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+pytest.importorskip("jose")
+
+from modules import authenticate
+
+
+@pytest.fixture
+def tokens_file(tmp_path, monkeypatch):
+    """Point the authenticate module at a temporary tokens file"""
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "token,sub,role,expires_at\n"
+        "good_token,user1,user,2999-12-31\n"
+        "expired_token,user2,admin,2000-01-01\n"
+        " padded_token ,user3,user,not-a-date\n"
+    )
+    monkeypatch.setattr(authenticate, "TOKENS_FILE", str(path))
+    monkeypatch.setattr(authenticate, "_token_index", authenticate.TokenIndex())
+    return path
+
+
+def test_authenticate_token(tokens_file):
+    assert authenticate.authenticate_token("good_token") == {'sub': 'user1', 'role': 'user'}
+    assert authenticate.authenticate_token(" good_token\n") == {'sub': 'user1', 'role': 'user'}
+    assert authenticate.authenticate_token("expired_token") is None
+    assert authenticate.authenticate_token("unknown_token") is None
+    # Unparseable expiry dates are treated as valid
+    assert authenticate.authenticate_token("padded_token") == {'sub': 'user3', 'role': 'user'}
+
+
+def test_index_does_not_keep_plaintext_tokens(tokens_file):
+    index = authenticate.get_token_index()
+    index.refresh()
+    assert len(index) == 3
+    assert "good_token" not in index._entries
+    assert authenticate.hash_token("good_token") in index._entries
+
+
+def test_index_reloads_on_file_change(tokens_file):
+    assert authenticate.authenticate_token("new_token") is None
+
+    with open(tokens_file, "a") as f:
+        f.write("new_token,user4,user,2999-12-31\n")
+    # Make sure the change is visible even on coarse mtime filesystems
+    stat = os.stat(tokens_file)
+    os.utime(tokens_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert authenticate.authenticate_token("new_token") == {'sub': 'user4', 'role': 'user'}
+
+
+def test_add_token_updates_index(tokens_file):
+    authenticate.get_token_index().refresh()
+    authenticate.add_token_to_csv("added_token", "user5", "admin", "2999-12-31")
+
+    assert authenticate.authenticate_token("added_token") == {'sub': 'user5', 'role': 'admin'}
+    assert "added_token" in tokens_file.read_text()
+
+
+def test_mark_stale_forces_reload(tokens_file):
+    index = authenticate.get_token_index()
+    index.refresh()
+
+    tokens_file.write_text("token,sub,role,expires_at\nother_token,user6,user,2999-12-31\n")
+    # Simulate a change the mtime/size check cannot see
+    index._file_signature = index._current_signature()
+
+    assert authenticate.authenticate_token("other_token") is None
+    index.mark_stale()
+    assert authenticate.authenticate_token("other_token") == {'sub': 'user6', 'role': 'user'}